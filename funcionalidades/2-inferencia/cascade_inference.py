@@ -0,0 +1,48 @@
+import argparse
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description=('Runs a cheap model on every image and the expensive ones '
+                                 'only where it is unsure. The final predictions go to <out_dir>/cascade.'))
+parser.add_argument('img_file_or_dir', help=('Image, directory of images or manifest (.txt file with one '
+                    'image path per line) to segment.'))
+parser.add_argument('out_dir', help='Directory to save the results.')
+parser.add_argument('--models', nargs='+', default=None, help=('Models of the cascade, from the cheapest to the '
+                    'most expensive. Defaults to yolact maskrcnn.'))
+parser.add_argument('--min-max-confidence', type=float, default=0.7, help=('Escalate if the most confident '
+                    'prediction is below this.'))
+parser.add_argument('--near-threshold-margin', type=float, default=0.1, help=('Predictions up to this much above '
+                    'the score threshold of the model are uncertain.'))
+parser.add_argument('--max-uncertain', type=int, default=2, help='Escalate if there are more uncertain predictions than this.')
+parser.add_argument('--max-objects', type=int, default=20, help='Escalate if there are more predictions than this.')
+parser.add_argument('--keep-empty', action='store_true', help='Do not escalate images with no predictions.')
+parser.add_argument('--batch-size', type=int, default=1, help='Number of images per forward pass. Defaults to 1.')
+parser.add_argument('--ext', action='append', default=None, metavar='EXT', help=('Image extension to look '
+                    'for in the directory. Can be repeated. Defaults to .jpg.'))
+parser.add_argument('--recursive', action='store_true', help='Also look for images in subdirectories.')
+parser.add_argument('-y', '--overwrite', action='store_true')
+args = parser.parse_args()
+
+img_file_or_dir = Path(args.img_file_or_dir)
+if not img_file_or_dir.exists():
+	raise FileNotFoundError(str(img_file_or_dir))
+
+out_dir = Path(args.out_dir)
+if out_dir.exists() and not args.overwrite:
+	op = input((f'out_dir "{str(out_dir)}" exists. Do you want '
+	             'to overwrite it? [y/n] ')).lower()
+	if op != 'y':
+		print('Operation cancelled.')
+		exit()
+
+
+# Import depois pro --help ser rápido
+from segm_lib.inference import EscalationRules, run_cascade
+
+rules = EscalationRules(
+	min_max_confidence=args.min_max_confidence,
+	near_threshold_margin=args.near_threshold_margin,
+	max_uncertain=args.max_uncertain,
+	max_objects=args.max_objects,
+	escalate_empty=not args.keep_empty,
+)
+run_cascade(img_file_or_dir, out_dir, args.models, rules, args.batch_size, args.ext, args.recursive)
\ No newline at end of file
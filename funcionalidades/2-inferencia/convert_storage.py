@@ -0,0 +1,37 @@
+import argparse
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description=('Converts predictions or annotations between the directory layout '
+                                 '(one .json per image) and the packed one (a single .pack file, with an index).'))
+parser.add_argument('direction', choices=['pack', 'unpack'])
+parser.add_argument('src', help=('pack: directory with one .json per image, or a predictions directory with '
+                    'one such directory per model. unpack: a .pack file, or a directory with one .pack per model.'))
+parser.add_argument('dst', help=('pack: the .pack file, or the directory for the <model>.pack files. '
+                    'unpack: the directory for the .json files, or for one directory per model.'))
+args = parser.parse_args()
+
+src, dst = Path(args.src), Path(args.dst)
+if not src.exists():
+	raise FileNotFoundError(str(src))
+
+
+# Import depois pro --help ser rápido
+from segm_lib.core.packed_store import pack_dir, unpack
+
+if args.direction == 'pack':
+	model_dirs = [d for d in src.iterdir() if d.is_dir()]
+	if any(src.glob('*.json')) or len(model_dirs) == 0:
+		n_images = pack_dir(src, dst)
+		print(f'{n_images} images packed into "{dst}"')
+	else:
+		for model_dir in model_dirs:
+			n_images = pack_dir(model_dir, dst / f'{model_dir.name}.pack')
+			print(f'{model_dir.name}: {n_images} images packed')
+else:
+	if src.is_file():
+		n_images = unpack(src, dst)
+		print(f'{n_images} images unpacked into "{dst}"')
+	else:
+		for pack_file in src.glob('*.pack'):
+			n_images = unpack(pack_file, dst / pack_file.stem)
+			print(f'{pack_file.stem}: {n_images} images unpacked')
\ No newline at end of file
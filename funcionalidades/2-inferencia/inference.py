@@ -2,8 +2,44 @@ import argparse
 from pathlib import Path
 
 parser = argparse.ArgumentParser(description='Runs instance segmentation on a set of images.')
-parser.add_argument('img_file_or_dir', help='Image or directory of images to segment.')
+parser.add_argument('img_file_or_dir', help=('Image, directory of images or manifest (.txt file with one '
+                    'image path per line) to segment.'))
 parser.add_argument('out_dir', help='Directory to save the results.')
+parser.add_argument('--models', nargs='+', default=None, help=('Models to run, e.g. "maskrcnn yolact-onnx". '
+                    'The ones ending in -onnx run on onnxruntime. Defaults to maskrcnn, yolact and solo.'))
+parser.add_argument('--batch-size', type=int, default=1, help=('Number of images per forward pass. '
+                    'Images with similar aspect ratios are grouped together. Defaults to 1.'))
+parser.add_argument('--pipelined', action='store_true', help=('Overlap image decoding, model execution '
+                    'and writing of the results.'))
+parser.add_argument('--decode-workers', type=int, default=2, help='Threads used to decode images in pipelined mode.')
+parser.add_argument('--decode-queue-depth', type=int, default=16, help='Max decoded images waiting for the model in pipelined mode.')
+parser.add_argument('--write-queue-depth', type=int, default=16, help='Max predictions waiting to be written in pipelined mode.')
+parser.add_argument('--parallel-models', action='store_true', help='Run each model in its own worker process.')
+parser.add_argument('--image-major', action='store_true', help=('Load all models at once and read each image only '
+                    'once, running it on every model before the next one. With --parallel-models, the workers '
+                    'read the decoded images from shared memory.'))
+parser.add_argument('--threads-per-model', type=int, default=None, help=('Torch intra-op threads for each worker '
+                    'in parallel mode. By default, one per CPU assigned to the worker.'))
+parser.add_argument('--cpu-affinity', action='append', default=[], metavar='MODEL=CPUS', help=('CPUs a model '
+                    'may run on in parallel mode, e.g. "maskrcnn=0-3". Can be given once per model. Models '
+                    'not listed share the remaining CPUs.'))
+parser.add_argument('--shard', default=None, metavar='i/N', help=('Only run on the i-th of N shards of the '
+                    'images. Run merge_shard_stats.py on out_dir once all shards are done.'))
+parser.add_argument('--local-workers', type=int, default=1, help='Processes used to run the shard on this machine.')
+parser.add_argument('--resume', action='store_true', help=('Skip images already segmented on out_dir with the '
+                    'same settings, and segment identical images only once.'))
+parser.add_argument('--ext', action='append', default=None, metavar='EXT', help=('Image extension to look '
+                    'for in the directory. Can be repeated. Defaults to .jpg.'))
+parser.add_argument('--recursive', action='store_true', help='Also look for images in subdirectories.')
+parser.add_argument('--server', default=None, metavar='URL', help=('Send the images to a running '
+                    'inference_server.py (e.g. http://127.0.0.1:8765) instead of loading the models here.'))
+parser.add_argument('--tile-size', type=int, default=None, help=('Segment each image in overlapping tiles '
+                    'of this size (in pixels), merging the objects found on more than one tile. For very large images.'))
+parser.add_argument('--tile-overlap', type=int, default=128, help='Pixels shared by neighbouring tiles.')
+parser.add_argument('--tile-iou', type=float, default=0.5, help=('Objects of the same class on two tiles are merged '
+                    'if their masks have a higher IoU on the region both tiles see.'))
+parser.add_argument('--tile-workers', type=int, default=1, help='Threads segmenting the tiles of an image at the same time.')
+parser.add_argument('--tile-batch-size', type=int, default=1, help='Number of tiles per forward pass.')
 args = parser.parse_args()
 
 img_file_or_dir = Path(args.img_file_or_dir)
@@ -11,7 +47,9 @@ if not img_file_or_dir.exists():
 	raise FileNotFoundError(str(img_file_or_dir))
 
 out_dir = Path(args.out_dir)
-if out_dir.exists():
+# Com shards, todas as máquinas escrevem no mesmo out_dir, e com
+# --resume a ideia é justamente reaproveitar o que já está lá
+if out_dir.exists() and args.shard is None and not args.resume:
 	op = input((f'out_dir "{str(out_dir)}" exists. Do you want '
 	             'to overwrite it? [y/n] ')).lower()
 	if op != 'y':
@@ -20,5 +58,46 @@ if out_dir.exists():
 
 
 # Import depois pro --help ser rápido
-from segm_lib.inference import run_inference
-run_inference(img_file_or_dir, out_dir)
\ No newline at end of file
+from segm_lib.inference import ParallelConfig, PipelineConfig, run_inference
+from segm_lib.inference.parallel import parse_cpu_list
+from segm_lib.inference.sharding import ShardConfig, parse_shard
+from segm_lib.inference.tiling import TileConfig
+
+pipeline = None
+if args.pipelined:
+	pipeline = PipelineConfig(
+		n_decode_workers=args.decode_workers,
+		decode_queue_depth=args.decode_queue_depth,
+		write_queue_depth=args.write_queue_depth,
+	)
+
+parallel = None
+if args.parallel_models:
+	cpu_affinity = {}
+	for model_and_cpus in args.cpu_affinity:
+		model_name, cpu_list = model_and_cpus.split('=')
+		cpu_affinity[model_name] = parse_cpu_list(cpu_list)
+
+	parallel = ParallelConfig(
+		n_threads_per_model=args.threads_per_model,
+		cpu_affinity=cpu_affinity,
+	)
+
+shard = None
+if args.shard is not None:
+	index, n_shards = parse_shard(args.shard)
+	shard = ShardConfig(index=index, n_shards=n_shards, n_local_workers=args.local_workers)
+
+tiling = None
+if args.tile_size is not None:
+	tiling = TileConfig(
+		tile_size=args.tile_size,
+		overlap=args.tile_overlap,
+		iou_threshold=args.tile_iou,
+		n_workers=args.tile_workers,
+		batch_size=args.tile_batch_size,
+	)
+
+run_inference(img_file_or_dir, out_dir, models=args.models, batch_size=args.batch_size, pipeline=pipeline, parallel=parallel, shard=shard,
+              resume=args.resume, extensions=args.ext, recursive=args.recursive, server=args.server, tiling=tiling,
+              image_major=args.image_major)
\ No newline at end of file
@@ -0,0 +1,24 @@
+import argparse
+
+parser = argparse.ArgumentParser(description=('Keeps the models loaded and segments images sent by '
+                                 'inference.py --server, batching concurrent requests.'))
+parser.add_argument('--models', nargs='+', default=None, help='Models to load. Defaults to maskrcnn, yolact and solo.')
+parser.add_argument('--host', default='127.0.0.1', help='Address to listen on. Defaults to 127.0.0.1.')
+parser.add_argument('--port', type=int, default=8765, help='Port to listen on. Defaults to 8765.')
+parser.add_argument('--max-batch-size', type=int, default=4, help=('Max requests to the same model '
+                    'run in a single forward pass. Defaults to 4.'))
+parser.add_argument('--max-wait-ms', type=float, default=10.0, help=('How long a request waits for others '
+                    'to fill its batch. Defaults to 10.'))
+args = parser.parse_args()
+
+
+# Import depois pro --help ser rápido
+from segm_lib.inference.server import ServerConfig, serve
+
+config = ServerConfig(
+	host=args.host,
+	port=args.port,
+	max_batch_size=args.max_batch_size,
+	max_wait_ms=args.max_wait_ms,
+)
+serve(args.models, config)
\ No newline at end of file
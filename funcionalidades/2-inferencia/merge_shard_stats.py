@@ -0,0 +1,15 @@
+import argparse
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description='Combines the stats of the shards of a sharded inference run.')
+parser.add_argument('out_dir', help='Directory the shards were saved to.')
+args = parser.parse_args()
+
+out_dir = Path(args.out_dir)
+if not out_dir.exists():
+	raise FileNotFoundError(str(out_dir))
+
+
+# Import depois pro --help ser rápido
+from segm_lib.inference.sharding import merge_shard_stats
+merge_shard_stats(out_dir)
\ No newline at end of file
@@ -0,0 +1,48 @@
+import argparse
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description=('Runs every image within a time budget, picking for each one the '
+                                 'first model (or smaller input scale) expected to finish in time. The '
+                                 'predictions go to <out_dir>/slo.'))
+parser.add_argument('img_file_or_dir', help=('Image, directory of images or manifest (.txt file with one '
+                    'image path per line) to segment.'))
+parser.add_argument('out_dir', help=('Directory to save the results. The latency estimates are learned from '
+                    'the stats of previous runs on it.'))
+parser.add_argument('--deadline-ms', type=float, default=1000.0, help='Time budget of each image, in ms. Defaults to 1000.')
+parser.add_argument('--variants', nargs='+', default=None, help=('Models to choose from, from the preferred one to '
+                    'the fastest. <model>@<scale> runs the model at a smaller input scale. Defaults to '
+                    'maskrcnn maskrcnn@0.5 yolact.'))
+parser.add_argument('--history', nargs='+', default=[], metavar='STATS_JSON', help=('stats.json files of '
+                    'previous runs to learn the initial latency estimates from.'))
+parser.add_argument('--smoothing', type=float, default=0.2, help=('Weight of each new measurement on the '
+                    'rolling latency estimates. Defaults to 0.2.'))
+parser.add_argument('--margin', type=float, default=1.1, help=('The estimates are multiplied by this before '
+                    'being compared with the budget. Defaults to 1.1.'))
+parser.add_argument('--no-warmup', action='store_true', help='Do not run each model once before starting the clock.')
+parser.add_argument('--ext', action='append', default=None, metavar='EXT', help=('Image extension to look '
+                    'for in the directory. Can be repeated. Defaults to .jpg.'))
+parser.add_argument('--recursive', action='store_true', help='Also look for images in subdirectories.')
+args = parser.parse_args()
+
+img_file_or_dir = Path(args.img_file_or_dir)
+if not img_file_or_dir.exists():
+	raise FileNotFoundError(str(img_file_or_dir))
+history_files = [Path(f) for f in args.history]
+for history_file in history_files:
+	if not history_file.exists():
+		raise FileNotFoundError(str(history_file))
+
+
+# Import depois pro --help ser rápido
+from segm_lib.inference import SloConfig, run_with_deadlines
+
+config = SloConfig(
+	deadline_ms=args.deadline_ms,
+	history_files=history_files,
+	smoothing=args.smoothing,
+	margin=args.margin,
+	warmup=not args.no_warmup,
+)
+if args.variants is not None:
+	config.variants = args.variants
+run_with_deadlines(img_file_or_dir, Path(args.out_dir), config, args.ext, args.recursive)
\ No newline at end of file
@@ -10,6 +10,9 @@ parser.add_argument('img_dir', help=('Directory containing the images the predic
                     'annotations refer to, to plot true positives, false positives and '
                     'false negatives'))
 parser.add_argument('out_dir', help='directory to save the results')
+parser.add_argument('--score-threshold', type=float, default=None,
+                    help=('Only evaluate predictions with a higher confidence. Useful if they were '
+                          'saved with a low score_threshold on the inference config'))
 parser.add_argument('-y', '--overwrite', action='store_true')
 args = parser.parse_args()
 
@@ -44,4 +47,4 @@ if out_dir.exists() and not args.overwrite:
 
 # Import depois pro --help ser rápido
 from segm_lib.eval import evaluate_all
-evaluate_all(pred_dir, ann_dir, possible_classes_dir, coco_ann_file, img_dir, out_dir)
\ No newline at end of file
+evaluate_all(pred_dir, ann_dir, possible_classes_dir, coco_ann_file, img_dir, out_dir, args.score_threshold)
\ No newline at end of file
@@ -0,0 +1,59 @@
+import argparse
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description=('Runs the model cascade and the most expensive model on every '
+                                 'image, and compares their AP and compute'))
+parser.add_argument('img_dir', help='Directory containing the images to segment')
+parser.add_argument('ann_dir', help='Directory containing the annotations of those images')
+parser.add_argument('possible_classes_dir', help='Directory containing a list of possible classes for each model')
+parser.add_argument('coco_ann_file', help='File containing the *original* annotations, in COCO-format')
+parser.add_argument('out_dir', help='directory to save the results')
+parser.add_argument('--models', nargs='+', default=None, help=('Models of the cascade, from the cheapest to the '
+                    'most expensive. Defaults to yolact maskrcnn.'))
+parser.add_argument('--min-max-confidence', type=float, default=0.7, help=('Escalate if the most confident '
+                    'prediction is below this.'))
+parser.add_argument('--near-threshold-margin', type=float, default=0.1, help=('Predictions up to this much above '
+                    'the score threshold of the model are uncertain.'))
+parser.add_argument('--max-uncertain', type=int, default=2, help='Escalate if there are more uncertain predictions than this.')
+parser.add_argument('--max-objects', type=int, default=20, help='Escalate if there are more predictions than this.')
+parser.add_argument('--keep-empty', action='store_true', help='Do not escalate images with no predictions.')
+parser.add_argument('--batch-size', type=int, default=1, help='Number of images per forward pass. Defaults to 1.')
+parser.add_argument('-y', '--overwrite', action='store_true')
+args = parser.parse_args()
+
+img_dir = Path(args.img_dir)
+if not img_dir.exists():
+	raise FileNotFoundError(str(img_dir))
+
+ann_dir = Path(args.ann_dir)
+if not ann_dir.exists():
+	raise FileNotFoundError(str(ann_dir))
+
+possible_classes_dir = Path(args.possible_classes_dir)
+if not possible_classes_dir.exists():
+	raise FileNotFoundError(str(possible_classes_dir))
+
+coco_ann_file = Path(args.coco_ann_file)
+if not coco_ann_file.exists():
+	raise FileNotFoundError(str(coco_ann_file))
+
+out_dir = Path(args.out_dir)
+if out_dir.exists() and not args.overwrite:
+	op = input((f'out_dir "{str(out_dir)}" exists. Do you want '
+	             'to overwrite it? [y/n] ')).lower()
+	if op != 'y':
+		print('Operation cancelled.')
+		exit()
+
+
+# Import depois pro --help ser rápido
+from segm_lib.inference import EscalationRules, evaluate_cascade
+
+rules = EscalationRules(
+	min_max_confidence=args.min_max_confidence,
+	near_threshold_margin=args.near_threshold_margin,
+	max_uncertain=args.max_uncertain,
+	max_objects=args.max_objects,
+	escalate_empty=not args.keep_empty,
+)
+evaluate_cascade(img_dir, ann_dir, possible_classes_dir, coco_ann_file, out_dir, args.models, rules, args.batch_size)
\ No newline at end of file
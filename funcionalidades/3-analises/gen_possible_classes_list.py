@@ -11,7 +11,7 @@ coco_classes = list(coco_classmap.keys())
 
 possible_classes_dir = Path(__file__).parent / 'possible_classes'
 possible_classes_dir.mkdir(exist_ok=True)
-model_names = ['maskrcnn', 'yolact', 'solo']
+model_names = ['maskrcnn', 'yolact', 'solo', 'maskrcnn-onnx', 'yolact-onnx', 'solo-onnx']
 
 for model in model_names:
     out_file = possible_classes_dir / f'{model}.json'
@@ -0,0 +1,47 @@
+import argparse
+from pathlib import Path
+
+parser = argparse.ArgumentParser(description=('Runs the models at several input resolutions and '
+                                 'reports their AP next to their throughput'))
+parser.add_argument('img_dir', help='Directory containing the images to segment')
+parser.add_argument('ann_dir', help='Directory containing the annotations of those images')
+parser.add_argument('possible_classes_dir', help='Directory containing a list of possible classes for each model')
+parser.add_argument('coco_ann_file', help='File containing the *original* annotations, in COCO-format')
+parser.add_argument('out_dir', help='directory to save the results')
+parser.add_argument('--scales', nargs='+', type=float, default=None, help=('Scales to run, relative to the default '
+                    'resolution of each model. Defaults to 1.0 0.75 0.5.'))
+parser.add_argument('--max-side', type=int, default=None, help='Max side of the model input, in pixels, on all runs.')
+parser.add_argument('--models', nargs='+', default=None, help='Models to run. Defaults to maskrcnn, yolact and solo.')
+parser.add_argument('--batch-size', type=int, default=1, help='Number of images per forward pass. Defaults to 1.')
+parser.add_argument('-y', '--overwrite', action='store_true')
+args = parser.parse_args()
+
+img_dir = Path(args.img_dir)
+if not img_dir.exists():
+	raise FileNotFoundError(str(img_dir))
+
+ann_dir = Path(args.ann_dir)
+if not ann_dir.exists():
+	raise FileNotFoundError(str(ann_dir))
+
+possible_classes_dir = Path(args.possible_classes_dir)
+if not possible_classes_dir.exists():
+	raise FileNotFoundError(str(possible_classes_dir))
+
+coco_ann_file = Path(args.coco_ann_file)
+if not coco_ann_file.exists():
+	raise FileNotFoundError(str(coco_ann_file))
+
+out_dir = Path(args.out_dir)
+if out_dir.exists() and not args.overwrite:
+	op = input((f'out_dir "{str(out_dir)}" exists. Do you want '
+	             'to overwrite it? [y/n] ')).lower()
+	if op != 'y':
+		print('Operation cancelled.')
+		exit()
+
+
+# Import depois pro --help ser rápido
+from segm_lib.inference import sweep_input_scale
+sweep_input_scale(img_dir, ann_dir, possible_classes_dir, coco_ann_file, out_dir, args.scales, args.max_side,
+                  args.models, args.batch_size)
\ No newline at end of file
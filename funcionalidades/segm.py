@@ -0,0 +1,56 @@
+"""Single entry point for all the scripts in funcionalidades.
+
+Usage:
+	python funcionalidades/segm.py <subcommand> [args...]
+	python funcionalidades/segm.py <subcommand> --help
+"""
+import runpy
+import sys
+from pathlib import Path
+
+FUNCIONALIDADES_DIR = Path(__file__).parent
+
+# subcommand: (script, description)
+SUBCOMMANDS = {
+	'coco-info': ('0-informacoes_do_coco/process_coco_files.py', 'Parse useful information from the COCO dataset.'),
+	'download': ('1-baixando_dados/download_test_set.py', 'Downloads data from the OpenImages dataset.'),
+	'split-annotations': ('1-baixando_dados/split_annotations.py', 'Splits a COCO annotation file into one file per image.'),
+	'plot-annotations': ('1-baixando_dados/plot_annotations.py', 'Plots the annotations on the images.'),
+	'infer': ('2-inferencia/inference.py', 'Runs instance segmentation on a set of images.'),
+	'serve': ('2-inferencia/inference_server.py', 'Keeps the models loaded for "infer --server".'),
+	'cascade': ('2-inferencia/cascade_inference.py', 'Runs a cheap model first and the expensive ones only where it is unsure.'),
+	'slo': ('2-inferencia/slo_inference.py', 'Runs every image within a time budget, falling back to faster models.'),
+	'convert-storage': ('2-inferencia/convert_storage.py', 'Packs predictions/annotations into a single file per model, or unpacks them.'),
+	'merge-shard-stats': ('2-inferencia/merge_shard_stats.py', 'Combines the stats of a sharded inference run.'),
+	'plot-predictions': ('2-inferencia/plot_predictions.py', 'Plots the predictions on the images.'),
+	'gen-possible-classes': ('3-analises/gen_possible_classes_list.py', 'Generates the lists of classes each model can predict.'),
+	'eval': ('3-analises/eval.py', 'Evaluates the results.'),
+	'compare-quantization': ('3-analises/compare_quantization.py', 'Compares AP and speed of the models with and without int8 quantization.'),
+	'sweep-input-scale': ('3-analises/sweep_input_scale.py', 'Reports AP and throughput of the models at several input resolutions.'),
+	'evaluate-cascade': ('3-analises/evaluate_cascade.py', 'Compares AP and compute of the cascade with always running the expensive model.'),
+}
+
+def main(argv: list[str] = None):
+	argv = sys.argv[1:] if argv is None else argv
+	if len(argv) == 0 or argv[0] in ['-h', '--help']:
+		_print_usage()
+		return
+
+	subcommand = argv[0]
+	if subcommand not in SUBCOMMANDS:
+		_print_usage()
+		sys.exit(f'\nUnknown subcommand "{subcommand}"')
+
+	# Each script parses its own arguments, so it just has to
+	# think it was called directly (run_path sets argv[0] to it)
+	script, _ = SUBCOMMANDS[subcommand]
+	sys.argv = [sys.argv[0], *argv[1:]]
+	runpy.run_path(str(FUNCIONALIDADES_DIR / script), run_name='__main__')
+
+def _print_usage():
+	print('usage: segm <subcommand> [args...]\n\nsubcommands:')
+	for subcommand, (_, description) in SUBCOMMANDS.items():
+		print(f'  {subcommand.ljust(22)}{description}')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,87 @@
+"""Measures the cold start time of each subcommand of funcionalidades/segm.py:
+	* help: "segm.py <subcommand> --help", the time before anything runs;
+	* imports: the segm_lib imports of the subcommand's script, which is
+	  what it pays before doing any actual work.
+Each one runs on a fresh interpreter, minus the interpreter's own startup.
+
+Usage:
+	python bench_import_time.py [--repeats 5] [--out import_times.json]
+"""
+import argparse
+import ast
+import json
+import runpy
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+SEGM_CLI = Path(__file__).resolve().parents[2] / 'funcionalidades' / 'segm.py'
+
+
+def load_subcommands() -> dict[str, Path]:
+	# segm.py only runs anything under __main__
+	subcommands = runpy.run_path(str(SEGM_CLI), run_name='segm')['SUBCOMMANDS']
+	return {name: SEGM_CLI.parent / script for name, (script, _) in subcommands.items()}
+
+def segm_lib_imports(script: Path) -> str:
+	tree = ast.parse(script.read_text())
+	imports = []
+	for node in ast.walk(tree):
+		if isinstance(node, ast.ImportFrom) and (node.module or '').startswith('segm_lib'):
+			imports.append(ast.unparse(node))
+		elif isinstance(node, ast.Import) and any(a.name.startswith('segm_lib') for a in node.names):
+			imports.append(ast.unparse(node))
+	return '\n'.join(imports)
+
+def has_help(script: Path) -> bool:
+	# Scripts without argparse would just run
+	return 'argparse' in script.read_text()
+
+def best_run_time(args: list[str], repeats: int) -> float:
+	best = float('inf')
+	for _ in range(repeats):
+		start_time = time.perf_counter()
+		subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		best = min(best, time.perf_counter() - start_time)
+	return best
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--repeats', type=int, default=5)
+	parser.add_argument('--out', default=None, help='JSON file to append the results to, to track them over time.')
+	args = parser.parse_args()
+
+	baseline = best_run_time([sys.executable, '-c', 'pass'], args.repeats)
+
+	results = {}
+	print(f'{"Subcommand".ljust(22)} {"help (ms)".ljust(12)} imports (ms)')
+	for subcommand, script in load_subcommands().items():
+		help_time = None
+		if has_help(script):
+			help_time = best_run_time([sys.executable, str(SEGM_CLI), subcommand, '--help'], args.repeats) - baseline
+
+		imports = segm_lib_imports(script)
+		try:
+			imports_time = best_run_time([sys.executable, '-c', imports], args.repeats) - baseline
+		except subprocess.CalledProcessError:
+			# Some dependency of the subcommand is not installed
+			imports_time = None
+
+		results[subcommand] = {'help_ms': _ms(help_time), 'imports_ms': _ms(imports_time)}
+		help_str = '-' if help_time is None else str(_ms(help_time))
+		imports_str = 'not installed' if imports_time is None else str(_ms(imports_time))
+		print(f'{subcommand.ljust(22)} {help_str.ljust(12)} {imports_str}')
+
+	if args.out is not None:
+		out_file = Path(args.out)
+		history = json.loads(out_file.read_text()) if out_file.exists() else []
+		history.append({'date': datetime.now().isoformat(timespec='seconds'), 'results': results})
+		out_file.write_text(json.dumps(history, indent=4))
+
+def _ms(seconds: float) -> float:
+	return None if seconds is None else round(seconds * 1000, 1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,82 @@
+"""Compares converting the masks of an image to RLE one by one (the way
+inference used to do it) against mask_conversions.bin_masks_to_rles() and
+mask_conversions.cropped_masks_to_rles(), and the memory taken by the
+masks as full images and as CroppedMasks.
+
+Usage:
+	python bench_mask_conversions.py [--n-masks 50] [--height 480] [--width 640]
+"""
+import argparse
+import copy
+import time
+
+import torch
+from pycocotools import mask as coco_mask
+
+from segm_lib.core import mask_conversions
+from segm_lib.core.structures import CroppedMask
+
+
+def one_by_one(bin_masks: list[torch.BoolTensor]) -> list[dict]:
+	rles = []
+	for bin_mask in bin_masks:
+		rle = coco_mask.encode(bin_mask.numpy().astype('uint8', order='F'))
+		serializable_rle = copy.deepcopy(rle)
+		serializable_rle['counts'] = rle['counts'].decode('utf-8')
+		rles.append(serializable_rle)
+	return rles
+
+def random_masks(n_masks: int, h: int, w: int) -> torch.BoolTensor:
+	# Boxes with random blobs inside, closer to real masks than pure noise
+	generator = torch.Generator().manual_seed(0)
+	masks = torch.zeros((n_masks, h, w), dtype=torch.bool)
+	for i in range(n_masks):
+		x1, x2 = sorted(torch.randint(0, w, (2,), generator=generator).tolist())
+		y1, y2 = sorted(torch.randint(0, h, (2,), generator=generator).tolist())
+		blob = torch.rand((y2 - y1, x2 - x1), generator=generator) > 0.3
+		masks[i, y1:y2, x1:x2] = blob
+	return masks
+
+def timeit(fn, repeats: int) -> float:
+	best = float('inf')
+	for _ in range(repeats):
+		start_time = time.perf_counter()
+		fn()
+		best = min(best, time.perf_counter() - start_time)
+	return best
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--n-masks', type=int, default=50)
+	parser.add_argument('--height', type=int, default=480)
+	parser.add_argument('--width', type=int, default=640)
+	parser.add_argument('--repeats', type=int, default=10)
+	args = parser.parse_args()
+
+	masks = random_masks(args.n_masks, args.height, args.width)
+	mask_list = list(masks)
+	cropped_masks = CroppedMask.from_full_masks(masks)
+
+	# Same output, otherwise the comparison is pointless
+	assert one_by_one(mask_list) == mask_conversions.bin_masks_to_rles(masks)
+	assert one_by_one(mask_list) == mask_conversions.bin_masks_to_rles(mask_list)
+	assert one_by_one(mask_list) == mask_conversions.cropped_masks_to_rles(cropped_masks)
+
+	results = {
+		'one by one': timeit(lambda: one_by_one(mask_list), args.repeats),
+		'batch, (N,H,W) tensor': timeit(lambda: mask_conversions.bin_masks_to_rles(masks), args.repeats),
+		'batch, list of masks': timeit(lambda: mask_conversions.bin_masks_to_rles(mask_list), args.repeats),
+		'cropped masks': timeit(lambda: mask_conversions.cropped_masks_to_rles(cropped_masks), args.repeats),
+	}
+
+	print(f'{args.n_masks} masks of {args.height}x{args.width}, best of {args.repeats}:')
+	baseline = results['one by one']
+	for name, seconds in results.items():
+		print(f'  {name:<24}{seconds * 1000:8.2f} ms  ({baseline / seconds:.2f}x)')
+
+	full_mb = sum(m.numel() for m in mask_list) / 2**20
+	cropped_mb = sum(m.mask.numel() for m in cropped_masks) / 2**20
+	print(f'Masks in memory: {full_mb:.2f} MB as full images, {cropped_mb:.2f} MB cropped')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,142 @@
+"""Compares the conversion of the model outputs to Predictions (the
+predictors' _to_custom_format()) against the old per-object loop with
+full image masks, on synthetic outputs with many detections. The models
+themselves are not loaded, but their libraries must be installed.
+
+Usage:
+	python bench_predictor_adapters.py [--models maskrcnn solo yolact] [--n-detections 100]
+"""
+import argparse
+import time
+
+import torch
+
+from segm_lib.inference.predictors import Prediction
+
+
+def random_outputs(n_detections: int, h: int, w: int):
+	generator = torch.Generator().manual_seed(0)
+	classes = torch.randint(1, 80, (n_detections,), generator=generator)
+	scores = torch.rand(n_detections, generator=generator)
+	boxes = torch.zeros((n_detections, 4))
+	masks = torch.zeros((n_detections, h, w), dtype=torch.bool)
+	for i in range(n_detections):
+		x1, x2 = sorted(torch.randint(0, w, (2,), generator=generator).tolist())
+		y1, y2 = sorted(torch.randint(0, h, (2,), generator=generator).tolist())
+		masks[i, y1:y2 + 1, x1:x2 + 1] = True
+		boxes[i] = torch.tensor([x1, y1, x2, y2])
+	return classes, scores, boxes, masks
+
+def legacy_loop(predictor, classes, scores, boxes, masks) -> list[Prediction]:
+	formatted_predictions = []
+	for i in range(len(masks)):
+		classname = predictor._id_to_name(classes[i].item())
+		x1, y1, x2, y2 = boxes[i].tolist()
+		bbox = [x1, y1, x2 - x1, y2 - y1]
+		formatted_predictions.append(Prediction(classname, scores[i].item(), masks[i], bbox))
+	return formatted_predictions
+
+def legacy_solo_boxes(masks) -> torch.Tensor:
+	pred_boxes = torch.zeros(masks.size(0), 4)
+	for i in range(masks.size(0)):
+		ys, xs = torch.where(masks[i])
+		pred_boxes[i] = torch.tensor([xs.min(), ys.min(), xs.max(), ys.max()]).int()
+	return pred_boxes
+
+def benchmark_detectron_model(model_name: str, outputs, h: int, w: int, repeats: int) -> tuple[float, float]:
+	from detectron2.layers.mask_ops import paste_masks_in_image
+	from detectron2.structures import Boxes, Instances
+
+	if model_name == 'maskrcnn':
+		from segm_lib.inference.predictors.maskrcnn import Maskrcnn as model
+	else:
+		from segm_lib.inference.predictors.solo import Solo as model
+	# Only the conversion is measured, so there's no need to load the weights
+	predictor = model.__new__(model)
+
+	classes, scores, boxes, masks = outputs
+	# Mask R-CNN's masks come out of the mask head as 28x28 probabilities
+	# relative to each box, and used to be pasted on the whole image
+	roi_masks = torch.rand((len(boxes), 1, 28, 28), generator=torch.Generator().manual_seed(0))
+
+	def make_instances():
+		instances = Instances((h, w))
+		instances.pred_classes = classes
+		instances.scores = scores
+		if model_name == 'maskrcnn':
+			instances.pred_boxes = Boxes(boxes)
+			instances.roi_masks = roi_masks
+		else:
+			instances.pred_masks = masks
+		return instances
+
+	def old():
+		if model_name == 'solo':
+			return legacy_loop(predictor, classes, scores, legacy_solo_boxes(masks), masks)
+		full_masks = paste_masks_in_image(roi_masks[:, 0], Boxes(boxes), (h, w))
+		return legacy_loop(predictor, classes, scores, boxes, full_masks)
+
+	_check_same_output(old(), predictor._to_custom_format(make_instances()))
+	return (
+		timeit(old, repeats),
+		timeit(lambda: predictor._to_custom_format(make_instances()), repeats),
+	)
+
+def benchmark_yolact(outputs, repeats: int) -> tuple[float, float]:
+	from segm_lib.inference.predictors.yolact import Yolact
+	predictor = Yolact.__new__(Yolact)
+
+	classes, scores, boxes, masks = outputs
+	boxes = boxes.long()
+	float_masks = masks.float()
+
+	def old():
+		return legacy_loop(predictor, classes, scores, boxes, [m.to(torch.bool) for m in float_masks])
+
+	_check_same_output(old(), predictor._to_custom_format(classes, scores, boxes, float_masks))
+	return (
+		timeit(old, repeats),
+		timeit(lambda: predictor._to_custom_format(classes, scores, boxes, float_masks), repeats),
+	)
+
+def _check_same_output(expected: list[Prediction], got: list[Prediction]):
+	assert len(expected) == len(got)
+	for e, g in zip(expected, got):
+		assert e.classname == g.classname
+		assert abs(e.confidence - g.confidence) < 1e-6
+		assert all(abs(a - b) < 1e-3 for a, b in zip(e.bbox, g.bbox)), (e.bbox, g.bbox)
+		assert torch.equal(e.mask, g.mask.to_full())
+
+def timeit(fn, repeats: int) -> float:
+	best = float('inf')
+	for _ in range(repeats):
+		start_time = time.perf_counter()
+		fn()
+		best = min(best, time.perf_counter() - start_time)
+	return best
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--models', nargs='+', default=['maskrcnn', 'solo', 'yolact'])
+	parser.add_argument('--n-detections', type=int, default=100)
+	parser.add_argument('--height', type=int, default=480)
+	parser.add_argument('--width', type=int, default=640)
+	parser.add_argument('--repeats', type=int, default=10)
+	args = parser.parse_args()
+
+	outputs = random_outputs(args.n_detections, args.height, args.width)
+	print(f'{args.n_detections} detections on {args.height}x{args.width}, best of {args.repeats}:')
+	for model_name in args.models:
+		try:
+			if model_name == 'yolact':
+				old, new = benchmark_yolact(outputs, args.repeats)
+			else:
+				old, new = benchmark_detectron_model(model_name, outputs, args.height, args.width, args.repeats)
+		except ImportError as e:
+			print(f'  {model_name:<10}skipped, not installed ({e})')
+			continue
+
+		print(f'  {model_name:<10}loop {old * 1000:8.2f} ms   vectorized {new * 1000:8.2f} ms  ({old / new:.2f}x)')
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,158 @@
+import json
+import re
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+# Characters read from the file at a time
+READ_SIZE = 1 << 20
+NOT_WHITESPACE = re.compile(r'[^ \t\n\r]')
+# Characters that can continue a number
+NUMBER_CHARS = '0123456789.eE+-'
+
+_decoder = json.JSONDecoder()
+
+
+def iter_arrays(json_file: Path, keys: Iterable[str]) -> Iterator[tuple[str, object]]:
+	"""Reads the arrays of a JSON object, like the "images" and "annotations"
+	of a COCO file, one element at a time instead of loading the whole file.
+	Memory use is bounded by the size of the largest element.
+
+	Args:
+		json_file (Path): file with a JSON object.
+		keys (Iterable[str]): top-level keys to read. The other values are
+			parsed and dropped, since the file has to be read through anyway.
+
+	Yields:
+		tuple[str, object]: the key and each element of its array, in the
+			order they are on the file. Keys whose value isn't an array are
+			skipped.
+
+	Raises:
+		ValueError: if the file isn't a JSON object.
+	"""
+	keys = set(keys)
+	with json_file.open('r', encoding='utf-8') as f:
+		reader = _Reader(f)
+		reader.expect('{')
+		if reader.peek() == '}':
+			return
+
+		while True:
+			key = reader.value()
+			reader.expect(':')
+			if reader.peek() != '[':
+				reader.value()
+			else:
+				reader.expect('[')
+				if reader.peek() == ']':
+					reader.expect(']')
+				else:
+					while True:
+						element = reader.value()
+						if key in keys:
+							yield key, element
+						if reader.next_of(',]') == ']':
+							break
+
+			if reader.next_of(',}') == '}':
+				return
+
+def write_arrays(json_file: Path, keys: list[str], items: Iterable[tuple[str, object]]):
+	"""The inverse of iter_arrays(): writes a JSON object with an array for
+	each key, one element at a time.
+
+	Args:
+		json_file (Path): file to write.
+		keys (list[str]): keys of the object. The ones without any item are
+			written as empty arrays.
+		items (Iterable[tuple[str, object]]): the key and element of each
+			item. The items of each key must be contiguous.
+
+	Raises:
+		ValueError: if the items of a key are not contiguous.
+	"""
+	written_keys = []
+	with json_file.open('w', encoding='utf-8') as f:
+		# Mesmo formato do json.dump() sem indentação
+		f.write('{')
+		current_key = None
+		for key, item in items:
+			if key != current_key:
+				if key in written_keys:
+					raise ValueError(f'The items of "{key}" are not contiguous')
+				if current_key is not None:
+					f.write('], ')
+				f.write(f'{json.dumps(key)}: [')
+				written_keys.append(key)
+				current_key = key
+			else:
+				f.write(', ')
+			f.write(json.dumps(item))
+		if current_key is not None:
+			f.write(']')
+
+		for key in keys:
+			if key not in written_keys:
+				f.write(', ' if len(written_keys) > 0 else '')
+				f.write(f'{json.dumps(key)}: []')
+				written_keys.append(key)
+		f.write('}')
+
+class _Reader:
+	# Sliding window over the file: only what wasn't parsed yet stays on
+	# the buffer
+
+	def __init__(self, f):
+		self._f = f
+		self._buffer = ''
+		self._pos = 0
+		self._eof = False
+
+	def peek(self) -> str:
+		"""Next character that isn't whitespace, or '' at the end."""
+		while True:
+			match = NOT_WHITESPACE.search(self._buffer, self._pos)
+			if match is not None:
+				self._pos = match.start()
+				return self._buffer[self._pos]
+			self._pos = len(self._buffer)
+			if not self._fill():
+				return ''
+
+	def expect(self, char: str):
+		if self.peek() != char:
+			raise ValueError(f'Expected "{char}" at "{self._f.name}", found "{self.peek()}"')
+		self._pos += 1
+
+	def next_of(self, chars: str) -> str:
+		char = self.peek()
+		if char == '' or char not in chars:
+			raise ValueError(f'Expected one of "{chars}" at "{self._f.name}", found "{char}"')
+		self._pos += 1
+		return char
+
+	def value(self) -> object:
+		self.peek()
+		while True:
+			try:
+				value, end = _decoder.raw_decode(self._buffer, self._pos)
+				# Um número cortado no fim do buffer (ex.: "12." de "12.5")
+				# decodifica como um número menor, então só aceita se o que
+				# vem depois não puder ser parte dele
+				if self._eof or (end < len(self._buffer) and self._buffer[end] not in NUMBER_CHARS):
+					self._pos = end
+					return value
+			except json.JSONDecodeError:
+				if self._eof:
+					raise ValueError(f'Invalid JSON at "{self._f.name}"')
+			self._fill()
+
+	def _fill(self) -> bool:
+		# Pelo menos o tamanho do que já está no buffer, pra um valor grande
+		# não ser decodificado de novo a cada READ_SIZE
+		remaining = self._buffer[self._pos:]
+		chunk = self._f.read(max(READ_SIZE, len(remaining)))
+		self._buffer = remaining + chunk
+		self._pos = 0
+		self._eof = chunk == ''
+		return not self._eof
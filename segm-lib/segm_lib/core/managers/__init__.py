@@ -1,5 +1,7 @@
 from .ann_manager import AnnManager
 from .single_model_pred_manager import SingleModelPredManager
+from .packed_ann_manager import PackedAnnManager
+from .packed_pred_manager import PackedPredManager
 from .multi_model_pred_manager import MultiModelPredManager
 
 from .coco_ann_manager import COCOAnnManager
@@ -1,55 +1,62 @@
 import json
+import multiprocessing
 import os
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Generator
+from typing import Generator, Iterator
 
 from segm_lib.core.structures import Annotation
-from segm_lib.core import mask_conversions
 from segm_lib.core.classname_normalization import normalize_classname
 
+# Images sent to a worker at a time when converting from COCO
+COCO_CONVERSION_CHUNK_SIZE = 256
+
 
 class AnnManager:
-	"""Functions to work with annotations in segm_lib format."""
+	"""Functions to work with annotations in segm_lib format.
+
+	With use_index, the class, area and bbox of every annotation are also
+	kept on a SQLite file next to the annotations (see MetadataIndex), and
+	the counts and class distributions are queried from it instead of
+	loading every file.
+	"""
 
-	def __init__(self, ann_dir: Path):
+	def __init__(self, ann_dir: Path, use_index: bool = False):
+		"""
+		Args:
+			ann_dir (Path): directory with one file of annotations per image.
+			use_index (bool, optional): whether to use (and keep up to date)
+				the index <ann_dir>.sqlite. It's built if it doesn't exist,
+				and images saved (or deleted) without it are re-indexed when
+				it's opened. Defaults to False.
+		"""
 		if not ann_dir.exists():
 			ann_dir.mkdir(parents=True)
 
 		self.root_dir = ann_dir
+		self._index = self._open_index(ann_dir.with_name(ann_dir.name + '.sqlite')) if use_index else None
 
-	def from_coco_file(self, coco_file: Path):
-		from .coco_ann_manager import COCOAnnManager
-
-		coco_anns = COCOAnnManager(coco_file)
-		classmap_by_id = coco_anns.classmap_by_id()
-		img_dimensions = coco_anns.img_dimensions()
-
-		for img_name in coco_anns.img_names():
-			tmp_file = Path('tmp', f'{img_name}_coco-anns.json')
-			coco_anns.filter(tmp_file, img_name=img_name)
+	def from_coco_file(self, coco_file: Path, n_workers: int = None):
+		"""Converts a COCO annotation file to segm_lib format, one file per
+		image (including the images without annotations).
 
-			coco_anns_for_img = COCOAnnManager(tmp_file)
-			img_h, img_w = img_dimensions[img_name]
+		The annotations are grouped by image in a single pass, the images
+		are converted (polygons to RLE) by a pool of processes, and saved
+		here as they come back.
 
-			custom_anns = []
-			for coco_ann in coco_anns_for_img.annotations:
-				cat_id = coco_ann['category_id']
-				classname = classmap_by_id[cat_id]
-				mask = mask_conversions.ann_to_rle(coco_ann['segmentation'], img_h, img_w)
-				bbox = coco_ann['bbox'] # Mesmo formato do COCO, [x, y, w, h]
-
-				custom_anns.append(Annotation(classname, mask, bbox))
-
-			self._save(custom_anns, img_name)
-			os.remove(str(tmp_file))
+		Args:
+			coco_file (Path): the COCO annotations.
+			n_workers (int, optional): processes converting the images. 1
+				runs everything on this process. Defaults to the number of
+				CPUs.
+		"""
+		for img_name, serializable_anns in self._convert_coco_file(coco_file, n_workers):
+			self._save_and_index(serializable_anns, img_name)
 
 	def load(self, img_name: str) -> list[Annotation]:
-		ann_file = self.root_dir / f"{img_name}.json"
-		try:
-			with ann_file.open('r') as f:
-				serializable_anns = json.load(f)
-		except FileNotFoundError:
+		serializable_anns = self._load_serializable(img_name)
+		if serializable_anns is None:
 			return []
 
 		annotations = []
@@ -59,6 +66,9 @@ class AnnManager:
 		return annotations
 
 	def get_n_images(self) -> int:
+		if self._index is not None:
+			return self._index.n_images()
+
 		n_images = sum(1 for _ in self.get_img_names())
 		return n_images
 
@@ -69,6 +79,10 @@ class AnnManager:
 			return sum(self.class_distribution(img_name).values())
 
 	def class_distribution(self, img_name: str = None) -> dict[str, int]:
+		if self._index is not None:
+			# Sem cache: a consulta é rápida e sempre vê o que foi salvo
+			return self._index.class_distribution(img_name)
+
 		if img_name is None and hasattr(self, '_cached_class_dist'):
 			return self._cached_class_dist
 		
@@ -118,6 +132,40 @@ class AnnManager:
 
 			self._save(annotations, img)
 
+	def _convert_coco_file(self, coco_file: Path, n_workers: int) -> Iterator[tuple[str, list[dict]]]:
+		# Yields the name and converted annotations of each image
+		from .coco_ann_manager import COCOAnnManager
+
+		coco_anns = COCOAnnManager(coco_file)
+		classmap_by_id = coco_anns.classmap_by_id()
+
+		anns_per_img_id = defaultdict(list)
+		for coco_ann in coco_anns.annotations:
+			# Mesmo formato do COCO pra bbox, [x, y, w, h]
+			anns_per_img_id[coco_ann['image_id']].append(
+				(classmap_by_id[coco_ann['category_id']], coco_ann['segmentation'], coco_ann['bbox'])
+			)
+
+		# tanto faz a extensão, eu só considero o nome
+		jobs = [
+			(Path(image['file_name']).stem, image['height'], image['width'], anns_per_img_id.pop(image['id'], []))
+			for image in coco_anns.images
+		]
+		del coco_anns, anns_per_img_id
+
+		n_workers = os.cpu_count() if n_workers is None else n_workers
+		chunks = [jobs[i:i + COCO_CONVERSION_CHUNK_SIZE] for i in range(0, len(jobs), COCO_CONVERSION_CHUNK_SIZE)]
+		if n_workers <= 1 or len(chunks) <= 1:
+			for chunk in chunks:
+				yield from _convert_coco_imgs(chunk)
+			return
+
+		# spawn pelo mesmo motivo da inferência: o mask_conversions importa o torch
+		mp_context = multiprocessing.get_context('spawn')
+		with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context) as executor:
+			for results in executor.map(_convert_coco_imgs, chunks):
+				yield from results
+
 	def _class_dist_on_all_imgs(self) -> dict[str, int]:
 		class_dist = defaultdict(lambda: 0)
 		for img_name in self.get_img_names():
@@ -155,6 +203,57 @@ class AnnManager:
 		for ann in anns:
 			serializable_anns.append(ann.serializable())
 
+		self._save_and_index(serializable_anns, img_name)
+
+	def _save_and_index(self, serializable_anns: list[dict], img_name: str):
+		self._save_serializable(serializable_anns, img_name)
+		if self._index is not None:
+			self._index.replace_img(img_name, serializable_anns, self._fingerprint(img_name))
+
+	def _open_index(self, index_file: Path):
+		# Import aqui porque o índice é opcional
+		from segm_lib.core.metadata_index import MetadataIndex
+
+		index = MetadataIndex(index_file)
+		# Anotações salvas sem o índice, inclusive por cima de outras, têm
+		# outra fingerprint, e são reindexadas
+		index.sync(self._fingerprints(), self._load_serializable)
+		return index
+
+	def _fingerprints(self) -> dict[str, str]:
+		from segm_lib.core.metadata_index import file_fingerprint
+
+		return {f.stem: file_fingerprint(f) for f in self.root_dir.glob('*.json')}
+
+	def _fingerprint(self, img_name: str) -> str:
+		from segm_lib.core.metadata_index import file_fingerprint
+
+		return file_fingerprint(self.root_dir / f'{img_name}.json')
+
+	def _save_serializable(self, serializable_anns: list[dict], img_name: str):
 		out_file = self.root_dir / f'{img_name}.json'
 		with out_file.open('w') as f:
-			json.dump(serializable_anns, f, indent=4)
\ No newline at end of file
+			json.dump(serializable_anns, f, indent=4)
+
+	def _load_serializable(self, img_name: str) -> list[dict] | None:
+		ann_file = self.root_dir / f"{img_name}.json"
+		try:
+			with ann_file.open('r') as f:
+				return json.load(f)
+		except FileNotFoundError:
+			return None
+
+def _convert_coco_imgs(jobs: list[tuple]) -> list[tuple[str, list[dict]]]:
+	# Runs on the workers: polygons to RLE. The files are saved by the
+	# manager, so the index and the packed file stay consistent
+	from segm_lib.core import mask_conversions
+
+	results = []
+	for img_name, img_h, img_w, anns in jobs:
+		serializable_anns = [
+			Annotation(classname, mask_conversions.ann_to_rle(segm, img_h, img_w), bbox).serializable()
+			for classname, segm, bbox in anns
+		]
+		results.append((img_name, serializable_anns))
+
+	return results
\ No newline at end of file
@@ -1,14 +1,39 @@
 import json
+import os
 from collections import defaultdict
+from collections.abc import Iterator
 from pathlib import Path
 
 from segm_lib.core.classname_normalization import normalize_classname
+from segm_lib.core.json_stream import iter_arrays, write_arrays
+
+# The arrays of a COCO file that are used
+COCO_KEYS = ['images', 'categories', 'annotations']
 
 class COCOAnnManager:
 	"""Functions to work with annotations in COCO format.
-	(https://cocodataset.org/#format-data)"""
+	(https://cocodataset.org/#format-data)
+
+	The maps from names and IDs to images, categories and annotations are
+	built on first use and dropped when images, categories or annotations
+	are assigned, or by normalize_classnames(). Changing those lists in
+	place is not tracked.
+	"""
 
-	def __init__(self, ann_file: Path):
+	def __init__(self, ann_file: Path, streaming: bool = False):
+		"""
+		Args:
+			ann_file (Path): the COCO file. Created, empty, if it doesn't
+				exist.
+			streaming (bool, optional): whether to read the file as needed,
+				one image/annotation at a time (see json_stream.iter_arrays()),
+				instead of loading it. Memory use stays bounded on huge
+				files, like instances_train2017.json, but every call reads
+				the file again, and the images, categories and annotations
+				attributes are not available: use iter_images(),
+				iter_categories() and iter_annotations(). Defaults to False.
+		"""
+		self.streaming = streaming
 		if not ann_file.exists():
 			ann_file.parent.mkdir(parents=True, exist_ok=True)
 
@@ -19,6 +44,10 @@ class COCOAnnManager:
 			self._save()
 			return
 
+		if streaming:
+			self.file = ann_file
+			return
+
 		with ann_file.open('r') as f:
 			anns = json.load(f)
 		# Could test keys and values too, but whatever
@@ -28,12 +57,26 @@ class COCOAnnManager:
 		self.categories = anns['categories']
 		self.annotations = anns['annotations']
 
+	def __setattr__(self, name: str, value):
+		if name in COCO_KEYS:
+			self._clear_cache()
+		super().__setattr__(name, value)
+
+	def iter_images(self) -> Iterator[dict]:
+		return (image for _, image in self._iter_items(['images']))
+
+	def iter_categories(self) -> Iterator[dict]:
+		return (cat for _, cat in self._iter_items(['categories']))
+
+	def iter_annotations(self) -> Iterator[dict]:
+		return (ann for _, ann in self._iter_items(['annotations']))
+
 	def classmap(self) -> dict[str, int]:
 		if hasattr(self, '_cached_classmap'):
 			return self._cached_classmap
 
 		classmap = {}
-		for cat in self.categories:
+		for cat in self.iter_categories():
 			classmap[cat['name']] = cat['id']
 
 		self._cached_classmap = classmap
@@ -54,15 +97,21 @@ class COCOAnnManager:
 		return {id_: name for name, id_ in self.classmap().items()}
 	
 	def class_distribution(self) -> dict[str, int]:
-		classmap_by_id = self.classmap_by_id()
-
-		class_dist = defaultdict(lambda: 0)
-		for ann in self.annotations:
-			cat_id = ann['category_id']
-			cat_name = classmap_by_id[cat_id]
-			class_dist[cat_name] += 1
-
-		return dict(class_dist)
+		if not self.streaming:
+			classmap_by_id = self.classmap_by_id()
+			return {classmap_by_id[cat_id]: len(ann_idxs) for cat_id, ann_idxs in self._ann_idxs_by_cat_id().items()}
+
+		# Uma passada só: no arquivo do COCO as categorias vêm depois das
+		# anotações, então conta por ID e troca pelo nome no final
+		classmap_by_id = {}
+		count_per_cat_id = defaultdict(lambda: 0)
+		for key, item in self._iter_items(['categories', 'annotations']):
+			if key == 'categories':
+				classmap_by_id[item['id']] = item['name']
+			else:
+				count_per_cat_id[item['category_id']] += 1
+
+		return {classmap_by_id[cat_id]: count for cat_id, count in count_per_cat_id.items()}
 
 	def img_names(self) -> list[str]:
 		return self.img_map().keys()
@@ -72,7 +121,7 @@ class COCOAnnManager:
 			return self._cached_img_map
 	
 		img_map = {}
-		for image in self.images:
+		for image in self.iter_images():
 			# tanto faz a extensão, eu só considero o nome
 			img_map[Path(image['file_name']).stem] = image['id']
 
@@ -82,7 +131,7 @@ class COCOAnnManager:
 	def img_dimensions(self) -> dict[str, tuple[int, int]]:
 		img_dimensions = {}
 
-		for image in self.images:
+		for image in self.iter_images():
 			img_dimensions[Path(image['file_name']).stem] = (image['height'], image['width'])
 
 		return img_dimensions
@@ -103,6 +152,10 @@ class COCOAnnManager:
 		if classes is not None and img_name is not None:
 			raise ValueError('Filtering by both classes and img at once is not supported')
 
+		if self.streaming:
+			self._filter_streaming(out_file, classes, img_name)
+			return
+
 		filtered_anns = COCOAnnManager(out_file)
 		if classes is not None:
 			self._filter_by_classes(classes, filtered_anns)
@@ -110,33 +163,104 @@ class COCOAnnManager:
 			self._filter_by_img(img_name, filtered_anns)
 
 	def normalize_classnames(self):
+		if self.streaming:
+			# Reescreve num arquivo temporário, sem carregar o original
+			tmp_file = self.file.with_name(self.file.name + '.tmp')
+			write_arrays(tmp_file, COCO_KEYS, (
+				(key, item | {'name': normalize_classname(item['name'])} if key == 'categories' else item)
+				for key, item in self._iter_items(COCO_KEYS)
+			))
+			os.replace(tmp_file, self.file)
+			self._clear_cache()
+			return
+
 		for cat in self.categories:
 			cat['name'] = normalize_classname(cat['name'])
+		self._clear_cache()
 		
 		self._save()
 
+	def _iter_items(self, keys: list[str]) -> Iterator[tuple[str, dict]]:
+		# (key, item) from the arrays, in the order they are on the file
+		if self.streaming:
+			return iter_arrays(self.file, keys)
+		return ((key, item) for key in keys for item in getattr(self, key))
+
+	def _ann_idxs_by_img_id(self) -> dict[int, list[int]]:
+		# Positions on self.annotations, in order
+		if not hasattr(self, '_cached_ann_idxs_by_img_id'):
+			self._cached_ann_idxs_by_img_id = self._group_ann_idxs('image_id')
+		return self._cached_ann_idxs_by_img_id
+
+	def _ann_idxs_by_cat_id(self) -> dict[int, list[int]]:
+		if not hasattr(self, '_cached_ann_idxs_by_cat_id'):
+			self._cached_ann_idxs_by_cat_id = self._group_ann_idxs('category_id')
+		return self._cached_ann_idxs_by_cat_id
+
+	def _image_by_name(self) -> dict[str, dict]:
+		if not hasattr(self, '_cached_image_by_name'):
+			# tanto faz a extensão, eu só considero o nome
+			self._cached_image_by_name = {Path(image['file_name']).stem: image for image in self.images}
+		return self._cached_image_by_name
+
+	def _group_ann_idxs(self, field: str) -> dict[int, list[int]]:
+		ann_idxs = defaultdict(list)
+		for i, ann in enumerate(self.annotations):
+			ann_idxs[ann[field]].append(i)
+		return dict(ann_idxs)
+
+	def _clear_cache(self):
+		for attr in [a for a in vars(self) if a.startswith('_cached_')]:
+			delattr(self, attr)
+
+	def _filter_streaming(self, out_file: Path, classes: list[str] = None, img_name: str = None):
+		# Same as _filter_by_classes() and _filter_by_img(), but written
+		# as the file is read
+		if classes is not None:
+			cat_ids_to_keep = {cat_id for cat_name, cat_id in self.classmap().items() if cat_name in classes}
+			keep = {
+				'images': lambda image: True,
+				'categories': lambda cat: cat['id'] in cat_ids_to_keep,
+				'annotations': lambda ann: ann['category_id'] in cat_ids_to_keep,
+			}
+		else:
+			img_id = self.img_map()[img_name]
+			# Todas as categorias, pelo mesmo motivo do _filter_by_img()
+			keep = {
+				'images': lambda image: image['id'] == img_id,
+				'categories': lambda cat: True,
+				'annotations': lambda ann: ann['image_id'] == img_id,
+			}
+
+		out_file.parent.mkdir(parents=True, exist_ok=True)
+		write_arrays(out_file, COCO_KEYS, (
+			(key, item) for key, item in self._iter_items(COCO_KEYS) if keep[key](item)
+		))
+
 	def _filter_by_classes(self, classes: list[str], filtered_anns: 'COCOAnnManager'):
 		cat_ids_to_keep = []
 		for cat_name, cat_id in self.classmap().items():
 			if cat_name in classes:
 				cat_ids_to_keep.append(cat_id)
 
+		# Na mesma ordem do original
+		ann_idxs_by_cat_id = self._ann_idxs_by_cat_id()
+		ann_idxs = sorted(i for cat_id in cat_ids_to_keep for i in ann_idxs_by_cat_id.get(cat_id, []))
+
 		filtered_anns.images = self.images
 		filtered_anns.categories = [c for c in self.categories if c['id'] in cat_ids_to_keep]
-		filtered_anns.annotations = [a for a in self.annotations if a['category_id'] in cat_ids_to_keep]
+		filtered_anns.annotations = [self.annotations[i] for i in ann_idxs]
 
 		filtered_anns._save()
 
 	def _filter_by_img(self, img_name: str, filtered_anns: 'COCOAnnManager'):
-		img_map = self.img_map()
-		img_id = img_map[img_name]
-
-		img_desc = next((i for i in self.images if i['id'] == img_id), None)
+		img_desc = self._image_by_name().get(img_name)
 		if img_desc is None:
 			raise ValueError(f'Info for img {img_name} not found in annotations')
 		filtered_anns.images = [img_desc]
 
-		filtered_anns.annotations = [a for a in self.annotations if a['image_id'] == img_id]
+		ann_idxs = self._ann_idxs_by_img_id().get(img_desc['id'], [])
+		filtered_anns.annotations = [self.annotations[i] for i in ann_idxs]
 
 		# Initially I was keeping only the categories that exist on that image,
 		# but that caused unintended effects on the evaluation. Categories that
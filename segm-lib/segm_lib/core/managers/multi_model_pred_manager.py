@@ -1,7 +1,8 @@
 from pathlib import Path
 
 
-from segm_lib.core.managers import SingleModelPredManager
+from segm_lib.core.managers import PackedPredManager, SingleModelPredManager
+from segm_lib.core.managers.packed_pred_manager import PACK_SUFFIX
 from segm_lib.core.classname_normalization import normalize_classname
 
 
@@ -10,20 +11,43 @@ class MultiModelPredManager:
 	Each model predictions are kept in a separate folder, and should be
 	manipulated using the SingleModelPredManager objects returned from
 	get_manager().
+
+	score_threshold, if given, is passed to each SingleModelPredManager:
+	only predictions with a higher confidence are loaded.
+
+	A model can also have its predictions packed in a single file,
+	<model>.pack, instead of the folder (see PackedPredManager). Those are
+	found and read the same way.
 	"""
 
-	def __init__(self, pred_dir: Path):
+	def __init__(self, pred_dir: Path, score_threshold: float = None, packed: bool = False, use_index: bool = False):
+		"""
+		Args:
+			pred_dir (Path): directory with the predictions of each model.
+			score_threshold (float, optional): see above.
+			packed (bool, optional): whether the predictions of models that
+				don't have any yet are packed in a single file. Defaults to False.
+			use_index (bool, optional): whether each model's predictions are
+				indexed on SQLite (see SingleModelPredManager). Defaults to False.
+		"""
 		if not pred_dir.exists():
 			pred_dir.mkdir(parents=True)
 
 		self.root_dir = pred_dir
+		self.score_threshold = score_threshold
+		self.packed = packed
+		self.use_index = use_index
 
 	def get_model_names(self) -> list[str]:
-		return [f.stem for f in self.root_dir.glob('*') if f.is_dir()]	
+		# dict pra não repetir um modelo que tenha as duas coisas
+		return list(dict.fromkeys(f.stem for f in self.root_dir.glob('*') if f.is_dir() or f.suffix == PACK_SUFFIX))
 
 	def get_manager(self, model_name: str) -> SingleModelPredManager:
 		model_dir = self.root_dir / model_name
-		return SingleModelPredManager(model_dir)
+		pack_file = self.root_dir / f'{model_name}{PACK_SUFFIX}'
+		if pack_file.exists() or (self.packed and not model_dir.exists()):
+			return PackedPredManager(pack_file, self.score_threshold, self.use_index)
+		return SingleModelPredManager(model_dir, self.score_threshold, self.use_index)
 		
 	def normalize_classnames(self):
 		for model in self.get_model_names():
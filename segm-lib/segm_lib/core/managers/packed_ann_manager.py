@@ -0,0 +1,62 @@
+from pathlib import Path
+from typing import Generator
+
+from .ann_manager import AnnManager
+
+
+class PackedAnnManager(AnnManager):
+	"""Same as AnnManager, but with the annotations of all the images in a
+	single file (see PackedStore), instead of one file per image.
+
+	filter() still writes the directory layout.
+	"""
+
+	def __init__(self, pack_file: Path, use_index: bool = False):
+		"""
+		Args:
+			pack_file (Path): file with the annotations. Created if it
+				doesn't exist.
+			use_index (bool, optional): see AnnManager. The index is
+				<pack_file>.sqlite.
+		"""
+		self.pack_file = pack_file
+		# Import aqui pra quem só usa o formato de diretório não pagar o numpy
+		from segm_lib.core.packed_store import PackedStore
+
+		self._store = PackedStore(pack_file)
+		self._index = self._open_index(pack_file.with_name(pack_file.name + '.sqlite')) if use_index else None
+
+	@classmethod
+	def from_dir(cls, ann_dir: Path, pack_file: Path) -> 'PackedAnnManager':
+		"""Packs the annotations of an AnnManager directory."""
+		from segm_lib.core.packed_store import pack_dir
+
+		pack_dir(ann_dir, pack_file)
+		return cls(pack_file)
+
+	def to_dir(self, ann_dir: Path) -> AnnManager:
+		"""Writes the annotations in the directory layout, one file per image."""
+		from segm_lib.core.packed_store import unpack
+
+		unpack(self.pack_file, ann_dir)
+		return AnnManager(ann_dir)
+
+	def get_img_names(self) -> Generator[str, None, None]:
+		return (img_name for img_name in self._store.names())
+
+	def compact(self):
+		"""Drops the old versions of annotations that were saved again (see
+		PackedStore.compact())."""
+		self._store.compact()
+
+	def _fingerprints(self) -> dict[str, str]:
+		return self._store.fingerprints()
+
+	def _fingerprint(self, img_name: str) -> str:
+		return self._store.fingerprint(img_name)
+
+	def _save_serializable(self, serializable_anns: list[dict], img_name: str):
+		self._store.put(img_name, serializable_anns)
+
+	def _load_serializable(self, img_name: str) -> list[dict] | None:
+		return self._store.get(img_name)
\ No newline at end of file
@@ -0,0 +1,72 @@
+from pathlib import Path
+from typing import Generator
+
+from .single_model_pred_manager import SingleModelPredManager
+
+PACK_SUFFIX = '.pack'
+
+
+class PackedPredManager(SingleModelPredManager):
+	"""Same as SingleModelPredManager, but with the predictions of all the
+	images in a single file (see PackedStore), instead of one file per image.
+
+	filter() still writes the directory layout.
+	"""
+
+	def __init__(self, pack_file: Path, score_threshold: float = None, use_index: bool = False):
+		"""
+		Args:
+			pack_file (Path): file with the predictions, usually
+				<pred_dir>/<model>.pack. Created if it doesn't exist.
+			score_threshold (float, optional): see SingleModelPredManager.
+			use_index (bool, optional): see SingleModelPredManager. The
+				index is <pack_file>.sqlite.
+		"""
+		self.pack_file = pack_file
+		self.score_threshold = score_threshold
+		# Import aqui pra quem só usa o formato de diretório não pagar o numpy
+		from segm_lib.core.packed_store import PackedStore
+
+		self._store = PackedStore(pack_file)
+		self._index = self._open_index(pack_file.with_name(pack_file.name + '.sqlite')) if use_index else None
+
+	@classmethod
+	def from_dir(cls, model_dir: Path, pack_file: Path) -> 'PackedPredManager':
+		"""Packs the predictions of a SingleModelPredManager directory."""
+		from segm_lib.core.packed_store import pack_dir
+
+		pack_dir(model_dir, pack_file)
+		return cls(pack_file)
+
+	def to_dir(self, model_dir: Path) -> SingleModelPredManager:
+		"""Writes the predictions in the directory layout, one file per image."""
+		from segm_lib.core.packed_store import unpack
+
+		unpack(self.pack_file, model_dir)
+		return SingleModelPredManager(model_dir)
+
+	def has_img(self, img_name: str) -> bool:
+		return img_name in self._store
+
+	def get_img_names(self) -> Generator[str, None, None]:
+		return (img_name for img_name in self._store.names())
+
+	def compact(self):
+		"""Drops the old versions of predictions that were saved again (see
+		PackedStore.compact())."""
+		self._store.compact()
+
+	def _get_img_names(self) -> Generator[str, None, None]:
+		return self.get_img_names()
+
+	def _fingerprints(self) -> dict[str, str]:
+		return self._store.fingerprints()
+
+	def _fingerprint(self, img_name: str) -> str:
+		return self._store.fingerprint(img_name)
+
+	def _save_serializable(self, serializable_preds: list[dict], img_name: str):
+		self._store.put(img_name, serializable_preds)
+
+	def _load_serializable(self, img_name: str) -> list[dict] | None:
+		return self._store.get(img_name)
\ No newline at end of file
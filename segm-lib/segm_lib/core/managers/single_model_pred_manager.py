@@ -7,13 +7,35 @@ from segm_lib.core.structures import Prediction
 
 
 class SingleModelPredManager:
-	"""Functions to work with predictions from in segm_lib format."""
+	"""Functions to work with predictions from in segm_lib format.
 
-	def __init__(self, model_dir: Path):
+	If the predictions were saved with a low score threshold (see the
+	"score_threshold" setting of the inference config), a higher one can
+	be applied here when reading them, without running the models again.
+
+	With use_index, the class, confidence, area and bbox of every
+	prediction are also kept on a SQLite file next to the predictions (see
+	MetadataIndex), and the counts and class distributions are queried
+	from it instead of loading every file.
+	"""
+
+	def __init__(self, model_dir: Path, score_threshold: float = None, use_index: bool = False):
+		"""
+		Args:
+			model_dir (Path): directory with one file of predictions per image.
+			score_threshold (float, optional): only predictions with a higher
+				confidence are loaded, by every method. By default, all of them.
+			use_index (bool, optional): whether to use (and keep up to date)
+				the index <model_dir>.sqlite. It's built if it doesn't exist,
+				and images saved (or deleted) without it are re-indexed when
+				it's opened. Defaults to False.
+		"""
 		if not model_dir.exists():
 			model_dir.mkdir(parents=True)
 
 		self.model_dir = model_dir
+		self.score_threshold = score_threshold
+		self._index = self._open_index(model_dir.with_name(model_dir.name + '.sqlite')) if use_index else None
 
 	def save(self, predictions: list[Prediction], img_name: str):
 		"""Save the predictions for a given image.
@@ -26,25 +48,47 @@ class SingleModelPredManager:
 		for pred in predictions:
 			serializable_preds.append(pred.serializable())
 
-		out_file = self.model_dir / f'{img_name}.json'
-		with out_file.open('w') as f:
-			json.dump(serializable_preds, f, indent=4)
+		self._save_serializable(serializable_preds, img_name)
+		if self._index is not None:
+			self._index.replace_img(img_name, serializable_preds, self._fingerprint(img_name))
 
-	def load(self, img_name: str) -> list[Prediction]:
-		pred_file = self.model_dir / f'{img_name}.json'
-		try:
-			with pred_file.open('r') as f:
-				serializable_preds = json.load(f)
-		except FileNotFoundError:
+	def load(self, img_name: str, score_threshold: float = None) -> list[Prediction]:
+		"""Load the predictions for a given image.
+
+		Args:
+			img_name (str): image the predictions refer to.
+			score_threshold (float, optional): only predictions with a higher
+				confidence are returned. By default, the one of the manager.
+
+		Returns:
+			list[Prediction]: the predictions, or an empty list if none were
+				saved for the image.
+		"""
+		if score_threshold is None:
+			score_threshold = self.score_threshold
+
+		serializable_preds = self._load_serializable(img_name)
+		if serializable_preds is None:
 			return []
 
 		predictions = []
 		for seri_pred in serializable_preds:
+			# Mesma convenção dos modelos: fica o que passa do limiar
+			if score_threshold is not None and seri_pred['confidence'] <= score_threshold:
+				continue
 			predictions.append(Prediction.from_serializable(seri_pred))
 
 		return predictions
 
+	def has_img(self, img_name: str) -> bool:
+		"""Whether predictions were saved for the image (even if the
+		list of predictions is empty)."""
+		return (self.model_dir / f'{img_name}.json').exists()
+
 	def get_n_images_with_predictions(self) -> int:
+		if self._index is not None:
+			return self._index.n_images_with_objects(self.score_threshold)
+
 		n_images_with_preds = 0
 
 		for img_name in self.get_img_names():
@@ -64,6 +108,10 @@ class SingleModelPredManager:
 			return sum(self.class_distribution(img_name=img_name).values())
 
 	def class_distribution(self, img_name: str = None) -> dict[str, int]:
+		if self._index is not None:
+			# Sem cache: a consulta é rápida e sempre vê o que foi salvo
+			return self._index.class_distribution(img_name, self.score_threshold)
+
 		if img_name is None and hasattr(self, '_cached_class_dist'):
 			return self._cached_class_dist
 
@@ -97,7 +145,8 @@ class SingleModelPredManager:
 		if classes is not None and img_name is not None:
 			raise ValueError('Filtering by both classes and img_name at once is not supported')
 
-		filtered_pred_manager = self.__class__(out_dir)
+		# Sempre no formato de diretório, que é o que out_dir diz
+		filtered_pred_manager = SingleModelPredManager(out_dir)
 		if classes is not None:
 			self._filter_by_classes(classes, filtered_pred_manager)
 		else:
@@ -143,6 +192,39 @@ class SingleModelPredManager:
 	def _get_img_names(self) -> Generator[str, None, None]:
 		return (f.stem for f in self.model_dir.glob('*.json'))
 
+	def _open_index(self, index_file: Path):
+		# Import aqui porque o índice é opcional
+		from segm_lib.core.metadata_index import MetadataIndex
+
+		index = MetadataIndex(index_file)
+		# Predições salvas sem o índice (ex.: pela inferência, inclusive por
+		# cima de outras) têm outra fingerprint, e são reindexadas
+		index.sync(self._fingerprints(), self._load_serializable)
+		return index
+
+	def _fingerprints(self) -> dict[str, str]:
+		from segm_lib.core.metadata_index import file_fingerprint
+
+		return {f.stem: file_fingerprint(f) for f in self.model_dir.glob('*.json')}
+
+	def _fingerprint(self, img_name: str) -> str:
+		from segm_lib.core.metadata_index import file_fingerprint
+
+		return file_fingerprint(self.model_dir / f'{img_name}.json')
+
+	def _save_serializable(self, serializable_preds: list[dict], img_name: str):
+		out_file = self.model_dir / f'{img_name}.json'
+		with out_file.open('w') as f:
+			json.dump(serializable_preds, f, indent=4)
+
+	def _load_serializable(self, img_name: str) -> list[dict] | None:
+		pred_file = self.model_dir / f'{img_name}.json'
+		try:
+			with pred_file.open('r') as f:
+				return json.load(f)
+		except FileNotFoundError:
+			return None
+
 	def _class_dist_on_all_imgs(self) -> dict[str, int]:
 		class_dist = defaultdict(lambda: 0)
 		for img_name in self.get_img_names():
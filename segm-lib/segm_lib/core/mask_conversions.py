@@ -1,14 +1,75 @@
-import copy
-
+import numpy as np
 import torch
 from pycocotools import mask as coco_mask
 
+from .structures.cropped_mask import CroppedMask
+
 
 def bin_mask_to_rle(bin_mask: torch.BoolTensor) -> dict:
 	bin_mask_in_cocoapi_format = bin_mask.numpy().astype('uint8', order='F')
 	rle = coco_mask.encode(bin_mask_in_cocoapi_format)
 	return _str_rle(rle)
 
+def bin_masks_to_rles(bin_masks: torch.BoolTensor | list[torch.BoolTensor]) -> list[dict]:
+	"""Converts all the masks of an image at once, which is faster than
+	calling bin_mask_to_rle() for each one when the objects are small
+	relative to the image (only the region around each one is copied).
+
+	Args:
+		bin_masks (torch.BoolTensor | list[torch.BoolTensor]): (N,H,W) tensor,
+			or list of N (H,W) tensors, all with the same size.
+
+	Returns:
+		list[dict]: the N RLEs, in the same order.
+	"""
+	if len(bin_masks) == 0:
+		return []
+
+	rles = coco_mask.encode(_to_cocoapi_format(bin_masks))
+	# Freshly created, so there's no need to copy them
+	for rle in rles:
+		rle['counts'] = rle['counts'].decode('utf-8')
+	return rles
+
+def cropped_masks_to_rles(cropped_masks: list[CroppedMask]) -> list[dict]:
+	"""Converts masks stored only inside their region straight to RLEs
+	of the whole image, without building the H x W masks.
+
+	Args:
+		cropped_masks (list[CroppedMask]): masks of the same image.
+
+	Returns:
+		list[dict]: the RLEs, in the same order.
+	"""
+	if len(cropped_masks) == 0:
+		return []
+
+	h, w = cropped_masks[0].img_size
+	uncompressed_rles = [{'size': [h, w], 'counts': _full_img_counts(m)} for m in cropped_masks]
+	rles = coco_mask.frPyObjects(uncompressed_rles, h, w)
+	# Freshly created, so there's no need to copy them
+	for rle in rles:
+		rle['counts'] = rle['counts'].decode('utf-8')
+	return rles
+
+def rle_to_cropped_mask(rle: dict) -> CroppedMask:
+	"""Decodes only the region of the image covered by the mask."""
+	h, w = rle['size']
+	x1, y1, region_w, region_h = (int(v) for v in coco_mask.toBbox(_bytes_rle(rle)))
+
+	# Column-major, so the region's columns are a contiguous
+	# range of the runs. Everything outside of it is skipped.
+	counts = _uncompressed_counts(rle['counts'])
+	starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+	ends = starts + counts
+	first, last = x1 * h, (x1 + region_w) * h
+	lengths = np.clip(np.minimum(ends, last) - np.maximum(starts, first), 0, None)
+	values = np.arange(len(counts)) % 2 == 1
+	columns = np.repeat(values, lengths).reshape(region_w, h).T
+
+	mask = torch.from_numpy(np.ascontiguousarray(columns[y1:y1 + region_h]))
+	return CroppedMask(mask, x1, y1, (h, w))
+
 def rle_to_bin_mask(rle: dict) -> torch.BoolTensor:
 	bin_mask_in_cocoapi_format = coco_mask.decode(_bytes_rle(rle))
 	bin_mask = torch.tensor(bin_mask_in_cocoapi_format.astype('bool', order='C'))
@@ -33,16 +94,80 @@ def ann_to_rle(segm, h, w) -> dict:
 
 	return _str_rle(rle)
 
+def _to_cocoapi_format(bin_masks) -> np.ndarray:
+	# The COCO API wants (H,W,N) uint8 in Fortran order, i.e. every mask
+	# transposed. Transposing the whole stack costs as much as encoding it,
+	# but the masks are mostly zeros: only the bounding box of each one is
+	# copied, to a buffer that starts zeroed.
+	if isinstance(bin_masks, torch.Tensor):
+		masks = bin_masks.numpy().view(np.uint8)
+	else:
+		masks = [bin_mask.numpy().view(np.uint8) for bin_mask in bin_masks]
+
+	h, w = masks[0].shape
+	buffer = np.zeros((h, w, len(masks)), dtype=np.uint8, order='F')
+	for i, mask in enumerate(masks):
+		rows = np.flatnonzero(mask.any(axis=1))
+		if len(rows) == 0:
+			continue
+		y1, y2 = rows[0], rows[-1] + 1
+		cols = np.flatnonzero(np.bitwise_or.reduce(mask[y1:y2], axis=0))
+		x1, x2 = cols[0], cols[-1] + 1
+		buffer[y1:y2, x1:x2, i] = mask[y1:y2, x1:x2]
+	return buffer
+
+def _full_img_counts(cropped_mask: CroppedMask) -> list[int]:
+	# Lengths of the alternating runs of 0s and 1s (starting with 0s) of
+	# the whole image, in column-major order. Only the columns crossing
+	# the region are built, the ones before and after it are just zeros.
+	h, w = cropped_mask.img_size
+	region_h, region_w = cropped_mask.mask.shape
+	columns = np.zeros((h, region_w), dtype=np.uint8)
+	columns[cropped_mask.y:cropped_mask.y + region_h] = cropped_mask.mask.numpy()
+	flat = columns.ravel(order='F')
+
+	changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+	counts = np.diff(np.concatenate(([0], changes, [flat.size]))).tolist()
+	if flat.size > 0 and flat[0]:
+		counts.insert(0, 0)
+
+	counts[0] += cropped_mask.x * h
+	n_zeros_after = (w - cropped_mask.x - region_w) * h
+	if len(counts) % 2 == 1:
+		counts[-1] += n_zeros_after
+	elif n_zeros_after > 0:
+		counts.append(n_zeros_after)
+	return counts
+
+def _uncompressed_counts(compressed_counts: str) -> np.ndarray:
+	# Same as rleFrString() in the COCO API:
+	#   https://github.com/cocodataset/cocoapi/blob/master/common/maskApi.c
+	counts = []
+	p = 0
+	while p < len(compressed_counts):
+		x = 0
+		k = 0
+		more = True
+		while more:
+			c = ord(compressed_counts[p]) - 48
+			x |= (c & 0x1f) << (5 * k)
+			more = c & 0x20
+			p += 1
+			k += 1
+			if not more and (c & 0x10):
+				x |= -1 << (5 * k)
+		if len(counts) > 2:
+			x += counts[-2]
+		counts.append(x)
+	return np.array(counts, dtype=np.int64)
+
 def _str_rle(rle):
 	# by default, "counts" is in binary, but since I only
 	# convert to RLE to *store* the masks, it's better to
 	# just return it as a str to automaticaly convert it
-	# to JSON later
-	serializable_rle = copy.deepcopy(rle)
-	serializable_rle['counts'] = rle['counts'].decode('utf-8')
-	return serializable_rle
+	# to JSON later.
+	# A shallow copy is enough, since only "counts" is replaced.
+	return {**rle, 'counts': rle['counts'].decode('utf-8')}
 
 def _bytes_rle(rle):
-	serializable_rle = copy.deepcopy(rle)
-	serializable_rle['counts'] = rle['counts'].encode('utf-8')
-	return serializable_rle
+	return {**rle, 'counts': rle['counts'].encode('utf-8')}
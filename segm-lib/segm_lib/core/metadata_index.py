@@ -0,0 +1,161 @@
+import sqlite3
+import threading
+from collections.abc import Callable
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+	img_name TEXT PRIMARY KEY,
+	fingerprint TEXT
+);
+CREATE TABLE IF NOT EXISTS objects (
+	img_name TEXT NOT NULL,
+	classname TEXT NOT NULL,
+	confidence REAL,
+	area REAL,
+	x REAL, y REAL, w REAL, h REAL
+);
+CREATE INDEX IF NOT EXISTS objects_by_img ON objects (img_name);
+CREATE INDEX IF NOT EXISTS objects_by_class ON objects (classname, confidence);
+"""
+
+
+class MetadataIndex:
+	"""SQLite file with one row per object (image, class, confidence, area
+	and bbox) of a set of annotations or predictions, so the counts and
+	class distributions come from a query instead of parsing every file,
+	masks included.
+
+	It's a sidecar: the files are still the source of truth, and the
+	managers keep it up to date when saving (see the use_index argument
+	of SingleModelPredManager and AnnManager). Each image also has a
+	fingerprint of where it came from (e.g. the mtime and size of its
+	file), so the images saved without the index are found by sync().
+	"""
+
+	def __init__(self, db_file: Path):
+		"""
+		Args:
+			db_file (Path): the SQLite file. Created if it doesn't exist.
+		"""
+		self.db_file = db_file
+		# As predições podem ser salvas por outra thread (ex.: o pipeline
+		# da inferência), então a conexão é compartilhada, com um lock
+		self._conn = sqlite3.connect(str(db_file), check_same_thread=False, timeout=60)
+		self._lock = threading.Lock()
+		with self._lock, self._conn:
+			# WAL: um commit por imagem sem um fsync por imagem, e leitores
+			# de outros processos não bloqueiam quem está escrevendo
+			self._conn.execute('PRAGMA journal_mode=WAL')
+			self._conn.execute('PRAGMA synchronous=NORMAL')
+			columns = [row[1] for row in self._conn.execute('PRAGMA table_info(images)')]
+			if len(columns) > 0 and 'fingerprint' not in columns:
+				# Índice de antes das fingerprints: é só um cache, então recria
+				self._conn.execute('DROP TABLE images')
+				self._conn.execute('DROP TABLE IF EXISTS objects')
+			self._conn.executescript(SCHEMA)
+
+	def replace_img(self, img_name: str, serializable_objs: list[dict], fingerprint: str):
+		"""Replaces the objects of an image.
+
+		Args:
+			img_name (str): the image.
+			serializable_objs (list[dict]): its annotations or predictions,
+				as saved on the files.
+			fingerprint (str): changes whenever the image is saved again,
+				see sync().
+		"""
+		rows = _to_rows(img_name, serializable_objs)
+		with self._lock, self._conn:
+			self._replace(img_name, rows, fingerprint)
+
+	def sync(self, fingerprints: dict[str, str], load: Callable[[str], list[dict]]) -> int:
+		"""Brings the index up to date with the files, in a single
+		transaction: images whose fingerprint changed (or that are new) are
+		loaded and replaced, and the ones that no longer exist are dropped.
+
+		Args:
+			fingerprints (dict[str, str]): the current fingerprint of every
+				image.
+			load (Callable[[str], list[dict]]): loads the serializable
+				objects of an image.
+
+		Returns:
+			int: number of images replaced or dropped.
+		"""
+		with self._lock:
+			indexed = dict(self._conn.execute('SELECT img_name, fingerprint FROM images').fetchall())
+		stale = [img_name for img_name, fingerprint in fingerprints.items() if indexed.get(img_name) != fingerprint]
+		removed = [img_name for img_name in indexed if img_name not in fingerprints]
+		if len(stale) == 0 and len(removed) == 0:
+			return 0
+
+		with self._lock, self._conn:
+			for img_name in removed:
+				self._conn.execute('DELETE FROM objects WHERE img_name = ?', (img_name,))
+				self._conn.execute('DELETE FROM images WHERE img_name = ?', (img_name,))
+			for img_name in stale:
+				# Pode ter sido apagada depois de listada: fica sem objetos, e sai no próximo sync()
+				serializable_objs = load(img_name) or []
+				self._replace(img_name, _to_rows(img_name, serializable_objs), fingerprints[img_name])
+		return len(stale) + len(removed)
+
+	def n_images(self) -> int:
+		"""Number of images indexed, with or without objects."""
+		return self._query_one('SELECT COUNT(*) FROM images')
+
+	def n_images_with_objects(self, score_threshold: float = None) -> int:
+		where, params = _where(score_threshold=score_threshold)
+		return self._query_one(f'SELECT COUNT(DISTINCT img_name) FROM objects {where}', params)
+
+	def class_distribution(self, img_name: str = None, score_threshold: float = None) -> dict[str, int]:
+		"""Number of objects of each class, on all the images or on one.
+		With a score_threshold, only the ones with a higher confidence."""
+		where, params = _where(img_name, score_threshold)
+		with self._lock:
+			rows = self._conn.execute(f'SELECT classname, COUNT(*) FROM objects {where} GROUP BY classname', params).fetchall()
+		return dict(rows)
+
+	def close(self):
+		self._conn.close()
+
+	def _replace(self, img_name: str, rows: list[tuple], fingerprint: str):
+		self._conn.execute('DELETE FROM objects WHERE img_name = ?', (img_name,))
+		self._conn.execute('INSERT OR REPLACE INTO images (img_name, fingerprint) VALUES (?, ?)', (img_name, fingerprint))
+		self._conn.executemany('INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+	def _query_one(self, sql: str, params: tuple = ()):
+		with self._lock:
+			return self._conn.execute(sql, params).fetchone()[0]
+
+def file_fingerprint(file: Path) -> str:
+	"""Fingerprint (see MetadataIndex.sync()) of an image saved on its own
+	file: changes whenever the file is written again."""
+	stat = file.stat()
+	return f'{stat.st_mtime_ns}:{stat.st_size}'
+
+def _where(img_name: str = None, score_threshold: float = None) -> tuple[str, tuple]:
+	conditions, params = [], []
+	if img_name is not None:
+		conditions.append('img_name = ?')
+		params.append(img_name)
+	if score_threshold is not None:
+		# Mesma convenção dos managers: fica o que passa do limiar
+		conditions.append('confidence > ?')
+		params.append(score_threshold)
+
+	where = '' if len(conditions) == 0 else 'WHERE ' + ' AND '.join(conditions)
+	return where, tuple(params)
+
+def _to_rows(img_name: str, serializable_objs: list[dict]) -> list[tuple]:
+	# Import aqui porque só quem usa o índice precisa
+	from pycocotools import mask as coco_mask
+
+	rles = [obj['mask'] for obj in serializable_objs]
+	areas = coco_mask.area(rles) if len(rles) > 0 else []
+
+	rows = []
+	for obj, area in zip(serializable_objs, areas):
+		x, y, w, h = obj['bbox']
+		rows.append((img_name, obj['classname'], obj.get('confidence'), float(area), x, y, w, h))
+	return rows
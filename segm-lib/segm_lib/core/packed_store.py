@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+	import fcntl
+except ImportError:
+	# Windows: sem lock, então só um processo pode escrever por vez
+	fcntl = None
+
+DATA_MAGIC = b'SEGMPACK'
+INDEX_MAGIC = b'SEGMPIDX'
+# Magic + number of sorted entries
+INDEX_HEADER_SIZE = 16
+# Hash of the name, where its record starts on the data file and its size
+INDEX_DTYPE = np.dtype([('key', '<u8'), ('offset', '<u8'), ('length', '<u8')])
+# Appended entries are only searched linearly. Past this many, the index
+# is sorted again on the next put().
+MAX_UNSORTED_ENTRIES = 4096
+
+
+class PackedStore:
+	"""Many small JSON documents, one per image, packed in a single file
+	instead of one file each.
+
+	Two files are used: <pack_file>, where the records are appended, each
+	being the image name and its document, and <pack_file>.idx, the offset
+	of the last record of each image. The index is a table of fixed-size
+	entries sorted by the hash of the name, so it's memory-mapped and
+	searched in place, without being loaded. Entries of records appended
+	after it was last sorted go after the sorted ones, and are sorted in
+	once there are enough of them.
+
+	Saving an image again appends a new record, and the old one is only
+	dropped by compact(). Several processes can put() on the same store at
+	the same time (a file lock serializes the appends), and each of them
+	sees what the others saved.
+	"""
+
+	def __init__(self, pack_file: Path):
+		"""
+		Args:
+			pack_file (Path): data file. It's created, with its index,
+				if it doesn't exist.
+		"""
+		self.pack_file = pack_file
+		self.index_file = pack_file.with_name(pack_file.name + '.idx')
+
+		if not pack_file.exists():
+			pack_file.parent.mkdir(parents=True, exist_ok=True)
+			with pack_file.open('xb') as f:
+				f.write(DATA_MAGIC)
+			_write_index(self.index_file, np.empty(0, dtype=INDEX_DTYPE))
+		elif not self.index_file.exists():
+			raise FileNotFoundError(f'Index of "{pack_file}" not found: "{self.index_file}"')
+
+		self._data = pack_file.open('rb')
+		if self._data.read(len(DATA_MAGIC)) != DATA_MAGIC:
+			raise ValueError(f'"{pack_file}" is not a packed store')
+		# The index file, and its (inode, size) when it was last read
+		self._index = None
+		self._index_stat = None
+		self._refresh_index()
+
+	def get(self, name: str) -> list | dict | None:
+		"""The document saved for the image, or None if there isn't one."""
+		entry = self._find(name)
+		if entry is None:
+			return None
+
+		record = self._read(int(entry['offset']), int(entry['length']))
+		record_name, _, document = record.partition(b'\0')
+		if record_name.decode('utf-8') != name:
+			# Dois nomes com o mesmo hash de 64 bits: put() não deixa acontecer
+			raise ValueError(f'Corrupted index on "{self.pack_file}": "{name}" points to "{record_name.decode()}"')
+		return json.loads(document)
+
+	def put(self, name: str, document: list | dict):
+		"""Saves the document of an image, replacing the previous one."""
+		record = name.encode('utf-8') + b'\0' + _encode(document)
+		with self._lock() as data_file:
+			self._refresh_index()
+			entry = self._find(name)
+			if entry is not None:
+				self._check_name(entry, name)
+
+			# O registro antes da entrada no índice: se parar no meio,
+			# sobra um registro que ninguém aponta, e não o contrário
+			offset = data_file.seek(0, os.SEEK_END)
+			data_file.write(record)
+			data_file.flush()
+
+			new_entry = np.array([(_key(name), offset, len(record))], dtype=INDEX_DTYPE)
+			if len(self._unsorted) >= MAX_UNSORTED_ENTRIES:
+				_write_index(self.index_file, _live_entries(self._sorted, np.concatenate([self._unsorted, new_entry])))
+			else:
+				with self.index_file.open('ab') as f:
+					f.write(new_entry.tobytes())
+
+	def __contains__(self, name: str) -> bool:
+		return self._find(name) is not None
+
+	def __len__(self) -> int:
+		self._refresh_index()
+		return len(_live_entries(self._sorted, self._unsorted))
+
+	def names(self) -> list[str]:
+		"""Names of all the images saved, in no particular order."""
+		return [name for name, _ in self._named_entries()]
+
+	def fingerprints(self) -> dict[str, str]:
+		"""Where the current record of each image is on the data file. It
+		changes whenever the image is saved again (and on compact())."""
+		return {name: _fingerprint(entry) for name, entry in self._named_entries()}
+
+	def fingerprint(self, name: str) -> str | None:
+		"""Same as fingerprints(), for a single image."""
+		entry = self._find(name)
+		return None if entry is None else _fingerprint(entry)
+
+	def compact(self):
+		"""Rewrites the data file without the records that were replaced,
+		and sorts the whole index. No other process may be using the store
+		meanwhile."""
+		with self._lock():
+			self._refresh_index()
+			entries = _live_entries(self._sorted, self._unsorted)
+			# Na ordem do arquivo, pra ler sequencialmente
+			entries = entries[np.argsort(entries['offset'], kind='stable')]
+
+			tmp_file = self.pack_file.with_name(self.pack_file.name + '.tmp')
+			new_entries = entries.copy()
+			with tmp_file.open('wb') as f:
+				f.write(DATA_MAGIC)
+				for i, entry in enumerate(entries):
+					new_entries['offset'][i] = f.tell()
+					f.write(self._read(int(entry['offset']), int(entry['length'])))
+
+			os.replace(tmp_file, self.pack_file)
+			_write_index(self.index_file, new_entries)
+
+			self._data.close()
+			self._data = self.pack_file.open('rb')
+			self._refresh_index()
+
+	def close(self):
+		self._data.close()
+		self._index.close()
+		self._sorted = self._unsorted = None
+
+	def _named_entries(self) -> list[tuple[str, np.void]]:
+		self._refresh_index()
+		named_entries = []
+		for entry in _live_entries(self._sorted, self._unsorted):
+			# Só o começo do registro, até o fim do nome
+			offset, length = int(entry['offset']), int(entry['length'])
+			chunk_size = min(length, 256)
+			chunk = self._read(offset, chunk_size)
+			while b'\0' not in chunk and chunk_size < length:
+				chunk_size = min(length, chunk_size * 4)
+				chunk = self._read(offset, chunk_size)
+			named_entries.append((chunk.partition(b'\0')[0].decode('utf-8'), entry))
+
+		return named_entries
+
+	def _find(self, name: str) -> np.void | None:
+		self._refresh_index()
+		key = _key(name)
+
+		# Os do fim são mais novos que os ordenados
+		matches = np.flatnonzero(self._unsorted['key'] == key)
+		if len(matches) > 0:
+			return self._unsorted[matches[-1]]
+
+		i = np.searchsorted(self._sorted_keys, key)
+		if i < len(self._sorted_keys) and self._sorted_keys[i] == key:
+			return self._sorted[i]
+		return None
+
+	def _check_name(self, entry: np.void, name: str):
+		record_name = self._read(int(entry['offset']), int(entry['length'])).partition(b'\0')[0].decode('utf-8')
+		if record_name != name:
+			raise ValueError(f'"{name}" and "{record_name}" have the same hash, they cannot be on the same store')
+
+	def _read(self, offset: int, length: int) -> bytes:
+		self._data.seek(offset)
+		return self._data.read(length)
+
+	def _refresh_index(self):
+		# Outro processo pode ter adicionado entradas, ou reescrito o índice.
+		# A parte ordenada só muda quando o arquivo é trocado, então só ela
+		# é mapeada. As adicionadas depois, que são poucas, ficam na memória.
+		stat = os.stat(self.index_file)
+		if self._index_stat is not None and stat.st_ino == self._index_stat[0]:
+			if stat.st_size > self._index_stat[1]:
+				self._unsorted = np.concatenate([self._unsorted, self._read_entries(self._index_stat[1], stat.st_size)])
+				self._index_stat = (stat.st_ino, stat.st_size)
+			return
+
+		if self._index is not None:
+			self._index.close()
+		self._index = self.index_file.open('rb')
+		header = self._index.read(INDEX_HEADER_SIZE)
+		if header[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+			raise ValueError(f'"{self.index_file}" is not the index of a packed store')
+		n_sorted = int.from_bytes(header[len(INDEX_MAGIC):], 'little')
+
+		if n_sorted == 0:
+			# Não dá pra mapear um arquivo vazio
+			self._sorted = np.empty(0, dtype=INDEX_DTYPE)
+		else:
+			self._sorted = np.memmap(self._index, dtype=INDEX_DTYPE, mode='r', offset=INDEX_HEADER_SIZE, shape=(n_sorted,))
+		self._sorted_keys = self._sorted['key']
+		sorted_end = INDEX_HEADER_SIZE + n_sorted * INDEX_DTYPE.itemsize
+		self._unsorted = self._read_entries(sorted_end, stat.st_size)
+		self._index_stat = (stat.st_ino, stat.st_size)
+
+	def _read_entries(self, start: int, end: int) -> np.ndarray:
+		# Só entradas inteiras: outro processo pode estar no meio de uma
+		end = start + (end - start) // INDEX_DTYPE.itemsize * INDEX_DTYPE.itemsize
+		self._index.seek(start)
+		return np.frombuffer(self._index.read(end - start), dtype=INDEX_DTYPE)
+
+	@contextmanager
+	def _lock(self):
+		# Yields the data file, open for appending
+		with self.pack_file.open('ab') as f:
+			if fcntl is None:
+				yield f
+				return
+
+			fcntl.flock(f, fcntl.LOCK_EX)
+			try:
+				yield f
+			finally:
+				fcntl.flock(f, fcntl.LOCK_UN)
+
+def pack_dir(json_dir: Path, pack_file: Path) -> int:
+	"""Packs a directory with one JSON file per image (the layout of
+	SingleModelPredManager and AnnManager) into a PackedStore.
+
+	Returns:
+		int: number of images packed.
+	"""
+	store = PackedStore(pack_file)
+	n_images = 0
+	for json_file in json_dir.glob('*.json'):
+		with json_file.open('r') as f:
+			document = json.load(f)
+		store.put(json_file.stem, document)
+		n_images += 1
+	store.close()
+
+	return n_images
+
+def unpack(pack_file: Path, json_dir: Path) -> int:
+	"""The inverse of pack_dir(): writes one JSON file per image.
+
+	Returns:
+		int: number of images unpacked.
+	"""
+	store = PackedStore(pack_file)
+	json_dir.mkdir(parents=True, exist_ok=True)
+	names = store.names()
+	for name in names:
+		with (json_dir / f'{name}.json').open('w') as f:
+			json.dump(store.get(name), f, indent=4)
+	store.close()
+
+	return len(names)
+
+def _encode(document: list | dict) -> bytes:
+	return json.dumps(document, separators=(',', ':')).encode('utf-8')
+
+def _key(name: str) -> np.uint64:
+	return np.uint64(int.from_bytes(hashlib.blake2b(name.encode('utf-8'), digest_size=8).digest(), 'little'))
+
+def _fingerprint(entry: np.void) -> str:
+	return f'{int(entry["offset"])}:{int(entry["length"])}'
+
+def _live_entries(sorted_entries: np.ndarray, unsorted_entries: np.ndarray) -> np.ndarray:
+	# The last entry of each name, sorted by key
+	if len(unsorted_entries) == 0:
+		return np.array(sorted_entries)
+
+	# np.unique fica com a primeira ocorrência, então inverte
+	reversed_entries = np.concatenate([sorted_entries, unsorted_entries])[::-1]
+	_, first = np.unique(reversed_entries['key'], return_index=True)
+	return reversed_entries[first]
+
+def _write_index(index_file: Path, entries: np.ndarray):
+	# Sorted, so every entry is searched by bisection. Written to another
+	# file and renamed, so readers never see half of it.
+	entries = np.sort(entries, order='key')
+	tmp_file = index_file.with_name(index_file.name + '.tmp')
+	with tmp_file.open('wb') as f:
+		f.write(INDEX_MAGIC + len(entries).to_bytes(8, 'little'))
+		f.write(entries.tobytes())
+	os.replace(tmp_file, index_file)
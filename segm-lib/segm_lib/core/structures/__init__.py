@@ -1,2 +1,8 @@
+from segm_lib.lazy_import import lazy_exports
 from .annotation import Annotation
-from .prediction import Prediction
\ No newline at end of file
+from .prediction import Prediction
+
+# CroppedMask needs torch
+__getattr__ = lazy_exports(__name__, {
+	'CroppedMask': '.cropped_mask',
+})
\ No newline at end of file
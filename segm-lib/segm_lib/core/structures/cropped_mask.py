@@ -0,0 +1,72 @@
+import torch
+
+
+class CroppedMask:
+	"""Binary mask stored only inside a region of the image (usually the
+	object's bounding box), so small objects on big images don't cost
+	H x W bytes each.
+
+	Has the following fields:
+		"mask": torch.BoolTensor, (h, w), the mask inside the region
+		"x": int, left of the region on the image
+		"y": int, top of the region on the image
+		"img_size": tuple, (H, W) of the whole image
+	"""
+	def __init__(self, mask: torch.BoolTensor, x: int, y: int, img_size: tuple[int, int]):
+		self.mask = mask
+		self.x = x
+		self.y = y
+		self.img_size = img_size
+
+	@classmethod
+	def from_full(cls, bin_mask: torch.BoolTensor, box: list[int]) -> 'CroppedMask':
+		"""Crops a full image mask.
+
+		Args:
+			bin_mask (torch.BoolTensor): (H, W) mask.
+			box (list[int]): [x1, y1, x2, y2] region to keep, x2 and y2
+				exclusive. Clipped to the image.
+
+		Returns:
+			CroppedMask: copy of the region, so the full mask can be freed.
+		"""
+		h, w = bin_mask.shape
+		x1, y1, x2, y2 = box
+		x1, x2 = max(0, min(x1, w)), max(0, min(x2, w))
+		y1, y2 = max(0, min(y1, h)), max(0, min(y2, h))
+		x2, y2 = max(x1, x2), max(y1, y2)
+
+		return cls(bin_mask[y1:y2, x1:x2].clone(), x1, y1, (h, w))
+
+	@classmethod
+	def from_full_masks(cls, bin_masks: torch.BoolTensor) -> list['CroppedMask']:
+		"""Crops each mask of a (N,H,W) stack to its own bounding box."""
+		boxes = mask_boxes(bin_masks).int().tolist()
+		return [cls.from_full(bin_mask, [x1, y1, x2 + 1, y2 + 1]) for bin_mask, (x1, y1, x2, y2) in zip(bin_masks, boxes)]
+
+	def to_full(self) -> torch.BoolTensor:
+		full = torch.zeros(self.img_size, dtype=torch.bool)
+		h, w = self.mask.shape
+		full[self.y:self.y + h, self.x:self.x + w] = self.mask
+		return full
+
+def mask_boxes(bin_masks: torch.BoolTensor) -> torch.Tensor:
+	"""[x1, y1, x2, y2] boxes (inclusive, in pixels) of a (N,H,W) stack
+	of masks, computed from the projections of the masks on the rows and
+	columns, all at once. Empty masks get an all zeros box."""
+	n, h, w = bin_masks.shape
+	if n == 0:
+		return torch.zeros((0, 4))
+
+	rows = bin_masks.any(dim=2)
+	cols = bin_masks.any(dim=1)
+	# argmax returns the first max, so the first row/column with
+	# something, and, on the flipped projection, the last one
+	y1 = rows.byte().argmax(dim=1)
+	y2 = h - 1 - rows.flip(1).byte().argmax(dim=1)
+	x1 = cols.byte().argmax(dim=1)
+	x2 = w - 1 - cols.flip(1).byte().argmax(dim=1)
+
+	boxes = torch.stack([x1, y1, x2, y2], dim=1).float()
+	boxes[~rows.any(dim=1)] = 0
+	return boxes
@@ -1 +1,5 @@
-from .core import evaluate_all
\ No newline at end of file
+from segm_lib.lazy_import import lazy_exports
+
+__getattr__ = lazy_exports(__name__, {
+	'evaluate_all': '.core',
+})
\ No newline at end of file
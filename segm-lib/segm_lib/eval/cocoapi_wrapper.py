@@ -6,7 +6,6 @@ from pycocotools.coco import COCO
 from pycocotools.cocoeval import COCOeval
 
 from segm_lib.core.structures import Annotation, Prediction
-from segm_lib.core.mask_conversions import ann_to_rle
 
 class APIResults:	
 	def __init__(self, detailed: bool):
@@ -56,6 +55,9 @@ def eval(coco_anns_file: Path, coco_preds_file: Path, detailed=False) -> APIResu
 		if detailed:
 			list_fns_per_class = defaultdict(list)
 
+		# Só aqui, pra não importar o torch (que o mask_conversions
+		# usa) em toda avaliação
+		from segm_lib.core.mask_conversions import ann_to_rle
 		for gt_in_coco_format in ground_truth.anns.values():
 			classname = ground_truth.cats[gt_in_coco_format['category_id']]['name']
 
@@ -27,7 +27,8 @@ def evaluate_all(
 		possible_classes_dir: Path,
 		coco_ann_file: Path,
 		img_dir: Path,
-		out_dir: Path
+		out_dir: Path,
+		score_threshold: float = None
 		):
 	out_dir.mkdir(parents=True, exist_ok=True)
 
@@ -44,7 +45,9 @@ def evaluate_all(
 	print('done')
 
 	print("Normalizing class names... ", end='', flush=True)
-	pred_manager = MultiModelPredManager(eval_pred_dir)
+	# Com score_threshold, as cópias já ficam só com as predições acima
+	# dele, então o resto da avaliação não precisa saber do limiar
+	pred_manager = MultiModelPredManager(eval_pred_dir, score_threshold)
 	pred_manager.normalize_classnames()
 	ann_manager = AnnManager(eval_ann_dir)
 	ann_manager.normalize_classnames()
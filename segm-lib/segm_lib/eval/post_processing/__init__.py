@@ -1,2 +1,6 @@
-from .plot_tps import plot_tps_fps_fns
-from .group_by_img import group_results_by_img
\ No newline at end of file
+from segm_lib.lazy_import import lazy_exports
+
+__getattr__ = lazy_exports(__name__, {
+	'plot_tps_fps_fns': '.plot_tps',
+	'group_results_by_img': '.group_by_img',
+})
\ No newline at end of file
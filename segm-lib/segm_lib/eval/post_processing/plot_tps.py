@@ -1,17 +1,22 @@
 from enum import Enum
+from functools import cache
 from pathlib import Path
 
 from segm_lib.core.structures import Annotation, Prediction
-from segm_lib.plot.detectron_plot_lib import DetectronPlotLib
 
 from ..structures.eval_results import EvalResults
 
-detectron_plot_lib = DetectronPlotLib()
+@cache
+def _detectron_plot_lib():
+	# Criado só quando for plotar, pra não importar o detectron2
+	# (e o torch) em toda avaliação
+	from segm_lib.plot.detectron_plot_lib import DetectronPlotLib
+	return DetectronPlotLib()
 
 def plot_tps_fps_fns(img_results: EvalResults, out_file: Path, img_file: Path):
 	obj_list = _make_obj_list_to_plot(img_results)
 	colors = _assign_colors(obj_list)
-	detectron_plot_lib.plot(obj_list, img_file, out_file, colors=colors)
+	_detectron_plot_lib().plot(obj_list, img_file, out_file, colors=colors)
 
 def _make_obj_list_to_plot(img_results: EvalResults) -> list[Annotation|Prediction]:
 	objs_to_plot = []
@@ -1,2 +1,16 @@
-from .core import run_inference
-from .core import VALID_MODELS
\ No newline at end of file
+from segm_lib.lazy_import import lazy_exports
+from .predictors import DEFAULT_MODELS, VALID_MODELS
+
+__getattr__ = lazy_exports(__name__, {
+	'run_inference': '.core',
+	'compare_quantization': '.compare_quantization',
+	'sweep_input_scale': '.input_scale_sweep',
+	'ParallelConfig': '.parallel',
+	'PipelineConfig': '.pipeline',
+	'TileConfig': '.tiling',
+	'run_cascade': '.cascade',
+	'evaluate_cascade': '.cascade',
+	'EscalationRules': '.cascade',
+	'run_with_deadlines': '.slo',
+	'SloConfig': '.slo',
+})
\ No newline at end of file
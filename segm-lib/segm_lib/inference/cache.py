@@ -0,0 +1,131 @@
+import hashlib
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from segm_lib.core.managers import SingleModelPredManager
+from .img_source import ImgFiles
+from .predictors.config import get_config
+from .tiling import TileConfig
+
+
+@dataclass
+class CacheStats:
+	"""How many images were skipped for each reason.
+
+	Attributes:
+		resumed: already segmented on a previous run, with the same settings.
+		duplicates: same content as another image, the result was reused.
+		misses: had to run through the model.
+	"""
+	resumed: int = 0
+	duplicates: int = 0
+	misses: int = 0
+
+class InferenceCache:
+	"""Keeps track of which image content each prediction file on the
+	output dir came from, so runs can be resumed and identical images
+	are only segmented once.
+
+	The key of each image is a hash of (image content, model name, model
+	config from config.yaml, score threshold, tiling settings), so changing
+	any of those invalidates the previous results.
+	"""
+
+	def __init__(self, out_dir: Path, model_name: str, score_threshold: float, suffix: str = '', tiling: TileConfig = None):
+		# It's a file next to the model dirs, and not inside them, because
+		# anything inside a model dir is treated as a prediction file.
+		# The suffix is there so shards running on other machines don't
+		# write to the same file.
+		self.index_file = out_dir / f'{model_name}_cache{suffix}.json'
+		self._settings_hash = _settings_hash(model_name, score_threshold, tiling)
+
+		# img_name -> key
+		self._entries = {}
+		for index_file in sorted(out_dir.glob(f'{model_name}_cache*.json')):
+			with index_file.open('r') as f:
+				self._entries.update(json.load(f))
+
+		self._pending_entries = {}
+		# img_name -> img_name whose results it should reuse
+		self._pending_copies = {}
+
+	def plan(self, img_files: ImgFiles, model_pred_manager: SingleModelPredManager) -> tuple[list[Path], CacheStats]:
+		"""Decides which images actually need to go through the model.
+
+		Images whose predictions are already on the output dir are skipped,
+		unless they were made with different content or settings. Images
+		with the same content as another one are run only once; call
+		finish() after running the model to copy the results over to them.
+
+		Args:
+			img_files (ImgFiles): images requested.
+			model_pred_manager (SingleModelPredManager): where the model's
+				predictions are saved.
+
+		Returns:
+			list[Path]: images that need to go through the model.
+			CacheStats: how many images were skipped, and why.
+		"""
+		stats = CacheStats()
+		to_run = []
+		img_name_for_key = {}
+
+		for img_file in img_files:
+			img_name = img_file.stem
+			key = self._key(img_file)
+			self._pending_entries[img_name] = key
+
+			recorded_key = self._entries.get(img_name)
+			# If there's a prediction file with no key recorded, the previous
+			# run was probably interrupted before saving the index, so the
+			# file is trusted
+			if model_pred_manager.has_img(img_name) and recorded_key in (None, key):
+				stats.resumed += 1
+				img_name_for_key.setdefault(key, img_name)
+				continue
+
+			if key in img_name_for_key:
+				stats.duplicates += 1
+				self._pending_copies[img_name] = img_name_for_key[key]
+				continue
+
+			stats.misses += 1
+			img_name_for_key[key] = img_name
+			to_run.append(img_file)
+
+		return to_run, stats
+
+	def finish(self, model_pred_manager: SingleModelPredManager):
+		"""Copies the results to the duplicated images and saves the index.
+		Should be called after the images returned by plan() were run."""
+		for img_name, source_img_name in self._pending_copies.items():
+			model_pred_manager.save(model_pred_manager.load(source_img_name), img_name)
+
+		self._entries.update(self._pending_entries)
+		with self.index_file.open('w') as f:
+			json.dump(self._entries, f, indent=4)
+
+		self._pending_entries = {}
+		self._pending_copies = {}
+
+	def _key(self, img_file: Path) -> str:
+		content_hash = hashlib.sha256()
+		with img_file.open('rb') as f:
+			for chunk in iter(lambda: f.read(1 << 20), b''):
+				content_hash.update(chunk)
+
+		return hashlib.sha256(f'{content_hash.hexdigest()}-{self._settings_hash}'.encode('utf-8')).hexdigest()
+
+def _settings_hash(model_name: str, score_threshold: float, tiling: TileConfig = None) -> str:
+	settings = {
+		'model': model_name,
+		# The "-onnx" models use the settings of the PyTorch ones
+		'config': get_config().get(model_name.removesuffix('-onnx'), {}),
+		'score_threshold': score_threshold,
+	}
+	# Só quando tem, pra não invalidar o que já foi rodado sem tiles
+	if tiling is not None:
+		settings['tiling'] = asdict(tiling)
+	settings_str = json.dumps(settings, sort_keys=True)
+	return hashlib.sha256(settings_str.encode('utf-8')).hexdigest()
@@ -0,0 +1,356 @@
+import json
+from collections import Counter
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from tqdm import tqdm
+
+from .img_source import ImgFiles
+from .predictors.prediction import Prediction
+from .runner import MODEL_MAP, batches_by_aspect_ratio, compact_predictions, forward, get_img_files, load_models
+from segm_lib.core.managers import MultiModelPredManager
+
+# From the cheapest to the most expensive
+DEFAULT_CASCADE = ['yolact', 'maskrcnn']
+# Name of the directory (and "model", for the eval) with the final predictions
+CASCADE_NAME = 'cascade'
+
+
+@dataclass
+class EscalationRules:
+	"""When the predictions of a model are not trusted, and the image is
+	sent to the next model of the cascade.
+
+	Attributes:
+		min_max_confidence: escalates if the most confident prediction is
+			below this.
+		near_threshold_margin: predictions with confidence up to this much
+			above the model's score threshold are "uncertain".
+		max_uncertain: escalates if there are more uncertain predictions
+			than this.
+		max_objects: escalates crowded scenes, with more predictions than this.
+		escalate_empty: whether images with no predictions at all escalate.
+			The cheap model often misses everything on hard images.
+	"""
+	min_max_confidence: float = 0.7
+	near_threshold_margin: float = 0.1
+	max_uncertain: int = 2
+	max_objects: int = 20
+	escalate_empty: bool = True
+
+def escalation_reason(predictions: list[Prediction], rules: EscalationRules, score_threshold: float) -> str | None:
+	"""Why the predictions of a model on an image should not be trusted.
+
+	Args:
+		predictions (list[Prediction]): output of the model for the image.
+		rules (EscalationRules): when to escalate.
+		score_threshold (float): score threshold of the model.
+
+	Returns:
+		str | None: "empty", "low_confidence", "uncertain" or "crowded", or
+			None if the predictions are good enough.
+	"""
+	if len(predictions) == 0:
+		return 'empty' if rules.escalate_empty else None
+
+	if max(p.confidence for p in predictions) < rules.min_max_confidence:
+		return 'low_confidence'
+
+	n_uncertain = sum(1 for p in predictions if p.confidence <= score_threshold + rules.near_threshold_margin)
+	if n_uncertain > rules.max_uncertain:
+		return 'uncertain'
+
+	if len(predictions) > rules.max_objects:
+		return 'crowded'
+
+	return None
+
+def run_cascade(
+		img_file_or_dir: Path,
+		out_dir: Path,
+		models: list[str] = None,
+		rules: EscalationRules = None,
+		batch_size: int = 1,
+		extensions: list[str] = None,
+		recursive: bool = False,
+		) -> dict:
+	"""Runs a cascade of models: every image goes through the first one,
+	and only the images where its predictions are not trusted (see
+	EscalationRules) go through the next, and so on. The final predictions
+	of each image are the ones of the last model it went through.
+
+	Saved on out_dir:
+		cascade/: the final predictions (a SingleModelPredManager dir).
+		<model>/: predictions of each model, only on the images it ran on.
+		cascade-report.json: the report that is returned.
+
+	Args:
+		img_file_or_dir (Path): images to segment, see run_inference().
+		out_dir (Path): directory to save the outputs.
+		models (list[str], optional): models of the cascade, from the
+			cheapest to the most expensive. Defaults to DEFAULT_CASCADE.
+		rules (EscalationRules, optional): when to escalate. Defaults to
+			EscalationRules().
+		batch_size (int, optional): see run_inference(). Defaults to 1.
+		extensions (list[str], optional): see run_inference().
+		recursive (bool, optional): see run_inference().
+
+	Returns:
+		dict: how many images each model ran on and why they escalated,
+			the escalation rate and mean forward time of each model, and
+			the compute saved compared with running only the last model
+			on every image. Since the last model didn't run on every
+			image, that is estimated from its mean forward time.
+
+	Raises:
+		ValueError: if an invalid model name was given, or less than two.
+		ImportError: if one of the requested models is not installed properly.
+		FileNotFoundError: if no images were found on the provided path.
+	"""
+	models = DEFAULT_CASCADE if models is None else models
+	rules = EscalationRules() if rules is None else rules
+	if len(models) < 2:
+		raise ValueError(f'A cascade needs at least two models, got {models}')
+
+	load_models(models)
+	img_files = get_img_files(img_file_or_dir, extensions=extensions, recursive=recursive)
+	pred_manager = MultiModelPredManager(out_dir)
+
+	print(f'Running {len(img_files)} images on the cascade {" -> ".join(models)}...')
+	forward_seconds = _run_stages(img_files, models, rules, batch_size, pred_manager)
+
+	report = _report(models, rules, len(img_files), forward_seconds)
+	with (out_dir / 'cascade-report.json').open('w') as f:
+		json.dump(report, f, indent=4)
+	print('\n' + _to_out_str(report))
+
+	return report
+
+def evaluate_cascade(
+		img_dir: Path,
+		ann_dir: Path,
+		possible_classes_dir: Path,
+		coco_ann_file: Path,
+		out_dir: Path,
+		models: list[str] = None,
+		rules: EscalationRules = None,
+		batch_size: int = 1,
+		) -> dict:
+	"""Runs the cascade (see run_cascade()), then the last model on the
+	images it didn't get, and evaluates both with segm_lib.eval, to compare
+	the cascade with always running the expensive model.
+
+	Saved on out_dir, besides what run_cascade() saves:
+		<last model>/: now with the predictions for every image.
+		eval/: output of evaluate_all() for the first model, the last one
+			and the cascade.
+		cascade-report.json: the report that is returned.
+
+	Args:
+		img_dir (Path): directory of the images to segment (.jpg).
+		ann_dir (Path): annotations of those images, in segm_lib format.
+		possible_classes_dir (Path): list of possible classes for each model.
+			The cascade can predict any class of its models.
+		coco_ann_file (Path): original annotations, in COCO format.
+		out_dir (Path): directory to save the outputs.
+		models (list[str], optional): see run_cascade().
+		rules (EscalationRules, optional): see run_cascade().
+		batch_size (int, optional): see run_inference(). Defaults to 1.
+
+	Returns:
+		dict: the report of run_cascade(), with the compute saved measured
+			instead of estimated, and the AP of the cascade, of its first
+			model and of its last one.
+
+	Raises:
+		ValueError: if an invalid model name was given, or less than two.
+		ImportError: if one of the requested models is not installed properly.
+		FileNotFoundError: if no images were found on img_dir.
+	"""
+	# Import aqui porque o eval é pesado, e só é usado por isso
+	from segm_lib.eval import evaluate_all
+
+	models = DEFAULT_CASCADE if models is None else models
+	report = run_cascade(img_dir, out_dir, models, rules, batch_size)
+
+	first_model, last_model = models[0], models[-1]
+	pred_manager = MultiModelPredManager(out_dir)
+	last_manager = pred_manager.get_manager(last_model)
+	missing = [f for f in get_img_files(img_dir) if not last_manager.has_img(f.stem)]
+	print(f'\n\nRunning {last_model} on the {len(missing)} images that did not escalate, for comparison...')
+	baseline_seconds = report['forward_seconds'][last_model] + _run_all(missing, last_model, batch_size, pred_manager)
+
+	report['always_last_model_seconds'] = baseline_seconds
+	report['always_last_model_estimated'] = False
+	report['compute_saved'] = _compute_saved(report['cascade_seconds'], baseline_seconds)
+
+	# Só o que é comparável: o primeiro e o último modelo rodaram em todas
+	# as imagens, os do meio não
+	eval_inputs_dir = out_dir / 'eval_inputs'
+	eval_pred_dir, eval_possible_classes_dir = eval_inputs_dir / 'preds', eval_inputs_dir / 'possible_classes'
+	eval_pred_dir.mkdir(parents=True, exist_ok=True)
+	eval_possible_classes_dir.mkdir(parents=True, exist_ok=True)
+	cascade_classes = set()
+	for model_name in models:
+		with (possible_classes_dir / f'{model_name}.json').open('r') as f:
+			model_classes = json.load(f)
+		cascade_classes.update(model_classes)
+		if model_name in [first_model, last_model]:
+			_link(eval_pred_dir / model_name, out_dir / model_name)
+			with (eval_possible_classes_dir / f'{model_name}.json').open('w') as f:
+				json.dump(model_classes, f)
+	_link(eval_pred_dir / CASCADE_NAME, out_dir / CASCADE_NAME)
+	with (eval_possible_classes_dir / f'{CASCADE_NAME}.json').open('w') as f:
+		json.dump(sorted(cascade_classes), f)
+
+	print('\n\nEvaluating...')
+	eval_dir = out_dir / 'eval'
+	evaluate_all(eval_pred_dir, ann_dir, eval_possible_classes_dir, coco_ann_file, img_dir, eval_dir)
+	report['AP'] = {}
+	for name in [CASCADE_NAME, first_model, last_model]:
+		with (eval_dir / name / 'results-on-dataset.json').open('r') as f:
+			report['AP'][name] = json.load(f)['AP']
+	report['AP_change'] = report['AP'][CASCADE_NAME] - report['AP'][last_model]
+
+	with (out_dir / 'cascade-report.json').open('w') as f:
+		json.dump(report, f, indent=4)
+	print('\n' + _to_out_str(report))
+
+	return report
+
+def _run_stages(
+		img_files: ImgFiles,
+		models: list[str],
+		rules: EscalationRules,
+		batch_size: int,
+		pred_manager: MultiModelPredManager
+		) -> dict[str, tuple[int, float, Counter]]:
+	# Returns, for each model, on how many images it ran, the seconds
+	# spent on its forward passes and why the images it ran escalated
+	predictors = {model_name: MODEL_MAP[model_name]() for model_name in models}
+	model_managers = {model_name: pred_manager.get_manager(model_name) for model_name in models}
+	cascade_manager = pred_manager.get_manager(CASCADE_NAME)
+	results = {model_name: (0, 0.0, Counter()) for model_name in models}
+
+	with tqdm(total=len(img_files)) as progress_bar:
+		for batch in batches_by_aspect_ratio(img_files, batch_size):
+			pending = [(img_file, img) for img_file, img, _ in batch]
+
+			for i, model_name in enumerate(models):
+				predictor = predictors[model_name]
+				predictions_per_img, batch_time, _ = forward(predictor, [img for _, img in pending])
+
+				is_last = i == len(models) - 1
+				escalated, reasons = [], Counter()
+				for (img_file, img), predictions in zip(pending, predictions_per_img):
+					reason = None if is_last else escalation_reason(predictions, rules, predictor.score_threshold)
+
+					compact_preds = compact_predictions(predictions)
+					model_managers[model_name].save(compact_preds, img_file.stem)
+					if reason is None:
+						cascade_manager.save(compact_preds, img_file.stem)
+					else:
+						reasons[reason] += 1
+						escalated.append((img_file, img))
+
+				n_imgs, seconds, model_reasons = results[model_name]
+				results[model_name] = (n_imgs + len(pending), seconds + batch_time, model_reasons + reasons)
+
+				pending = escalated
+				if len(pending) == 0:
+					break
+
+			progress_bar.update(len(batch))
+
+	return results
+
+def _run_all(img_files: list[Path], model_name: str, batch_size: int, pred_manager: MultiModelPredManager) -> float:
+	# Runs a model on all the images, returning the seconds spent on
+	# the forward passes
+	if len(img_files) == 0:
+		return 0.0
+
+	predictor = MODEL_MAP[model_name]()
+	model_manager = pred_manager.get_manager(model_name)
+	forward_seconds = 0.0
+	with tqdm(total=len(img_files)) as progress_bar:
+		for batch in batches_by_aspect_ratio(img_files, batch_size):
+			predictions_per_img, batch_time, _ = forward(predictor, [img for _, img, _ in batch])
+			forward_seconds += batch_time
+			for (img_file, _, _), predictions in zip(batch, predictions_per_img):
+				model_manager.save(compact_predictions(predictions), img_file.stem)
+			progress_bar.update(len(batch))
+
+	return forward_seconds
+
+def _report(models: list[str], rules: EscalationRules, n_images: int, results: dict[str, tuple[int, float, Counter]]) -> dict:
+	n_imgs_per_model = {model_name: results[model_name][0] for model_name in models}
+	seconds_per_model = {model_name: results[model_name][1] for model_name in models}
+	cascade_seconds = sum(seconds_per_model.values())
+
+	# Sem rodar o último modelo em todas as imagens, o custo dele é
+	# estimado pelo tempo médio nas imagens que ele rodou
+	last_model = models[-1]
+	always_last_seconds = None
+	if n_imgs_per_model[last_model] > 0:
+		always_last_seconds = seconds_per_model[last_model] / n_imgs_per_model[last_model] * n_images
+
+	return {
+		'models': models,
+		'rules': asdict(rules),
+		'n_images': n_images,
+		'n_images_per_model': n_imgs_per_model,
+		# Fraction of the images each model ran on that went to the next one
+		'escalation_rate': {
+			model_name: n_imgs_per_model[next_model] / n_imgs_per_model[model_name] if n_imgs_per_model[model_name] > 0 else 0.0
+			for model_name, next_model in zip(models, models[1:])
+		},
+		'escalation_reasons': {model_name: dict(results[model_name][2]) for model_name in models[:-1]},
+		'forward_ms': {
+			model_name: seconds_per_model[model_name] / n_imgs_per_model[model_name] * 1000 if n_imgs_per_model[model_name] > 0 else None
+			for model_name in models
+		},
+		'forward_seconds': seconds_per_model,
+		'cascade_seconds': cascade_seconds,
+		'always_last_model_seconds': always_last_seconds,
+		'always_last_model_estimated': True,
+		'compute_saved': _compute_saved(cascade_seconds, always_last_seconds),
+	}
+
+def _compute_saved(cascade_seconds: float, always_last_seconds: float | None) -> float | None:
+	# Fraction of the time of always running the last model
+	if always_last_seconds is None or always_last_seconds <= 0:
+		return None
+	return 1 - cascade_seconds / always_last_seconds
+
+def _link(link: Path, target: Path):
+	# O evaluate_all copia o pred_dir, seguindo os links
+	if link.is_symlink() or link.exists():
+		link.unlink()
+	link.symlink_to(target.resolve(), target_is_directory=True)
+
+def _to_out_str(report: dict) -> str:
+	models = report['models']
+	out_str = f"{'Modelo'.ljust(10)} {'Imagens'.ljust(10)} {'Escalou'.ljust(10)} {'Forward (ms)'.ljust(14)} Motivos\n"
+	for model_name in models:
+		n_imgs = report['n_images_per_model'][model_name]
+		rate = report['escalation_rate'].get(model_name)
+		rate = '-' if rate is None else f'{rate:.1%}'
+		forward_ms = report['forward_ms'][model_name]
+		forward_ms = '-' if forward_ms is None else f'{forward_ms:.1f}'
+		reasons = ', '.join(f'{k}: {v}' for k, v in report['escalation_reasons'].get(model_name, {}).items())
+		out_str += f'{model_name.ljust(10)} {str(n_imgs).ljust(10)} {rate.ljust(10)} {forward_ms.ljust(14)} {reasons}\n'
+
+	compute_saved = report['compute_saved']
+	estimated = ' (estimado)' if report['always_last_model_estimated'] else ''
+	compute_saved = '-' if compute_saved is None else f'{compute_saved:.1%}{estimated}'
+	out_str += f'\nTempo economizado em relação a rodar só o {models[-1]}: {compute_saved}\n'
+
+	if 'AP' in report:
+		ap = report['AP']
+		out_str += (
+			f"AP: cascata {ap[CASCADE_NAME]:.4f}, {models[0]} {ap[models[0]]:.4f}, {models[-1]} {ap[models[-1]]:.4f} "
+			f"(variação {report['AP_change']:+.4f})\n"
+		)
+
+	return out_str
@@ -0,0 +1,70 @@
+import json
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from segm_lib.core.structures.prediction import Prediction
+
+
+class InferenceClient:
+	"""Client for a running inference.server.InferenceServer."""
+
+	def __init__(self, url: str, timeout: float = 600.0):
+		"""
+		Args:
+			url (str): address of the server, like "http://127.0.0.1:8765".
+			timeout (float, optional): seconds to wait for each response.
+				Defaults to 600, since the server may be busy with other clients.
+		"""
+		self.url = url.rstrip('/')
+		self.timeout = timeout
+
+	def models(self) -> list[str]:
+		"""Models the server has loaded.
+
+		Raises:
+			ConnectionError: if the server can't be reached.
+		"""
+		return self._request('/health')['models']
+
+	def metrics(self) -> dict:
+		"""Queue depth and latency metrics of the server, see InferenceServer."""
+		return self._request('/metrics')
+
+	def predict(self, img_file: Path, model_name: str) -> tuple[list[Prediction], dict[str, float], tuple[int, int]]:
+		"""Segments one image on the server. The image is sent as a path,
+		so it must be readable by the server.
+
+		Args:
+			img_file (Path): image to segment.
+			model_name (str): one of the models the server has loaded.
+
+		Returns:
+			list[Prediction]: objects detected on the image, with RLE masks.
+			dict[str, float]: seconds the server spent on each stage.
+			tuple[int, int]: height and width of the image.
+
+		Raises:
+			ConnectionError: if the server can't be reached.
+			RuntimeError: if the server failed to segment the image.
+		"""
+		body = {'model': model_name, 'img_file': str(img_file.resolve())}
+		response = self._request('/predict', body)
+
+		predictions = [Prediction.from_serializable(p) for p in response['predictions']]
+		return predictions, response['timings'], tuple(response['img_size'])
+
+	def _request(self, path: str, body: dict = None) -> dict:
+		data = None if body is None else json.dumps(body).encode('utf-8')
+		request = urllib.request.Request(self.url + path, data=data, headers={'Content-Type': 'application/json'})
+		try:
+			with urllib.request.urlopen(request, timeout=self.timeout) as response:
+				return json.loads(response.read())
+		except urllib.error.HTTPError as e:
+			try:
+				error = json.loads(e.read())['error']
+			except (ValueError, KeyError):
+				error = str(e)
+			raise RuntimeError(f'Inference server error on {path}: {error}') from e
+		except urllib.error.URLError as e:
+			raise ConnectionError(f'Could not reach the inference server at "{self.url}"') from e
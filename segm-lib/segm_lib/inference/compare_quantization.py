@@ -0,0 +1,83 @@
+import json
+from pathlib import Path
+
+from .evaluated_runs import run_and_evaluate
+
+# run name: quantize
+RUNS = {'fp32': False, 'int8': True}
+
+
+def compare_quantization(
+		img_dir: Path,
+		ann_dir: Path,
+		possible_classes_dir: Path,
+		coco_ann_file: Path,
+		out_dir: Path,
+		models: list[str] = None,
+		batch_size: int = 1,
+		) -> dict:
+	"""Runs each model with and without int8 dynamic quantization on the
+	same images, evaluates both runs with segm_lib.eval and reports the
+	AP change next to the speedup.
+
+	Saved on out_dir:
+		fp32/, int8/, eval/: see evaluated_runs.run_and_evaluate().
+		quantization-comparison.json: the report that is returned.
+
+	Args:
+		img_dir (Path): directory of the images to segment (.jpg).
+		ann_dir (Path): annotations of those images, in segm_lib format.
+		possible_classes_dir (Path): list of possible classes for each model.
+		coco_ann_file (Path): original annotations, in COCO format.
+		out_dir (Path): directory to save the outputs.
+		models (list[str], optional): models to compare. By default, DEFAULT_MODELS.
+		batch_size (int, optional): see run_inference(). Defaults to 1.
+
+	Returns:
+		dict: for each model, the AP, mean forward time (ms) and images
+			per second of each run, the AP change and the speedup of the
+			forward pass. "quantized" is False for models that have no
+			layers that can be quantized, which run in fp32 both times.
+
+	Raises:
+		ValueError: if an invalid model name was given.
+		ImportError: if one of the requested models is not installed properly.
+		FileNotFoundError: if no images were found on img_dir.
+	"""
+	runs = {run_name: {'quantize': quantize} for run_name, quantize in RUNS.items()}
+	results = run_and_evaluate(runs, img_dir, ann_dir, possible_classes_dir, coco_ann_file, out_dir, models, batch_size)
+
+	report = {}
+	for model_name in results['fp32']:
+		fp32, int8 = results['fp32'][model_name], results['int8'][model_name]
+		report[model_name] = {
+			'quantized': int8['quantized'],
+			'fp32': {k: fp32[k] for k in ['AP', 'forward_ms', 'imgs_per_second']},
+			'int8': {k: int8[k] for k in ['AP', 'forward_ms', 'imgs_per_second']},
+			'AP_change': int8['AP'] - fp32['AP'],
+			'speedup': fp32['forward_ms'] / int8['forward_ms'] if int8['forward_ms'] > 0 else None,
+		}
+
+	with (out_dir / 'quantization-comparison.json').open('w') as f:
+		json.dump(report, f, indent=4)
+	print('\n' + _to_out_str(report))
+
+	return report
+
+def _to_out_str(report: dict) -> str:
+	out_str = (
+		f"{'Modelo'.ljust(10)} {'AP fp32'.ljust(10)} {'AP int8'.ljust(10)} {'Variação'.ljust(10)} "
+		f"{'Forward fp32 (ms)'.ljust(20)} {'Forward int8 (ms)'.ljust(20)} Speedup\n"
+	)
+	for model_name, results in report.items():
+		fp32, int8 = results['fp32'], results['int8']
+		speedup = '-' if results['speedup'] is None else f"{results['speedup']:.2f}x"
+		if not results['quantized']:
+			speedup += ' (nada a quantizar)'
+
+		out_str += (
+			f"{model_name.ljust(10)} {fp32['AP']:<10.4f} {int8['AP']:<10.4f} {results['AP_change']:<+10.4f} "
+			f"{fp32['forward_ms']:<20.1f} {int8['forward_ms']:<20.1f} {speedup}\n"
+		)
+
+	return out_str
\ No newline at end of file
@@ -1,123 +1,702 @@
+import collections
 import datetime
+import multiprocessing
+import os
+import threading
 import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
-import cv2
 from tqdm import tqdm
 
-from .predictors import VALID_MODELS, Predictor
+from . import shared_images
+from .cache import InferenceCache
+from .client import InferenceClient
+from .img_source import ImgFiles, read_img
+from .latency import peak_rss_mb, size_bucket
+from .parallel import ParallelConfig, assign_cpus
+from .pipeline import PipelineConfig, run_pipelined
+from .predictors import DEFAULT_MODELS, Predictor
+from .predictors.config import get_score_threshold
+from .runner import MODEL_MAP, batches_by_aspect_ratio, get_img_files, import_model, load_models, run_batch, run_on_all_imgs, save_predictions
+from .sharding import ShardConfig
 from .stats_manager import StatsManager
+from .tiling import TileConfig, TiledPredictor
 from segm_lib.core.managers import MultiModelPredManager, SingleModelPredManager
-from segm_lib.core import mask_conversions
-from segm_lib.core.structures.prediction import Prediction
 
-MODEL_MAP: dict[str, type[Predictor]] = {}
+# Batches de imagens decodificadas na memória compartilhada ao mesmo
+# tempo, no modo image-major com processos
+SHARED_BATCHES_IN_FLIGHT = 4
 
-def run_inference(img_file_or_dir: Path, out_dir: Path, models: list[str] = None):
+def run_inference(
+		img_file_or_dir: Path,
+		out_dir: Path,
+		models: list[str] = None,
+		batch_size: int = 1,
+		pipeline: PipelineConfig = None,
+		parallel: ParallelConfig = None,
+		shard: ShardConfig = None,
+		resume: bool = False,
+		extensions: list[str] = None,
+		recursive: bool = False,
+		server: str = None,
+		tiling: TileConfig = None,
+		image_major: bool = False,
+		):
 	"""Runs inference on the requested imgs.
 
 	Args:
-		img_file_or_dir (Path): path to an image or dir of images to segment.
+		img_file_or_dir (Path): path to an image, dir of images or manifest
+			(.txt file with one image path per line) to segment. Images are
+			listed lazily, so huge directories don't slow down the startup.
 		out_dir (Path): directory to save the outputs.
 		models (list[str], optional): list of models to use. See
 			inference_lib.VALID_MODELS for a list of available models.
-			By default, uses all of them.
+			The ones ending in "-onnx" run on onnxruntime instead of
+			PyTorch. By default, uses DEFAULT_MODELS (or all the server
+			has loaded).
+		batch_size (int, optional): number of images to send to the model
+			in a single forward pass. Images with similar aspect ratios are
+			grouped together. Defaults to 1 (one image at a time). With a
+			server, twice this many requests are kept in flight, and the
+			server batches them up to its own max_batch_size.
+		pipeline (PipelineConfig, optional): if given, overlaps image decoding,
+			model execution and writing of the results, using the queue depths
+			and number of workers specified. Aspect ratio grouping is not done
+			in this mode. By default, runs each step one after the other.
+		parallel (ParallelConfig, optional): if given, each model runs in its
+			own worker process, with the thread count and CPU affinity
+			specified. By default, runs one model after the other.
+		shard (ShardConfig, optional): if given, only runs on the images
+			assigned to that shard, with a local pool of worker processes.
+			Stats are saved as "stats_shard-<i>-of-<N>", use
+			sharding.merge_shard_stats() to combine them once all shards
+			are done. By default, runs on all images.
+		resume (bool, optional): if True, skips images that already have
+			predictions on out_dir, made from the same image content and
+			model settings, and runs identical images only once. A report
+			of cache hits and misses is added to the stats. Defaults to False.
+		extensions (list[str], optional): image extensions to look for when
+			img_file_or_dir is a directory. Defaults to ['.jpg'].
+		recursive (bool, optional): whether to look for images in
+			subdirectories too. Defaults to False.
+		server (str, optional): address of a running inference server (see
+			inference.server), like "http://127.0.0.1:8765". If given, the
+			models are not loaded here, the images are segmented by the
+			server and only the results are saved here. Defaults to None.
+		tiling (TileConfig, optional): if given, each image is segmented in
+			overlapping tiles of that size, and the objects found on more
+			than one tile are merged (see tiling.TiledPredictor). Useful for
+			images much larger than the models' input size. By default, the
+			models see the whole image.
+		image_major (bool, optional): if True, all models are loaded at once
+			and each image is read and decoded only once, going through
+			every model before the next one is read. With parallel, each
+			model runs in its own worker process and reads the decoded
+			images from shared memory. Defaults to False (all images on
+			one model, then all images on the next).
 
 	Raises:
 		ValueError: if an invalid model name was given.
 		ImportError: if one of the requested models is not installed properly.
 		FileNotFoundError: if no images were found on the provided path.
+		ValueError: if batch_size is not positive.
+		ValueError: if both parallel and shard were given.
+		ValueError: if image_major was given along with pipeline or local
+			shard workers.
+		ValueError: if server was given along with pipeline, parallel,
+			resume, tiling, image_major or local shard workers.
+		ValueError: if a requested model is not loaded on the server.
+		ConnectionError: if the server can't be reached.
 	"""
-	requested_models = VALID_MODELS if models is None else models
-	try:
-		_load_models(requested_models)
-	except:
-		raise
+	if batch_size < 1:
+		raise ValueError(f'batch_size must be at least 1, got {batch_size}')
+	if parallel is not None and shard is not None:
+		raise ValueError('Running models in parallel and sharding cannot be combined')
+	if image_major and (pipeline is not None or (shard is not None and shard.n_local_workers > 1)):
+		raise ValueError('Image-major scheduling cannot be combined with pipeline or local workers')
+
+	if server is not None and (
+			pipeline is not None or parallel is not None or resume or tiling is not None or image_major
+			or (shard is not None and shard.n_local_workers > 1)
+			):
+		raise ValueError('Running on a server cannot be combined with pipeline, parallel, resume, tiling, image-major or local workers')
 
-	img_files = _get_img_files(img_file_or_dir)
+	if server is None:
+		client = None
+		requested_models = DEFAULT_MODELS if models is None else models
+		try:
+			load_models(requested_models)
+		except:
+			raise
+	else:
+		client = InferenceClient(server)
+		requested_models = _check_served_models(client, models)
+
+	img_files = get_img_files(img_file_or_dir, shard, extensions, recursive)
 
 	if not out_dir.exists():
 		out_dir.mkdir(parents=True)
 
-	_inference(img_files, out_dir, requested_models)
-
-def _load_models(requested_models):
-	for model_name in requested_models:
-		try:
-			_import_model(model_name)
-		except ImportError as e:
-			raise ImportError(f'"{model_name}" is implemented on the library, but not installed properly.') from e
-		except ValueError:
-			raise ValueError(f'"{model_name}" is not implemented/setted up correcly. How do you expect to run that.')
-
-def _import_model(model_name):
-	# Imports are conditional because you don't need
-	# to install all the models
-	match model_name:
-		case 'maskrcnn':
-			from .predictors.maskrcnn import Maskrcnn as model
-		case 'yolact':
-			from .predictors.yolact import Yolact as model
-		case 'solo':
-			from .predictors.solo import Solo as model
-		case other:
-			raise ValueError()
-		
-	MODEL_MAP[model_name] = model
-
-def _get_img_files(img_file_or_dir: Path) -> list[Path]:
-	if not img_file_or_dir.exists():
-		raise FileNotFoundError(f'File or dir not found: "{str(img_file_or_dir)}"')
-
-	if img_file_or_dir.is_dir():
-		# If you're gonna run on thousands of images, keeping it a generator
-		# would probably be better, but since I only use 200, it's not really
-		# relevant
-		img_files = list(img_file_or_dir.glob("*.jpg"))
-		if len(img_files) == 0:
-			raise FileNotFoundError(f'No images found on "{str(img_file_or_dir)}"')
+	if image_major:
+		_image_major_inference(img_files, out_dir, requested_models, batch_size, parallel, shard, resume, tiling)
+	elif parallel is None:
+		_inference(img_files, out_dir, requested_models, batch_size, pipeline, shard, resume, client, tiling)
 	else:
-		img_files = [img_file_or_dir]
+		_parallel_inference(img_files, out_dir, requested_models, batch_size, pipeline, parallel, resume, tiling)
 
-	return img_files
+def _new_predictor(model_name: str, tiling: TileConfig = None) -> Predictor:
+	predictor = MODEL_MAP[model_name]()
+	if tiling is not None:
+		predictor = TiledPredictor(predictor, tiling)
+	return predictor
+
+def _check_served_models(client: InferenceClient, models: list[str] = None) -> list[str]:
+	served_models = client.models()
+	if models is None:
+		return served_models
+
+	missing_models = [m for m in models if m not in served_models]
+	if len(missing_models) > 0:
+		raise ValueError(f'Models {missing_models} are not loaded on the server (only {served_models})')
+	return models
 
-def _inference(img_files: list[Path], out_dir: Path, models: list[str]):
+def _inference(
+		img_files: ImgFiles,
+		out_dir: Path,
+		models: list[str],
+		batch_size: int,
+		pipeline: PipelineConfig,
+		shard: ShardConfig = None,
+		resume: bool = False,
+		client: InferenceClient = None,
+		tiling: TileConfig = None
+		):
 	pred_manager = MultiModelPredManager(out_dir)
 	stats_manager = StatsManager()
 
 	n_images = len(img_files)
 	stats_manager.set_n_images(n_images)
-	print(f'Running {n_images} images on models {models}...')
+	if shard is None:
+		print(f'Running {n_images} images on models {models}...')
+	else:
+		print(f'Running {n_images} images ({shard.name}) on models {models}...')
 
+	start_time = time.time()
 	for model_name in models:
 		print(f'\n\n{model_name}')
 		model_pred_manager = pred_manager.get_manager(model_name)
-		total_time = _run_on_all_imgs(model_name, img_files, model_pred_manager)
+		total_time = _run_model(model_name, img_files, out_dir, model_pred_manager, stats_manager, batch_size, pipeline, shard, resume, client, tiling)
 
 		stats_manager.set_time_for_model(model_name, total_time)
+	stats_manager.set_wall_clock_time(datetime.timedelta(seconds=(time.time() - start_time)))
+
+	_save_stats(stats_manager, out_dir, shard)
+
+def _parallel_inference(
+		img_files: ImgFiles,
+		out_dir: Path,
+		models: list[str],
+		batch_size: int,
+		pipeline: PipelineConfig,
+		parallel: ParallelConfig,
+		resume: bool = False,
+		tiling: TileConfig = None
+		):
+	stats_manager = StatsManager()
+
+	n_images = len(img_files)
+	stats_manager.set_n_images(n_images)
+	cpus_per_model = assign_cpus(models, parallel)
+	print(f'Running {n_images} images on models {models}, in parallel...')
+	for model_name in models:
+		print(f'  {model_name}: CPUs {sorted(cpus_per_model[model_name])}')
+
+	# spawn ao invés de fork porque nem o torch nem os modelos
+	# gostam de ser copiados depois de inicializados
+	mp_context = multiprocessing.get_context('spawn')
+	start_time = time.time()
+	with ProcessPoolExecutor(max_workers=len(models), mp_context=mp_context) as executor:
+		futures = {}
+		for model_name in models:
+			cpus = cpus_per_model[model_name]
+			n_threads = parallel.n_threads_per_model or len(cpus)
+
+			futures[model_name] = executor.submit(
+				_model_worker, model_name, img_files, out_dir, batch_size, pipeline, n_threads, cpus, resume, tiling
+			)
+
+		for model_name, future in futures.items():
+			stats_manager.merge(future.result())
+	stats_manager.set_wall_clock_time(datetime.timedelta(seconds=(time.time() - start_time)))
 
 	stats_manager.save(out_dir)
 
-def _run_on_all_imgs(model_name: str, img_files: list[Path], model_pred_manager: SingleModelPredManager):
-	predictor = MODEL_MAP[model_name]()
+def _model_worker(
+		model_name: str,
+		img_files: ImgFiles,
+		out_dir: Path,
+		batch_size: int,
+		pipeline: PipelineConfig,
+		n_threads: int,
+		cpus: set[int],
+		resume: bool,
+		tiling: TileConfig = None
+		) -> StatsManager:
+	# Roda em outro processo, então nada do pai (tipo o MODEL_MAP)
+	# está disponível aqui
+	import torch
 
-	total_time = datetime.timedelta(seconds=0)
-	for img_file in tqdm(img_files):
-		start_time = time.time()
-		img = cv2.imread(str(img_file))
-		predictions = predictor.predict(img)
-		total_time += datetime.timedelta(seconds=(time.time() - start_time))
-
-		compact_preds = []
-		for pred in predictions:
-			compact_preds.append(Prediction(
-				pred.classname,
-				pred.confidence,
-				mask_conversions.bin_mask_to_rle(pred.mask),
-				pred.bbox
-			))
-
-		model_pred_manager.save(compact_preds, img_file.stem)
+	os.sched_setaffinity(0, cpus)
+	torch.set_num_threads(n_threads)
+	import_model(model_name)
+
+	stats_manager = StatsManager()
+	model_pred_manager = MultiModelPredManager(out_dir).get_manager(model_name)
+	total_time = _run_model(model_name, img_files, out_dir, model_pred_manager, stats_manager, batch_size, pipeline, resume=resume, tiling=tiling)
+	stats_manager.set_time_for_model(model_name, total_time)
+
+	return stats_manager
+
+def _image_major_inference(
+		img_files: ImgFiles,
+		out_dir: Path,
+		models: list[str],
+		batch_size: int,
+		parallel: ParallelConfig = None,
+		shard: ShardConfig = None,
+		resume: bool = False,
+		tiling: TileConfig = None
+		):
+	pred_manager = MultiModelPredManager(out_dir)
+	model_pred_managers = {model_name: pred_manager.get_manager(model_name) for model_name in models}
+	stats_manager = StatsManager()
+
+	n_images = len(img_files)
+	stats_manager.set_n_images(n_images)
+	shard_str = '' if shard is None else f' ({shard.name})'
+	print(f'Running {n_images} images{shard_str} on models {models}, one image at a time on all of them...')
+
+	# img_names que cada modelo ainda precisa rodar, ao retomar
+	imgs_to_run = None
+	caches = {}
+	if resume:
+		imgs_to_run = {}
+		for model_name, model_pred_manager in model_pred_managers.items():
+			caches[model_name] = _new_cache(model_name, out_dir, shard, tiling)
+			to_run, cache_stats = caches[model_name].plan(img_files, model_pred_manager)
+			imgs_to_run[model_name] = {img_file.stem for img_file in to_run}
+			stats_manager.set_cache_stats(model_name, cache_stats)
+			print(f'{model_name}: {cache_stats.resumed} already done, {cache_stats.duplicates} duplicated, {cache_stats.misses} to run')
+		img_files = [f for f in img_files if any(f.stem in img_names for img_names in imgs_to_run.values())]
+
+	start_time = time.time()
+	if len(img_files) == 0:
+		total_times = {model_name: datetime.timedelta(seconds=0) for model_name in models}
+	elif parallel is None:
+		total_times = _run_image_major(img_files, model_pred_managers, stats_manager, batch_size, imgs_to_run, tiling)
+		# Todos os modelos estão no mesmo processo
+		for model_name in models:
+			stats_manager.set_peak_rss(model_name, peak_rss_mb())
+	else:
+		total_times = _run_image_major_shared(img_files, out_dir, models, batch_size, parallel, stats_manager, imgs_to_run, tiling)
+	stats_manager.set_wall_clock_time(datetime.timedelta(seconds=(time.time() - start_time)))
+
+	for model_name, cache in caches.items():
+		cache.finish(model_pred_managers[model_name])
+	for model_name, total_time in total_times.items():
+		stats_manager.set_time_for_model(model_name, total_time)
+
+	_save_stats(stats_manager, out_dir, shard)
+
+def _run_image_major(
+		img_files: ImgFiles,
+		model_pred_managers: dict[str, SingleModelPredManager],
+		stats_manager: StatsManager,
+		batch_size: int,
+		imgs_to_run: dict[str, set[str]] = None,
+		tiling: TileConfig = None
+		) -> dict[str, datetime.timedelta]:
+	predictors = {model_name: _new_predictor(model_name, tiling) for model_name in model_pred_managers}
+	total_times = {model_name: datetime.timedelta(seconds=0) for model_name in predictors}
+
+	with tqdm(total=len(img_files)) as progress_bar:
+		for batch in batches_by_aspect_ratio(img_files, batch_size):
+			# Todos os modelos leem o mesmo buffer, então nenhum pode mexer nele
+			for _, img, _ in batch:
+				img.flags.writeable = False
+
+			for model_name, model_batch in _split_by_model(batch, list(predictors), imgs_to_run).items():
+				if len(model_batch) > 0:
+					model_pred_manager = model_pred_managers[model_name]
+					total_times[model_name] += run_batch(model_name, predictors[model_name], model_batch, model_pred_manager, stats_manager)
+
+			progress_bar.update(len(batch))
+
+	return total_times
+
+def _run_image_major_shared(
+		img_files: ImgFiles,
+		out_dir: Path,
+		models: list[str],
+		batch_size: int,
+		parallel: ParallelConfig,
+		stats_manager: StatsManager,
+		imgs_to_run: dict[str, set[str]] = None,
+		tiling: TileConfig = None
+		) -> dict[str, datetime.timedelta]:
+	cpus_per_model = assign_cpus(models, parallel)
+	for model_name in models:
+		print(f'  {model_name}: CPUs {sorted(cpus_per_model[model_name])}')
+
+	mp_context = multiprocessing.get_context('spawn')
+	work_queues = {model_name: mp_context.Queue() for model_name in models}
+	result_queue = mp_context.Queue()
+
+	workers = []
+	for model_name in models:
+		cpus = cpus_per_model[model_name]
+		n_threads = parallel.n_threads_per_model or len(cpus)
+		workers.append(mp_context.Process(
+			target=_image_major_worker,
+			args=(model_name, out_dir, n_threads, cpus, tiling, work_queues[model_name], result_queue),
+		))
+	for worker in workers:
+		worker.start()
+
+	# batch_id -> [blocos de memória compartilhada, modelos ainda rodando ele, n imagens]
+	in_flight = {}
+	total_times = {}
+
+	def handle_result():
+		kind, payload = result_queue.get()
+		match kind:
+			case 'batch_done':
+				in_flight[payload][1] -= 1
+				if in_flight[payload][1] == 0:
+					blocks, _, n_imgs = in_flight.pop(payload)
+					_free_blocks(blocks)
+					progress_bar.update(n_imgs)
+			case 'done':
+				model_name, worker_stats, total_time = payload
+				stats_manager.merge(worker_stats)
+				total_times[model_name] = total_time
+			case 'error':
+				raise RuntimeError(f'A worker failed:\n{payload}')
+
+	try:
+		with tqdm(total=len(img_files)) as progress_bar:
+			for batch_id, batch in enumerate(batches_by_aspect_ratio(img_files, batch_size)):
+				# Decodificada uma vez só aqui, e copiada pra memória
+				# compartilhada, de onde todos os workers leem
+				blocks, shared_batch = [], []
+				for img_file, img, imread_time in batch:
+					shm, handle = shared_images.share(img)
+					blocks.append(shm)
+					shared_batch.append((img_file, handle, imread_time))
+
+				batch_per_model = _split_by_model(shared_batch, models, imgs_to_run)
+				n_models = sum(1 for model_batch in batch_per_model.values() if len(model_batch) > 0)
+				in_flight[batch_id] = [blocks, n_models, len(batch)]
+				for model_name, model_batch in batch_per_model.items():
+					if len(model_batch) > 0:
+						work_queues[model_name].put((batch_id, model_batch))
+
+				while len(in_flight) >= SHARED_BATCHES_IN_FLIGHT:
+					handle_result()
+
+			for work_queue in work_queues.values():
+				work_queue.put(None)
+			while len(total_times) < len(models):
+				handle_result()
+	finally:
+		for worker in workers:
+			if worker.is_alive() and len(total_times) < len(models):
+				worker.terminate()
+			worker.join()
+		for blocks, _, _ in in_flight.values():
+			_free_blocks(blocks)
+
+	return total_times
+
+def _image_major_worker(
+		model_name: str,
+		out_dir: Path,
+		n_threads: int,
+		cpus: set[int],
+		tiling: TileConfig,
+		work_queue: multiprocessing.Queue,
+		result_queue: multiprocessing.Queue
+		):
+	# Roda em outro processo, então nada do pai (tipo o MODEL_MAP)
+	# está disponível aqui
+	try:
+		import torch
+
+		os.sched_setaffinity(0, cpus)
+		torch.set_num_threads(n_threads)
+		import_model(model_name)
+		predictor = _new_predictor(model_name, tiling)
+		model_pred_manager = MultiModelPredManager(out_dir).get_manager(model_name)
+		stats_manager = StatsManager()
+		total_time = datetime.timedelta(seconds=0)
+
+		while (item := work_queue.get()) is not None:
+			batch_id, shared_batch = item
+			attached = [shared_images.attach(handle) for _, handle, _ in shared_batch]
+			batch = [(img_file, img, imread_time) for (img_file, _, imread_time), (_, img) in zip(shared_batch, attached)]
+
+			total_time += run_batch(model_name, predictor, batch, model_pred_manager, stats_manager)
+
+			# Nenhuma referência às imagens pode sobrar antes de fechar
+			blocks = [shm for shm, _ in attached]
+			del attached, batch
+			for shm in blocks:
+				shm.close()
+			result_queue.put(('batch_done', batch_id))
+
+		stats_manager.set_peak_rss(model_name, peak_rss_mb())
+		result_queue.put(('done', (model_name, stats_manager, total_time)))
+	except Exception:
+		result_queue.put(('error', traceback.format_exc()))
+
+def _split_by_model(batch: list[tuple], models: list[str], imgs_to_run: dict[str, set[str]] = None) -> dict[str, list[tuple]]:
+	# As imagens do batch que cada modelo roda. Cada imagem foi lida uma
+	# vez só, então o tempo do imread é dividido entre os modelos que usam.
+	batch_per_model = {model_name: [] for model_name in models}
+	for img_file, img, imread_time in batch:
+		img_models = [m for m in models if imgs_to_run is None or img_file.stem in imgs_to_run[m]]
+		for model_name in img_models:
+			batch_per_model[model_name].append((img_file, img, imread_time / len(img_models)))
+
+	return batch_per_model
+
+def _free_blocks(blocks: list):
+	for shm in blocks:
+		shm.close()
+		shm.unlink()
+
+def _run_model(
+		model_name: str,
+		img_files: ImgFiles,
+		out_dir: Path,
+		model_pred_manager: SingleModelPredManager,
+		stats_manager: StatsManager,
+		batch_size: int,
+		pipeline: PipelineConfig,
+		shard: ShardConfig = None,
+		resume: bool = False,
+		client: InferenceClient = None,
+		tiling: TileConfig = None
+		) -> datetime.timedelta:
+	if resume:
+		cache = _new_cache(model_name, out_dir, shard, tiling)
+		img_files, cache_stats = cache.plan(img_files, model_pred_manager)
+		stats_manager.set_cache_stats(model_name, cache_stats)
+		print(f'{cache_stats.resumed} already done, {cache_stats.duplicates} duplicated, {cache_stats.misses} to run')
+
+	if len(img_files) == 0:
+		total_time = datetime.timedelta(seconds=0)
+	elif client is not None:
+		total_time = _run_on_server(model_name, img_files, model_pred_manager, stats_manager, client, batch_size * 2)
+	elif shard is not None and shard.n_local_workers > 1:
+		total_time = _run_local_pool(model_name, img_files, out_dir, stats_manager, batch_size, shard.n_local_workers, tiling)
+	elif pipeline is None:
+		predictor = _new_predictor(model_name, tiling)
+		total_time = run_on_all_imgs(model_name, img_files, model_pred_manager, stats_manager, batch_size, predictor)
+	else:
+		predictor = _new_predictor(model_name, tiling)
+		total_time = _run_pipelined(model_name, img_files, model_pred_manager, stats_manager, batch_size, pipeline, predictor)
+
+	if resume:
+		cache.finish(model_pred_manager)
+	stats_manager.set_peak_rss(model_name, peak_rss_mb())
+
+	return total_time
+
+def _new_cache(
+		model_name: str,
+		out_dir: Path,
+		shard: ShardConfig = None,
+		tiling: TileConfig = None
+		) -> InferenceCache:
+	return InferenceCache(
+		out_dir,
+		model_name,
+		get_score_threshold(model_name),
+		suffix='' if shard is None else f'_{shard.name}',
+		tiling=tiling,
+	)
+
+def _run_local_pool(
+		model_name: str,
+		img_files: ImgFiles,
+		out_dir: Path,
+		stats_manager: StatsManager,
+		batch_size: int,
+		n_workers: int,
+		tiling: TileConfig = None
+		) -> datetime.timedelta:
+	mp_context = multiprocessing.get_context('spawn')
+	# Limitada, pra lista de imagens ser consumida conforme os workers precisam
+	work_queue = mp_context.Queue(maxsize=n_workers * batch_size * 4)
+	result_queue = mp_context.Queue()
+
+	# Cada worker pega a(s) próxima(s) imagem(ns) assim que termina as
+	# anteriores, na ordem em que foram colocadas aqui
+	def feed():
+		for img_file in img_files:
+			work_queue.put(img_file)
+		for _ in range(n_workers):
+			work_queue.put(None)
+	feeder = threading.Thread(target=feed, daemon=True)
+
+	n_threads = max(1, len(os.sched_getaffinity(0)) // n_workers)
+	workers = []
+	for _ in range(n_workers):
+		workers.append(mp_context.Process(
+			target=_pool_worker,
+			args=(model_name, out_dir, batch_size, n_threads, work_queue, result_queue, tiling),
+		))
+
+	start_time = time.time()
+	for worker in workers:
+		worker.start()
+	feeder.start()
+
+	try:
+		n_finished = 0
+		with tqdm(total=len(img_files)) as progress_bar:
+			while n_finished < n_workers:
+				kind, payload = result_queue.get()
+				match kind:
+					case 'progress':
+						progress_bar.update(payload)
+					case 'done':
+						stats_manager.merge(payload)
+						n_finished += 1
+					case 'error':
+						raise RuntimeError(f'A worker for "{model_name}" failed:\n{payload}')
+	finally:
+		for worker in workers:
+			if worker.is_alive() and n_finished < n_workers:
+				worker.terminate()
+			worker.join()
+
+	return datetime.timedelta(seconds=(time.time() - start_time))
+
+def _pool_worker(
+		model_name: str,
+		out_dir: Path,
+		batch_size: int,
+		n_threads: int,
+		work_queue: multiprocessing.Queue,
+		result_queue: multiprocessing.Queue,
+		tiling: TileConfig = None
+		):
+	# Roda em outro processo, então nada do pai (tipo o MODEL_MAP)
+	# está disponível aqui
+	try:
+		import torch
+
+		torch.set_num_threads(n_threads)
+		import_model(model_name)
+		predictor = _new_predictor(model_name, tiling)
+		# Diretório ou .pack, o mesmo que o pai estiver usando
+		model_pred_manager = MultiModelPredManager(out_dir).get_manager(model_name)
+		stats_manager = StatsManager()
+
+		finished = False
+		while not finished:
+			batch_files = []
+			while len(batch_files) < batch_size:
+				img_file = work_queue.get()
+				if img_file is None:
+					finished = True
+					break
+				batch_files.append(img_file)
+			if len(batch_files) == 0:
+				break
+
+			batch = []
+			for img_file in batch_files:
+				start_time = time.time()
+				img = read_img(img_file)
+				batch.append((img_file, img, time.time() - start_time))
+
+			run_batch(model_name, predictor, batch, model_pred_manager, stats_manager)
+			result_queue.put(('progress', len(batch_files)))
+
+		result_queue.put(('done', stats_manager))
+	except Exception:
+		result_queue.put(('error', traceback.format_exc()))
+
+def _run_pipelined(
+		model_name: str,
+		img_files: ImgFiles,
+		model_pred_manager: SingleModelPredManager,
+		stats_manager: StatsManager,
+		batch_size: int,
+		pipeline: PipelineConfig,
+		predictor: Predictor
+		):
+
+	def save(predictions: list, img_name: str) -> dict[str, float]:
+		return save_predictions(predictions, img_name, model_pred_manager)
+
+	def on_batch(n_imgs: int, forward_time: datetime.timedelta):
+		stats_manager.add_batch_time(model_name, n_imgs, forward_time)
+
+	def on_image(timings: dict[str, float], img_size: tuple[int, int]):
+		stats_manager.add_image_timings(model_name, timings, size_bucket(*img_size))
+
+	start_time = time.time()
+	stage_times = run_pipelined(predictor, img_files, batch_size, pipeline, save, on_batch, on_image)
+	# Os estágios rodam ao mesmo tempo, então somar o tempo de cada um
+	# não faz sentido. O que interessa aqui é o tempo de parede.
 	total_time = datetime.timedelta(seconds=(time.time() - start_time))
 
-	return total_time
\ No newline at end of file
+	stats_manager.set_stage_times(model_name, stage_times)
+
+	return total_time
+
+def _run_on_server(
+		model_name: str,
+		img_files: ImgFiles,
+		model_pred_manager: SingleModelPredManager,
+		stats_manager: StatsManager,
+		client: InferenceClient,
+		n_in_flight: int
+		) -> datetime.timedelta:
+	# Várias requisições ao mesmo tempo, pro servidor poder juntar
+	# elas em batches. Os resultados são salvos na ordem das imagens.
+	in_flight = collections.deque()
+
+	def finish_oldest():
+		img_file, future = in_flight.popleft()
+		predictions, timings, img_size = future.result()
+
+		start_time = time.time()
+		model_pred_manager.save(predictions, img_file.stem)
+		timings['save'] = time.time() - start_time
+		stats_manager.add_image_timings(model_name, timings, size_bucket(*img_size))
+		progress_bar.update(1)
+
+	start_time = time.time()
+	with ThreadPoolExecutor(max_workers=n_in_flight) as executor, tqdm(total=len(img_files)) as progress_bar:
+		for img_file in img_files:
+			in_flight.append((img_file, executor.submit(client.predict, img_file, model_name)))
+			if len(in_flight) >= n_in_flight:
+				finish_oldest()
+		while len(in_flight) > 0:
+			finish_oldest()
+
+	return datetime.timedelta(seconds=(time.time() - start_time))
+
+def _save_stats(stats_manager: StatsManager, out_dir: Path, shard: ShardConfig = None):
+	if shard is None:
+		stats_manager.save(out_dir)
+	else:
+		stats_manager.save(out_dir, name=f'stats_{shard.name}')
+		stats_manager.save_raw(out_dir / f'stats_{shard.name}.raw.json')
@@ -0,0 +1,91 @@
+import json
+from pathlib import Path
+
+from .predictors import DEFAULT_MODELS
+from .runner import MODEL_MAP, get_img_files, load_models, run_on_all_imgs
+from .stats_manager import StatsManager
+from segm_lib.core.managers import MultiModelPredManager
+
+
+def run_and_evaluate(
+		runs: dict[str, dict],
+		img_dir: Path,
+		ann_dir: Path,
+		possible_classes_dir: Path,
+		coco_ann_file: Path,
+		out_dir: Path,
+		models: list[str] = None,
+		batch_size: int = 1,
+		) -> dict[str, dict[str, dict]]:
+	"""Runs the models on the same images once for each variation of the
+	predictors' settings, and evaluates each run with segm_lib.eval, to
+	compare accuracy and speed.
+
+	Saved on out_dir:
+		<run>/: predictions and stats of each run, like the out_dir of
+			run_inference().
+		eval/<run>/: output of evaluate_all() for each run.
+
+	Args:
+		runs (dict[str, dict]): name of each run, and the arguments given
+			to the predictors on it, like {"int8": {"quantize": True}}.
+		img_dir (Path): directory of the images to segment (.jpg).
+		ann_dir (Path): annotations of those images, in segm_lib format.
+		possible_classes_dir (Path): list of possible classes for each model.
+		coco_ann_file (Path): original annotations, in COCO format.
+		out_dir (Path): directory to save the outputs.
+		models (list[str], optional): models to run. By default, DEFAULT_MODELS.
+		batch_size (int, optional): see run_inference(). Defaults to 1.
+
+	Returns:
+		dict[str, dict[str, dict]]: for each run and model, the AP, the
+			mean forward time (ms, without the warmup images), the images
+			per second and whether the predictor ran quantized.
+
+	Raises:
+		ValueError: if an invalid model name was given.
+		ImportError: if one of the requested models is not installed properly.
+		FileNotFoundError: if no images were found on img_dir.
+	"""
+	# Import aqui porque o eval é pesado, e só é usado por isso
+	from segm_lib.eval import evaluate_all
+
+	models = DEFAULT_MODELS if models is None else models
+	load_models(models)
+	img_files = get_img_files(img_dir)
+
+	results = {}
+	for run_name, predictor_args in runs.items():
+		run_dir = out_dir / run_name
+		pred_manager = MultiModelPredManager(run_dir)
+		stats_manager = StatsManager()
+		stats_manager.set_n_images(len(img_files))
+
+		results[run_name] = {}
+		for model_name in models:
+			print(f'\n\n{model_name} ({run_name})')
+			predictor = MODEL_MAP[model_name](**predictor_args)
+			quantized = predictor.quantized
+
+			model_pred_manager = pred_manager.get_manager(model_name)
+			total_time = run_on_all_imgs(model_name, img_files, model_pred_manager, stats_manager, batch_size, predictor)
+			stats_manager.set_time_for_model(model_name, total_time)
+			# Pra não ter dois modelos na memória ao mesmo tempo
+			del predictor
+
+			total_seconds = total_time.total_seconds()
+			results[run_name][model_name] = {
+				'forward_ms': stats_manager.latencies_for_model[model_name]['forward'].summary()['mean'] * 1000,
+				'imgs_per_second': len(img_files) / total_seconds if total_seconds > 0 else 0.0,
+				'quantized': quantized,
+			}
+		stats_manager.save(run_dir)
+
+		print(f'\n\nEvaluating the {run_name} run...')
+		eval_dir = out_dir / 'eval' / run_name
+		evaluate_all(run_dir, ann_dir, possible_classes_dir, coco_ann_file, img_dir, eval_dir)
+		for model_name in models:
+			with (eval_dir / model_name / 'results-on-dataset.json').open('r') as f:
+				results[run_name][model_name]['AP'] = json.load(f)['AP']
+
+	return results
\ No newline at end of file
@@ -0,0 +1,111 @@
+import os
+from pathlib import Path
+from typing import Iterator
+
+import cv2
+import numpy as np
+
+DEFAULT_EXTENSIONS = ['.jpg']
+MANIFEST_EXTENSION = '.txt'
+
+
+class ImgSource:
+	"""Lazily lists the images to segment, without keeping all the paths
+	in memory. Can be iterated more than once (once per model, for example).
+
+	The images can come from:
+		* a single image file;
+		* a directory, optionally with subdirectories. Since predictions are
+		  saved by file name (without the extension), names must be unique
+		  across subdirectories;
+		* a manifest: a .txt file with one image path per line. Relative
+		  paths are relative to the manifest's directory.
+	"""
+
+	def __init__(self, img_file_or_dir: Path, extensions: list[str] = None, recursive: bool = False):
+		"""
+		Args:
+			img_file_or_dir (Path): image, directory of images or manifest.
+			extensions (list[str], optional): extensions to look for in
+				directories, case-insensitive. Defaults to DEFAULT_EXTENSIONS.
+			recursive (bool, optional): whether to look into subdirectories.
+				Defaults to False.
+
+		Raises:
+			FileNotFoundError: if the path doesn't exist.
+		"""
+		if not img_file_or_dir.exists():
+			raise FileNotFoundError(f'File or dir not found: "{str(img_file_or_dir)}"')
+
+		self.path = img_file_or_dir
+		extensions = DEFAULT_EXTENSIONS if extensions is None else extensions
+		self.extensions = tuple(e.lower() if e.startswith('.') else f'.{e.lower()}' for e in extensions)
+		self.recursive = recursive
+		self._count = None
+
+	@property
+	def is_manifest(self) -> bool:
+		return self.path.is_file() and self.path.suffix.lower() == MANIFEST_EXTENSION
+
+	def __iter__(self) -> Iterator[Path]:
+		if self.is_manifest:
+			return self._iter_manifest()
+		elif self.path.is_dir():
+			return (Path(p) for p in self._iter_dir(str(self.path)))
+		else:
+			return iter([self.path])
+
+	def __len__(self) -> int:
+		# Only counts the names, without creating Paths or calling stat(),
+		# so it's fast even on huge directories. Computed once, since the
+		# directory isn't expected to change during a run.
+		if self._count is None:
+			if self.is_manifest:
+				self._count = sum(1 for _ in self._iter_manifest_lines())
+			elif self.path.is_dir():
+				self._count = sum(1 for _ in self._iter_dir(str(self.path)))
+			else:
+				self._count = 1
+
+		return self._count
+
+	def is_empty(self) -> bool:
+		return next(iter(self), None) is None
+
+	def _iter_dir(self, dir_path: str) -> Iterator[str]:
+		with os.scandir(dir_path) as entries:
+			for entry in entries:
+				if entry.is_dir(follow_symlinks=False):
+					if self.recursive:
+						yield from self._iter_dir(entry.path)
+				elif entry.name.lower().endswith(self.extensions):
+					yield entry.path
+
+	def _iter_manifest(self) -> Iterator[Path]:
+		base_dir = self.path.parent
+		for line in self._iter_manifest_lines():
+			img_file = Path(line)
+			yield img_file if img_file.is_absolute() else base_dir / img_file
+
+	def _iter_manifest_lines(self) -> Iterator[str]:
+		with self.path.open('r') as f:
+			for line in f:
+				line = line.strip()
+				if line != '' and not line.startswith('#'):
+					yield line
+
+def read_img(img_file: Path) -> np.ndarray:
+	"""Reads an image in BGR, like cv2.imread().
+
+	Raises:
+		FileNotFoundError: if the file doesn't exist or can't be decoded.
+			cv2.imread() returns None in both cases, which would only fail
+			later, without the path.
+	"""
+	img = cv2.imread(str(img_file))
+	if img is None:
+		raise FileNotFoundError(f'Could not read image "{str(img_file)}"')
+	return img
+
+# Anything that can be iterated more than once and has a len()
+ImgFiles = ImgSource | list[Path]
@@ -0,0 +1,89 @@
+import json
+from pathlib import Path
+
+from .evaluated_runs import run_and_evaluate
+from .predictors.input_size import InputSize
+
+DEFAULT_SCALES = [1.0, 0.75, 0.5]
+
+
+def sweep_input_scale(
+		img_dir: Path,
+		ann_dir: Path,
+		possible_classes_dir: Path,
+		coco_ann_file: Path,
+		out_dir: Path,
+		scales: list[float] = None,
+		max_side: int = None,
+		models: list[str] = None,
+		batch_size: int = 1,
+		) -> dict:
+	"""Runs each model at several input resolutions (see InputSize) on
+	the same images, evaluates each run with segm_lib.eval and reports
+	the throughput next to the AP, to pick an operating point.
+
+	Saved on out_dir:
+		scale-<scale>/, eval/: see evaluated_runs.run_and_evaluate().
+		input-scale-sweep.json: the report that is returned.
+
+	Args:
+		img_dir (Path): directory of the images to segment (.jpg).
+		ann_dir (Path): annotations of those images, in segm_lib format.
+		possible_classes_dir (Path): list of possible classes for each model.
+		coco_ann_file (Path): original annotations, in COCO format.
+		out_dir (Path): directory to save the outputs.
+		scales (list[float], optional): scales to run, relative to each
+			model's default resolution. Defaults to [1.0, 0.75, 0.5].
+		max_side (int, optional): max side of the model input, the same
+			on all runs. By default, no limit.
+		models (list[str], optional): models to run. By default, DEFAULT_MODELS.
+		batch_size (int, optional): see run_inference(). Defaults to 1.
+
+	Returns:
+		dict: for each model and scale, the AP, mean forward time (ms),
+			images per second and speedup of the forward pass relative to
+			the first scale.
+
+	Raises:
+		ValueError: if an invalid model name was given.
+		ImportError: if one of the requested models is not installed properly.
+		FileNotFoundError: if no images were found on img_dir.
+	"""
+	scales = DEFAULT_SCALES if scales is None else scales
+	runs = {f'scale-{scale}': {'input_size': InputSize(scale, max_side)} for scale in scales}
+	results = run_and_evaluate(runs, img_dir, ann_dir, possible_classes_dir, coco_ann_file, out_dir, models, batch_size)
+
+	report = {}
+	first_run = next(iter(runs))
+	for model_name in results[first_run]:
+		baseline_forward_ms = results[first_run][model_name]['forward_ms']
+		report[model_name] = {}
+		for scale, run_name in zip(scales, runs):
+			run_results = results[run_name][model_name]
+			report[model_name][str(scale)] = {
+				'AP': run_results['AP'],
+				'forward_ms': run_results['forward_ms'],
+				'imgs_per_second': run_results['imgs_per_second'],
+				'speedup': baseline_forward_ms / run_results['forward_ms'] if run_results['forward_ms'] > 0 else None,
+			}
+
+	with (out_dir / 'input-scale-sweep.json').open('w') as f:
+		json.dump(report, f, indent=4)
+	print('\n' + _to_out_str(report))
+
+	return report
+
+def _to_out_str(report: dict) -> str:
+	out_str = (
+		f"{'Modelo'.ljust(10)} {'Escala'.ljust(8)} {'AP'.ljust(10)} {'Imagens/s'.ljust(12)} "
+		f"{'Forward (ms)'.ljust(14)} Speedup\n"
+	)
+	for model_name, results_per_scale in report.items():
+		for scale, results in results_per_scale.items():
+			speedup = '-' if results['speedup'] is None else f"{results['speedup']:.2f}x"
+			out_str += (
+				f"{model_name.ljust(10)} {scale.ljust(8)} {results['AP']:<10.4f} {results['imgs_per_second']:<12.2f} "
+				f"{results['forward_ms']:<14.1f} {speedup}\n"
+			)
+
+	return out_str
\ No newline at end of file
@@ -0,0 +1,151 @@
+import datetime
+import math
+import resource
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+# Stages timed for each image, in the order they happen. queue_wait is
+# only there when running through the inference server.
+STAGES = ['imread', 'queue_wait', 'forward', 'postprocess', 'bin_mask_to_rle', 'save']
+# Stages that don't depend on the model, left out of its time per size bucket
+NON_MODEL_STAGES = ['imread', 'queue_wait']
+# Smallest size bucket, in megapixels
+MIN_SIZE_BUCKET_MP = 0.125
+
+
+class LatencyHistogram:
+	"""Latency histogram with logarithmic buckets.
+
+	Percentiles are accurate within half a bucket (~2.5%), and two histograms
+	can be merged just by adding up the counts, so the results of
+	different runs, workers or shards can be combined without having
+	to keep every single sample.
+	"""
+	GROWTH = 1.05
+	MIN_SECONDS = 1e-6
+
+	def __init__(self):
+		self.counts = defaultdict(int)
+		self.n = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def add(self, seconds: float):
+		self.counts[self._bucket(seconds)] += 1
+		self.n += 1
+		self.total += seconds
+		self.max = max(self.max, seconds)
+
+	def merge(self, other: 'LatencyHistogram'):
+		for bucket, count in other.counts.items():
+			self.counts[bucket] += count
+		self.n += other.n
+		self.total += other.total
+		self.max = max(self.max, other.max)
+
+	def percentile(self, p: float) -> float:
+		"""Returns the latency (in seconds) below which p% of the samples are."""
+		if self.n == 0:
+			return 0.0
+
+		target = math.ceil(self.n * p / 100)
+		seen = 0
+		for bucket in sorted(self.counts):
+			seen += self.counts[bucket]
+			if seen >= target:
+				return min(self._midpoint(bucket), self.max)
+
+		return self.max
+
+	def summary(self) -> dict[str, float]:
+		return {
+			'count': self.n,
+			'mean': self.total / self.n if self.n > 0 else 0.0,
+			'p50': self.percentile(50),
+			'p90': self.percentile(90),
+			'p99': self.percentile(99),
+			'max': self.max,
+		}
+
+	def to_dict(self) -> dict:
+		return {
+			'counts': {str(b): c for b, c in self.counts.items()},
+			'n': self.n,
+			'total': self.total,
+			'max': self.max,
+		}
+
+	@classmethod
+	def from_dict(cls, d: dict) -> 'LatencyHistogram':
+		histogram = cls()
+		for bucket, count in d['counts'].items():
+			histogram.counts[int(bucket)] = count
+		histogram.n = d['n']
+		histogram.total = d['total']
+		histogram.max = d['max']
+		return histogram
+
+	def _bucket(self, seconds: float) -> int:
+		if seconds < self.MIN_SECONDS:
+			return 0
+		return int(math.log(seconds / self.MIN_SECONDS) / math.log(self.GROWTH)) + 1
+
+	def _midpoint(self, bucket: int) -> float:
+		if bucket == 0:
+			return self.MIN_SECONDS / 2
+		# geometric mean of the bucket's edges, since they grow geometrically
+		return self.MIN_SECONDS * self.GROWTH ** (bucket - 0.5)
+
+@dataclass
+class StageTimes:
+	"""How long a stage spent working and how long it spent waiting
+	on the other stages (empty input queue or full output queue)."""
+	busy: datetime.timedelta = field(default_factory=datetime.timedelta)
+	stalled: datetime.timedelta = field(default_factory=datetime.timedelta)
+
+@dataclass
+class DeadlineStats:
+	"""How many images met their deadline in the latency-SLO mode (see
+	inference.slo), and which model variant ran on them."""
+	hits: int = 0
+	misses: int = 0
+	# Images that didn't run on the preferred variant
+	fallbacks: int = 0
+	runs_per_variant: dict[str, int] = field(default_factory=dict)
+
+	def add(self, variant: str, hit: bool, fallback: bool):
+		if hit:
+			self.hits += 1
+		else:
+			self.misses += 1
+		if fallback:
+			self.fallbacks += 1
+		self.runs_per_variant[variant] = self.runs_per_variant.get(variant, 0) + 1
+
+	def merge(self, other: 'DeadlineStats'):
+		self.hits += other.hits
+		self.misses += other.misses
+		self.fallbacks += other.fallbacks
+		for variant, n in other.runs_per_variant.items():
+			self.runs_per_variant[variant] = self.runs_per_variant.get(variant, 0) + n
+
+def size_bucket(h: int, w: int) -> str:
+	"""Size bucket of an image, for the latency estimates: the next power
+	of two of its area in megapixels, like "0.5MP" or "4MP"."""
+	megapixels = h * w / 1e6
+	upper = MIN_SIZE_BUCKET_MP
+	while upper < megapixels:
+		upper *= 2
+	return f'{upper:g}MP'
+
+def bucket_megapixels(bucket: str) -> float:
+	"""The inverse of size_bucket(): the upper area of the bucket."""
+	return float(bucket.removesuffix('MP'))
+
+def peak_rss_mb() -> float:
+	"""Peak resident memory of this process, or of its largest child
+	process, whichever is bigger."""
+	# ru_maxrss is in KB on Linux
+	self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+	return max(self_rss, children_rss) / 1024
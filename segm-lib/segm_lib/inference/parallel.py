@@ -0,0 +1,71 @@
+import os
+from dataclasses import dataclass
+
+
+@dataclass
+class ParallelConfig:
+	"""Settings for running each model in its own worker process.
+
+	Attributes:
+		n_threads_per_model: torch intra-op threads for each worker. By
+			default, each worker gets as many threads as CPUs assigned to it.
+		cpu_affinity: CPUs each model is allowed to run on. Models not listed
+			here get an even share of the CPUs that weren't assigned to anyone.
+	"""
+	n_threads_per_model: int = None
+	cpu_affinity: dict[str, set[int]] = None
+
+def assign_cpus(models: list[str], config: ParallelConfig) -> dict[str, set[int]]:
+	"""Decides which CPUs each model will run on.
+
+	Args:
+		models (list[str]): models that will run in parallel.
+		config (ParallelConfig): user-specified settings.
+
+	Returns:
+		dict[str, set[int]]: CPUs for each model.
+	"""
+	explicit = config.cpu_affinity or {}
+	available_cpus = sorted(os.sched_getaffinity(0))
+
+	taken = set().union(*explicit.values()) if len(explicit) > 0 else set()
+	free_cpus = [c for c in available_cpus if c not in taken]
+	models_without_cpus = [m for m in models if m not in explicit]
+
+	cpus_per_model = {m: set(explicit[m]) for m in models if m in explicit}
+	if len(models_without_cpus) == 0:
+		return cpus_per_model
+
+	if len(free_cpus) < len(models_without_cpus):
+		# Not enough CPUs to give each model its own, so they share
+		# everything that's left (or everything, if nothing is left)
+		shared = set(free_cpus) if len(free_cpus) > 0 else set(available_cpus)
+		for model in models_without_cpus:
+			cpus_per_model[model] = shared
+		return cpus_per_model
+
+	share = len(free_cpus) // len(models_without_cpus)
+	for i, model in enumerate(models_without_cpus):
+		start = i * share
+		# the last one takes whatever is left from the division
+		end = (i + 1) * share if i < len(models_without_cpus) - 1 else len(free_cpus)
+		cpus_per_model[model] = set(free_cpus[start:end])
+
+	return cpus_per_model
+
+def parse_cpu_list(cpu_list: str) -> set[int]:
+	"""Parses a CPU list in the same format as taskset, e.g. "0-3,6".
+
+	Raises:
+		ValueError: if the list is malformed.
+	"""
+	cpus = set()
+	for part in cpu_list.split(','):
+		part = part.strip()
+		if '-' in part:
+			first, last = part.split('-')
+			cpus.update(range(int(first), int(last) + 1))
+		else:
+			cpus.add(int(part))
+
+	return cpus
@@ -0,0 +1,209 @@
+import datetime
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+from tqdm import tqdm
+
+from .img_source import ImgFiles, read_img
+from .latency import StageTimes
+from .predictors import Predictor
+
+
+@dataclass
+class PipelineConfig:
+	"""Settings for the pipelined execution mode.
+
+	Attributes:
+		n_decode_workers: threads used to read and decode the images.
+		decode_queue_depth: max number of decoded images waiting for the model.
+		write_queue_depth: max number of predictions waiting to be encoded
+			and written to disk.
+	"""
+	n_decode_workers: int = 2
+	decode_queue_depth: int = 16
+	write_queue_depth: int = 16
+
+# Marks the end of a queue
+_DONE = None
+
+def run_pipelined(
+		predictor: Predictor,
+		img_files: ImgFiles,
+		batch_size: int,
+		config: PipelineConfig,
+		save_fn: Callable[[list, str], dict[str, float]],
+		on_batch: Callable[[int, datetime.timedelta], None] = None,
+		on_image: Callable[[dict[str, float], tuple[int, int]], None] = None,
+		) -> dict[str, StageTimes]:
+	"""Runs the predictor on all images, overlapping image decoding,
+	model execution and writing of the results.
+
+	The three stages are:
+		decode: a thread pool reads the images and feeds a bounded queue.
+		model: runs on the calling thread, in batches of batch_size.
+		write: a background thread encodes and saves the predictions.
+
+	Args:
+		predictor (Predictor): model to run.
+		img_files (ImgFiles): images to segment.
+		batch_size (int): number of images per forward pass.
+		config (PipelineConfig): queue depths and number of decode workers.
+		save_fn (Callable): called on the write thread as
+			save_fn(predictions, img_name) for each image. Should return
+			the seconds spent on each of its steps.
+		on_batch (Callable, optional): called on the model thread as
+			on_batch(n_imgs, forward_time) after each forward pass.
+		on_image (Callable, optional): called on the write thread as
+			on_image(timings, img_size) after each image is saved, with the
+			seconds spent on each stage for that image (see latency.STAGES)
+			and its (height, width).
+
+	Returns:
+		dict[str, StageTimes]: busy and stalled time for each stage.
+	"""
+	stage_times = {'decode': StageTimes(), 'model': StageTimes(), 'write': StageTimes()}
+	# The decode stage has several workers, so its busy time is
+	# updated from multiple threads
+	decode_lock = threading.Lock()
+
+	decode_queue = queue.Queue(maxsize=config.decode_queue_depth)
+	write_queue = queue.Queue(maxsize=config.write_queue_depth)
+	stop_event = threading.Event()
+	write_errors = []
+
+	def decode(img_file: Path) -> tuple[np.ndarray, float]:
+		start_time = time.time()
+		img = read_img(img_file)
+		elapsed = time.time() - start_time
+
+		with decode_lock:
+			stage_times['decode'].busy += datetime.timedelta(seconds=elapsed)
+		return img, elapsed
+
+	def feed(executor: ThreadPoolExecutor):
+		# Futures go into the queue in the same order as the files, so
+		# the model stage never has to reorder anything.
+		for img_file in img_files:
+			if stop_event.is_set():
+				return
+			future = executor.submit(decode, img_file)
+
+			start_time = time.time()
+			decode_queue.put((img_file, future))
+			stage_times['decode'].stalled += datetime.timedelta(seconds=(time.time() - start_time))
+		decode_queue.put(_DONE)
+
+	def write():
+		while True:
+			start_time = time.time()
+			item = write_queue.get()
+			stage_times['write'].stalled += datetime.timedelta(seconds=(time.time() - start_time))
+			if item is _DONE:
+				return
+
+			if len(write_errors) > 0:
+				# Keep consuming so the model stage doesn't block on a
+				# full queue, it will stop on its own.
+				continue
+
+			predictions, img_name, img_size, timings = item
+			start_time = time.time()
+			try:
+				timings |= save_fn(predictions, img_name)
+				if on_image is not None:
+					on_image(timings, img_size)
+			except Exception as e:
+				write_errors.append(e)
+				stop_event.set()
+			stage_times['write'].busy += datetime.timedelta(seconds=(time.time() - start_time))
+
+	executor = ThreadPoolExecutor(max_workers=config.n_decode_workers)
+	feeder = threading.Thread(target=feed, args=(executor,), daemon=True)
+	writer = threading.Thread(target=write, daemon=True)
+	feeder.start()
+	writer.start()
+
+	try:
+		with tqdm(total=len(img_files)) as progress_bar:
+			finished = False
+			while not finished and not stop_event.is_set():
+				batch_files, batch_imgs, imread_times, finished = _next_batch(decode_queue, batch_size, stage_times['model'])
+				if len(batch_imgs) == 0:
+					break
+
+				start_time = time.time()
+				if len(batch_imgs) == 1:
+					predictions_per_img = [predictor.predict(batch_imgs[0])]
+				else:
+					predictions_per_img = predictor.predict_batch(batch_imgs)
+				forward_time = datetime.timedelta(seconds=(time.time() - start_time))
+				stage_times['model'].busy += forward_time
+				if on_batch is not None:
+					on_batch(len(batch_imgs), forward_time)
+
+				n_imgs = len(batch_imgs)
+				postprocess_time = predictor.last_postprocess_time
+				for img_file, img, predictions, imread_time in zip(batch_files, batch_imgs, predictions_per_img, imread_times):
+					timings = {
+						'imread': imread_time,
+						'forward': (forward_time.total_seconds() - postprocess_time) / n_imgs,
+						'postprocess': postprocess_time / n_imgs,
+					}
+
+					start_time = time.time()
+					# Só o tamanho, a imagem em si não precisa ficar na fila
+					write_queue.put((predictions, img_file.stem, img.shape[:2], timings))
+					stage_times['model'].stalled += datetime.timedelta(seconds=(time.time() - start_time))
+
+				progress_bar.update(len(batch_imgs))
+	finally:
+		stop_event.set()
+		_drain(decode_queue)
+		write_queue.put(_DONE)
+		writer.join()
+		executor.shutdown(wait=True, cancel_futures=True)
+
+	if len(write_errors) > 0:
+		raise write_errors[0]
+
+	return stage_times
+
+def _next_batch(
+		decode_queue: queue.Queue,
+		batch_size: int,
+		model_times: StageTimes
+		) -> tuple[list[Path], list[np.ndarray], list[float], bool]:
+	batch_files, batch_imgs, imread_times = [], [], []
+	finished = False
+
+	while len(batch_imgs) < batch_size:
+		start_time = time.time()
+		item = decode_queue.get()
+		if item is _DONE:
+			model_times.stalled += datetime.timedelta(seconds=(time.time() - start_time))
+			finished = True
+			break
+
+		img_file, future = item
+		img, imread_time = future.result()
+		model_times.stalled += datetime.timedelta(seconds=(time.time() - start_time))
+
+		batch_files.append(img_file)
+		batch_imgs.append(img)
+		imread_times.append(imread_time)
+
+	return batch_files, batch_imgs, imread_times, finished
+
+def _drain(q: queue.Queue):
+	# Unblocks the feeder if it's waiting for space on the queue
+	while True:
+		try:
+			q.get_nowait()
+		except queue.Empty:
+			return
@@ -1,4 +1,11 @@
-from .abstract_predictor import Predictor
-from .prediction import Prediction
+from segm_lib.lazy_import import lazy_exports
 
-VALID_MODELS = ['maskrcnn', 'yolact', 'solo']
\ No newline at end of file
+VALID_MODELS = ['maskrcnn', 'yolact', 'solo', 'maskrcnn-onnx', 'yolact-onnx', 'solo-onnx']
+# Used when no models are requested. The "-onnx" ones are the same models,
+# on another backend, so there's no point in running them by default.
+DEFAULT_MODELS = ['maskrcnn', 'yolact', 'solo']
+
+__getattr__ = lazy_exports(__name__, {
+	'Predictor': '.abstract_predictor',
+	'Prediction': '.prediction',
+})
\ No newline at end of file
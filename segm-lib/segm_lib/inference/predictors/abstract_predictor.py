@@ -1,22 +1,47 @@
-
 import json
 from abc import ABC, abstractmethod
+from functools import cache
 from pathlib import Path
 
 import numpy as np
 
+from .config import DEFAULT_SCORE_THRESHOLD
+from .input_size import InputSize
 from .prediction import Prediction
 
 COCO_CLASSMAP_FILE = Path(__file__).parent / 'coco_classmap_normalized.json'
-with COCO_CLASSMAP_FILE.open('r') as f:
-	COCO_CLASSMAP = json.load(f)
-# Aqui eu quero pegar o nome dado um ID, então precisa inverter
-COCO_CLASSMAP = {str(id_): name for name, id_ in COCO_CLASSMAP.items()}
+
+@cache
+def _coco_classmap() -> dict[str, str]:
+	# Lido só na primeira vez que for usado
+	with COCO_CLASSMAP_FILE.open('r') as f:
+		classmap = json.load(f)
+	# Aqui eu quero pegar o nome dado um ID, então precisa inverter
+	return {str(id_): name for name, id_ in classmap.items()}
 
 class Predictor(ABC):
-	def __init__(self):
+	# Predictions with confidence below this are discarded. Each model
+	# sets its own from config.yaml (see config.get_score_threshold)
+	score_threshold = DEFAULT_SCORE_THRESHOLD
+	# Seconds spent converting the model output to Predictions on the last
+	# call to predict() / predict_batch(), so it can be timed separately
+	# from the forward pass
+	last_postprocess_time = 0.0
+	# Whether the model runs with int8 weights, see predictors.quantization
+	quantized = False
+
+	def __init__(self, quantize: bool = None, input_size: InputSize = None):
 		"""Initializes the model, loading weights and any other
-		configurations needed for it's execution."""
+		configurations needed for it's execution.
+
+		Args:
+			quantize (bool, optional): whether to run the model with dynamic
+				int8 quantization, if it supports it. By default, follows the
+				"quantize" setting of the model on config.yaml.
+			input_size (InputSize, optional): resolution the model runs at,
+				relative to its default one. By default, follows the
+				"input_scale" and "max_side" settings of the model on config.yaml.
+		"""
 	
 	@abstractmethod
 	def predict(self, img: np.ndarray) -> list[Prediction]:
@@ -29,7 +54,29 @@ class Predictor(ABC):
 			list[predictors.Prediction]: list of objects detected on the image.
 		"""
 		return []
-	
+
+	def predict_batch(self, imgs: list[np.ndarray]) -> list[list[Prediction]]:
+		"""Segments objects on multiple images in a single forward pass.
+
+		By default, just calls predict() for each image. Models that
+		support batched inputs should override this.
+
+		Args:
+			imgs (list[np.ndarray]): images in BGR space.
+
+		Returns:
+			list[list[predictors.Prediction]]: objects detected on each
+				image, in the same order as imgs.
+		"""
+		predictions_per_img = []
+		postprocess_time = 0.0
+		for img in imgs:
+			predictions_per_img.append(self.predict(img))
+			postprocess_time += self.last_postprocess_time
+		self.last_postprocess_time = postprocess_time
+
+		return predictions_per_img
+
 	@classmethod
 	def cocoid_to_classname(cls, id: int) -> str:
-		return COCO_CLASSMAP[str(id)]
\ No newline at end of file
+		return _coco_classmap()[str(id)]
\ No newline at end of file
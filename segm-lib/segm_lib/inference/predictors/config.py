@@ -1,7 +1,26 @@
 import importlib.resources as pkg_resources
-
-import yaml
+from functools import cache
 
 CONFIG_FILE = pkg_resources.files(__package__).joinpath('config.yaml')
-with CONFIG_FILE.open('r') as f:
-	config = yaml.safe_load(f)
\ No newline at end of file
+# For models with no "score_threshold" on config.yaml
+DEFAULT_SCORE_THRESHOLD = 0.5
+
+@cache
+def get_config() -> dict:
+	"""Settings of the models, read from config.yaml on first use."""
+	import yaml
+
+	with CONFIG_FILE.open('r') as f:
+		return yaml.safe_load(f)
+
+def get_score_threshold(model_name: str) -> float:
+	"""Confidence below which the model discards its predictions. The
+	"-onnx" models use the one of the PyTorch model."""
+	model_config = get_config().get(model_name.removesuffix('-onnx'), {})
+	return model_config.get('score_threshold', DEFAULT_SCORE_THRESHOLD)
+
+def __getattr__(name: str):
+	# "from .config import config" still works, it just reads the file then
+	if name == 'config':
+		return get_config()
+	raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
\ No newline at end of file
@@ -0,0 +1,98 @@
+import numpy as np
+import torch
+from detectron2.data import transforms as T
+from detectron2.engine import DefaultPredictor
+from detectron2.layers.mask_ops import _do_paste_mask
+from detectron2.modeling.postprocessing import detector_postprocess
+from detectron2.structures import Instances
+
+from segm_lib.core.structures import CroppedMask
+
+
+def run_batch(predictor: DefaultPredictor, imgs: list[np.ndarray], paste_masks: bool = True) -> list[Instances]:
+	"""Runs a DefaultPredictor on multiple images at once.
+
+	Args:
+		predictor (DefaultPredictor): an already initialized predictor.
+		imgs (list[np.ndarray]): images in BGR space.
+		paste_masks (bool, optional): if False, the masks are not pasted on
+			the whole image. Instead, the "roi_masks" field keeps them the
+			way the mask head outputs them, (N,1,M,M) probabilities relative
+			to each box, to be pasted with crop_masks(). Only for models
+			with a mask head, like Mask R-CNN. Defaults to True.
+
+	Returns:
+		list[Instances]: the "instances" output for each image, in the
+			same order as imgs.
+	"""
+	# O DefaultPredictor só aceita uma imagem por vez, mas o modelo
+	# por baixo aceita uma lista. Isso aqui é a mesma coisa que o
+	# __call__ dele faz, só que montando o batch inteiro:
+	#   https://github.com/facebookresearch/detectron2/blob/main/detectron2/engine/defaults.py
+	inputs = [preprocess(img, predictor.aug, predictor.input_format) for img in imgs]
+
+	with torch.no_grad():
+		if paste_masks:
+			outputs = predictor.model(inputs)
+			return [output['instances'] for output in outputs]
+
+		raw_instances_per_img = predictor.model.inference(inputs, do_postprocess=False)
+
+	return [
+		to_original_size(raw_instances, input['height'], input['width'])
+		for raw_instances, input in zip(raw_instances_per_img, inputs)
+	]
+
+def preprocess(img: np.ndarray, aug: T.Augmentation, input_format: str) -> dict:
+	"""Resizes the image the way DefaultPredictor does, to the format
+	the model expects as input.
+
+	Args:
+		img (np.ndarray): image in BGR space.
+		aug (T.Augmentation): resize of the model, like DefaultPredictor.aug.
+		input_format (str): "BGR" or "RGB", like DefaultPredictor.input_format.
+
+	Returns:
+		dict: {"image": (C,H,W) float tensor, "height": int, "width": int},
+			with the original height and width.
+	"""
+	if input_format == 'RGB':
+		img = img[:, :, ::-1]
+	height, width = img.shape[:2]
+	image = aug.get_transform(img).apply_image(img)
+	image = torch.as_tensor(image.astype('float32').transpose(2, 0, 1))
+
+	return {'image': image, 'height': height, 'width': width}
+
+def to_original_size(raw_instances: Instances, height: int, width: int) -> Instances:
+	"""Takes the output of model.inference(do_postprocess=False) back to
+	the original image size, keeping the masks as "roi_masks", to be
+	pasted with crop_masks()."""
+	# O detector_postprocess cola tudo que se chamar pred_masks na
+	# imagem inteira, mas ainda é ele que leva as caixas pra escala
+	# original e tira as vazias
+	raw_instances.roi_masks = raw_instances.pred_masks
+	raw_instances.remove('pred_masks')
+	return detector_postprocess(raw_instances, height, width)
+
+def crop_masks(instances: Instances, mask_threshold: float = 0.5) -> list[CroppedMask]:
+	"""Pastes each mask only on the region of its box, with the same
+	result as detectron2's paste_masks_in_image() on the whole image.
+
+	Args:
+		instances (Instances): output of run_batch(paste_masks=False).
+		mask_threshold (float, optional): Defaults to 0.5, same as detectron2.
+
+	Returns:
+		list[CroppedMask]: one mask per instance.
+	"""
+	img_h, img_w = instances.image_size
+	boxes = instances.pred_boxes.tensor
+	cropped_masks = []
+	for i in range(len(instances)):
+		# Com skip_empty, só a região da caixa é calculada. No CPU o
+		# paste_masks_in_image() também cola uma máscara por vez.
+		mask, (rows, cols) = _do_paste_mask(instances.roi_masks[i:i + 1], boxes[i:i + 1], img_h, img_w, skip_empty=True)
+		cropped_masks.append(CroppedMask(mask[0] >= mask_threshold, int(cols.start), int(rows.start), (img_h, img_w)))
+
+	return cropped_masks
@@ -0,0 +1,35 @@
+from dataclasses import dataclass
+
+from .config import get_config
+
+
+@dataclass
+class InputSize:
+	"""How much smaller than its default test resolution a model runs.
+
+	Each model resizes the images to its own size before the forward pass
+	(e.g. shortest side 800 for Mask R-CNN, 550x550 for YOLACT), and maps
+	the boxes and masks back to the original image size afterwards. This
+	only changes that size, so the predictions still come out on the
+	original coordinates.
+
+	Attributes:
+		scale: factor applied to the model's default sizes.
+		max_side: if given, no side of the model input goes above this,
+			in pixels.
+	"""
+	scale: float = 1.0
+	max_side: int = None
+
+	@classmethod
+	def from_config(cls, model_name: str) -> 'InputSize':
+		"""The "input_scale" and "max_side" settings of the model on config.yaml."""
+		model_config = get_config().get(model_name, {})
+		return cls(scale=model_config.get('input_scale', 1.0), max_side=model_config.get('max_side'))
+
+	def scaled(self, size: int) -> int:
+		"""One of the model's default sizes, at this scale."""
+		size = round(size * self.scale)
+		if self.max_side is not None:
+			size = min(size, self.max_side)
+		return size
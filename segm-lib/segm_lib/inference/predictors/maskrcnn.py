@@ -1,30 +1,59 @@
 
+import time
+
+import numpy as np
+import torch
 from detectron2 import model_zoo
-from detectron2.config import get_cfg
+from detectron2.config import CfgNode, get_cfg
 from detectron2.engine import DefaultPredictor
 from detectron2.structures import Instances
 
+from . import detectron_utils, quantization
 from .abstract_predictor import Predictor
+from .input_size import InputSize
 from .prediction import Prediction
-from .config import config
+from .config import config, get_score_threshold
 
 
 class Maskrcnn(Predictor):
-	def __init__(self):
-		cfg = get_cfg()
-		cfg.merge_from_file(model_zoo.get_config_file(config['maskrcnn']['config_file']))
-		cfg.MODEL.WEIGHTS = model_zoo.get_checkpoint_url(config['maskrcnn']['config_file'])
-		cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = 0.5
-		cfg.MODEL.DEVICE = 'cpu'
+	def __init__(self, quantize: bool = None, input_size: InputSize = None):
+		self.score_threshold = get_score_threshold('maskrcnn')
+		quantize = quantization.is_enabled('maskrcnn') if quantize is None else quantize
+		input_size = InputSize.from_config('maskrcnn') if input_size is None else input_size
+
+		cfg = build_cfg(self.score_threshold, input_size)
+		if quantize and quantization.has_cached_weights('maskrcnn'):
+			# Os pesos quantizados substituem tudo, não precisa baixar os originais
+			cfg.MODEL.WEIGHTS = ''
 
 		self._model = DefaultPredictor(cfg)
+		if quantize:
+			self._model.model = quantization.quantize_model(self._model.model, 'maskrcnn')
+		self.quantized = quantization.is_quantized(self._model.model)
 
 	def predict(self, img) -> list[Prediction]:
-		instances = self._model(img)['instances']
+		instances = self._run([img])[0]
 
+		start_time = time.time()
 		formatted_predictions = self._to_custom_format(instances)
+		self.last_postprocess_time = time.time() - start_time
+
+		return formatted_predictions
+
+	def predict_batch(self, imgs) -> list[list[Prediction]]:
+		instances_per_img = self._run(imgs)
+
+		start_time = time.time()
+		formatted_predictions = [self._to_custom_format(instances) for instances in instances_per_img]
+		self.last_postprocess_time = time.time() - start_time
+
 		return formatted_predictions
 
+	def _run(self, imgs: list[np.ndarray]) -> list[Instances]:
+		# Instances on the original image size, with the masks still
+		# relative to each box (see detectron_utils.run_batch)
+		return detectron_utils.run_batch(self._model, imgs, paste_masks=False)
+
 	def _to_custom_format(self, instances: Instances):
 		# Formato da saída do modelo:
 		#   https://detectron2.readthedocs.io/en/latest/tutorials/models.html#model-output-format
@@ -32,27 +61,35 @@ class Maskrcnn(Predictor):
 		# Formato esperado:
 		#   see inference_lib.predictors.base_pred
 
-		formatted_predictions = []
-		for i in range(len(instances)):
-			class_id = instances.pred_classes[i].item()
-			classname = self._id_to_name(class_id)
-
-			confidence = instances.scores[i].item()
-			
-			mask = instances.pred_masks[i]
-
-			x1, y1, x2, y2 = instances.pred_boxes.tensor[i].tolist()
-			w = x2 - x1
-			h = y2 - y1
-			bbox = [x1, y1, w, h]
-
-			formatted_predictions.append(Prediction(classname, confidence, mask, bbox))
+		# Cada campo é convertido de uma vez só, em vez de um
+		# .item()/.tolist() por objeto
+		classnames = [self._id_to_name(class_id) for class_id in instances.pred_classes.tolist()]
+		confidences = instances.scores.tolist()
+		# Cada máscara é colada só na região da sua caixa, em vez
+		# de na imagem inteira
+		masks = detectron_utils.crop_masks(instances)
+		boxes = instances.pred_boxes.tensor
+		bboxes = torch.cat([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]], dim=1).tolist()
 
-		return formatted_predictions
+		return [Prediction(*fields) for fields in zip(classnames, confidences, masks, bboxes)]
 	
 	def _id_to_name(self, class_id):
 		# Cada modelo tem sua próprio mapeamento de ID pra nome, dependendo de
 		# onde ele foi treinado. No meu caso, os três modelos seguem a mesma
 		# numeração, a do COCO, mas achei importante deixar cada modelo com o
 		# sua própria função de conversão
-		return super().cocoid_to_classname(class_id)
\ No newline at end of file
+		return super().cocoid_to_classname(class_id)
+
+def build_cfg(score_threshold: float, input_size: InputSize) -> CfgNode:
+	"""Config of the model on CPU, with the weights from the model zoo."""
+	cfg = get_cfg()
+	cfg.merge_from_file(model_zoo.get_config_file(config['maskrcnn']['config_file']))
+	cfg.MODEL.WEIGHTS = model_zoo.get_checkpoint_url(config['maskrcnn']['config_file'])
+	cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = score_threshold
+	cfg.MODEL.DEVICE = 'cpu'
+	# O detector_postprocess leva as caixas e máscaras de volta pro
+	# tamanho original, seja qual for o tamanho da entrada
+	cfg.INPUT.MIN_SIZE_TEST = input_size.scaled(cfg.INPUT.MIN_SIZE_TEST)
+	cfg.INPUT.MAX_SIZE_TEST = input_size.scaled(cfg.INPUT.MAX_SIZE_TEST)
+
+	return cfg
\ No newline at end of file
@@ -0,0 +1,72 @@
+import numpy as np
+import torch
+from detectron2.data import transforms as T
+from detectron2.engine import DefaultPredictor
+from detectron2.structures import Boxes, Instances
+
+from . import detectron_utils
+from .config import get_score_threshold
+from .input_size import InputSize
+from .maskrcnn import Maskrcnn, build_cfg
+from .onnx_runtime import OnnxGraph
+
+OUTPUT_NAMES = ['boxes', 'scores', 'classes', 'masks']
+
+
+class MaskrcnnOnnx(Maskrcnn):
+	"""Mask R-CNN running on onnxruntime instead of detectron2 (see
+	onnx_runtime.OnnxGraph). Resizing, scaling the boxes back and pasting
+	the masks are the same as Maskrcnn's."""
+
+	def __init__(self, input_size: InputSize = None):
+		self.score_threshold = get_score_threshold('maskrcnn')
+		input_size = InputSize.from_config('maskrcnn') if input_size is None else input_size
+
+		self._cfg = build_cfg(self.score_threshold, input_size)
+		# O mesmo resize que o DefaultPredictor faz
+		self._aug = T.ResizeShortestEdge(
+			[self._cfg.INPUT.MIN_SIZE_TEST, self._cfg.INPUT.MIN_SIZE_TEST], self._cfg.INPUT.MAX_SIZE_TEST
+		)
+		self._graph = OnnxGraph(
+			'maskrcnn-onnx',
+			{'score_threshold': self.score_threshold},
+			input_names=['image'],
+			output_names=OUTPUT_NAMES,
+			dynamic_axes={
+				'image': {1: 'height', 2: 'width'},
+				**{name: {0: 'n_detections'} for name in OUTPUT_NAMES},
+			},
+		)
+
+	def _run(self, imgs: list[np.ndarray]) -> list[Instances]:
+		# O grafo é exportado com uma imagem só, então cada imagem roda
+		# separada. Num batch o detectron2 também só junta o backbone.
+		instances_per_img = []
+		for img in imgs:
+			input = detectron_utils.preprocess(img, self._aug, self._cfg.INPUT.FORMAT)
+			boxes, scores, classes, masks = self._graph.run([input['image']], self._build_network)
+
+			raw_instances = Instances(
+				tuple(input['image'].shape[1:]),
+				pred_boxes=Boxes(boxes),
+				scores=scores,
+				pred_classes=classes,
+				pred_masks=masks,
+			)
+			instances_per_img.append(detectron_utils.to_original_size(raw_instances, input['height'], input['width']))
+
+		return instances_per_img
+
+	def _build_network(self) -> torch.nn.Module:
+		return _MaskrcnnNetwork(DefaultPredictor(self._cfg).model)
+
+class _MaskrcnnNetwork(torch.nn.Module):
+	# What gets exported: from the resized image to the detections on it,
+	# with the masks still relative to each box
+	def __init__(self, model: torch.nn.Module):
+		super().__init__()
+		self.model = model
+
+	def forward(self, image: torch.Tensor):
+		instances = self.model.inference([{'image': image}], do_postprocess=False)[0]
+		return instances.pred_boxes.tensor, instances.scores, instances.pred_classes, instances.pred_masks
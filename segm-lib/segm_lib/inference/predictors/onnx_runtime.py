@@ -0,0 +1,142 @@
+import hashlib
+import inspect
+import json
+import os
+from pathlib import Path
+from typing import Callable
+
+import onnxruntime
+import torch
+
+from .config import get_config
+
+DEFAULT_GRAPH_DIR = '~/.cache/segm_lib/onnx'
+DEFAULT_OPSET = 17
+
+
+class OnnxGraph:
+	"""The network of a model, exported to ONNX and run with onnxruntime's
+	CPU execution provider. Pre and post processing (resizing, NMS of some
+	models, pasting masks...) stay in Python, on the predictor.
+
+	The graph is exported the first time it runs, tracing the PyTorch
+	network on that input, and cached on disk. Later runs only need
+	onnxruntime. The cache key includes the model settings on config.yaml,
+	the settings given by the predictor, the opset and the torch version.
+
+	Settings, from the "onnx" section of config.yaml:
+		graph_dir: where the graphs are cached.
+		opset: ONNX opset to export to.
+		intra_op_num_threads: threads used inside each operator. 0 uses
+			the same number as torch (which ParallelConfig sets for each
+			worker).
+		inter_op_num_threads: threads used to run independent operators
+			at the same time. 0 or 1 runs them one after the other.
+	"""
+
+	def __init__(
+			self,
+			model_name: str,
+			settings: dict,
+			input_names: list[str],
+			output_names: list[str],
+			dynamic_axes: dict[str, dict[int, str]],
+			):
+		"""
+		Args:
+			model_name (str): name of the predictor, like "maskrcnn-onnx".
+				Its settings on config.yaml are the ones of the PyTorch model.
+			settings (dict): anything else that changes the exported graph,
+				like the score threshold, which some models have inside it.
+			input_names (list[str]): names of the inputs of the network.
+			output_names (list[str]): names of the outputs of the network,
+				in the order it returns them.
+			dynamic_axes (dict[str, dict[int, str]]): axes of each input or
+				output that can change size between runs, see torch.onnx.export().
+		"""
+		self.graph_file = _graph_file(model_name, settings)
+		self.input_names = input_names
+		self.output_names = output_names
+		self.dynamic_axes = dynamic_axes
+
+		self._session = self._create_session() if self.graph_file.exists() else None
+
+	def run(self, inputs: list[torch.Tensor], build_network: Callable[[], torch.nn.Module]) -> list[torch.Tensor]:
+		"""Runs the graph, exporting it first if it's not cached yet.
+
+		Args:
+			inputs (list[torch.Tensor]): inputs, in the order of input_names.
+			build_network (Callable[[], torch.nn.Module]): loads the PyTorch
+				network, with its weights. Only called to export it.
+
+		Returns:
+			list[torch.Tensor]: outputs, in the order of output_names.
+		"""
+		if self._session is None:
+			self._export(build_network(), inputs)
+
+		feed = {name: tensor.numpy() for name, tensor in zip(self.input_names, inputs)}
+		outputs = self._session.run(self.output_names, feed)
+		return [torch.from_numpy(output) for output in outputs]
+
+	def _export(self, network: torch.nn.Module, example_inputs: list[torch.Tensor]):
+		self.graph_file.parent.mkdir(parents=True, exist_ok=True)
+		# Exporta pra um arquivo temporário e renomeia, pra outro processo
+		# rodando o mesmo modelo nunca ler um grafo pela metade
+		tmp_file = self.graph_file.with_name(f'{self.graph_file.name}.{os.getpid()}.tmp')
+
+		# O exportador novo (dynamo), padrão nas versões recentes do torch,
+		# não lida com o controle de fluxo em Python dos modelos. Os do
+		# detectron2 são feitos pra exportar por tracing.
+		export_kwargs = {}
+		if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+			export_kwargs['dynamo'] = False
+
+		network.eval()
+		with torch.no_grad():
+			torch.onnx.export(
+				network,
+				tuple(example_inputs),
+				str(tmp_file),
+				input_names=self.input_names,
+				output_names=self.output_names,
+				dynamic_axes=self.dynamic_axes,
+				opset_version=_onnx_config().get('opset', DEFAULT_OPSET),
+				**export_kwargs,
+			)
+		os.replace(tmp_file, self.graph_file)
+
+		self._session = self._create_session()
+
+	def _create_session(self) -> onnxruntime.InferenceSession:
+		onnx_config = _onnx_config()
+		options = onnxruntime.SessionOptions()
+		options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+		options.intra_op_num_threads = onnx_config.get('intra_op_num_threads', 0) or torch.get_num_threads()
+
+		inter_op_num_threads = onnx_config.get('inter_op_num_threads', 0)
+		if inter_op_num_threads > 1:
+			options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+			options.inter_op_num_threads = inter_op_num_threads
+
+		return onnxruntime.InferenceSession(str(self.graph_file), options, providers=['CPUExecutionProvider'])
+
+def _onnx_config() -> dict:
+	return get_config().get('onnx', {})
+
+def _graph_file(model_name: str, predictor_settings: dict) -> Path:
+	# Mesma ideia dos pesos quantizados: muda o nome se muda qualquer
+	# coisa que afeta o grafo exportado. O tamanho da entrada, quando
+	# importa, vem nos predictor_settings.
+	torch_model_name = model_name.removesuffix('-onnx')
+	model_config = get_config().get(torch_model_name, {})
+	settings = {
+		'config': {k: v for k, v in model_config.items() if k not in ['quantize', 'input_scale', 'max_side']},
+		'predictor': predictor_settings,
+		'opset': _onnx_config().get('opset', DEFAULT_OPSET),
+		'torch': torch.__version__,
+	}
+	settings_hash = hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+	graph_dir = Path(_onnx_config().get('graph_dir', DEFAULT_GRAPH_DIR)).expanduser()
+	return graph_dir / f'{model_name}-{settings_hash[:16]}.onnx'
@@ -1,5 +1,9 @@
 
-import torch
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+	# Only for the type hints, CroppedMask needs torch
+	from segm_lib.core.structures import CroppedMask
 
 class Prediction():
 	"""Class representing a prediction, ONLY for inference purposes.
@@ -9,10 +13,10 @@ class Prediction():
 	Has the following fields:
 		"classname": string,
 		"confidence": float, [0,1]
-		"mask": torch.BoolTensor,
+		"mask": CroppedMask, only the region of the image around the object
 		"bbox": list, [x, y, w, h]
 	"""
-	def __init__(self, classname: str, confidence: float, mask: torch.BoolTensor, bbox: list):
+	def __init__(self, classname: str, confidence: float, mask: 'CroppedMask', bbox: list):
 		self.classname = classname
 		self.confidence = confidence
 		self.mask = mask
@@ -0,0 +1,67 @@
+import hashlib
+import json
+import warnings
+from pathlib import Path
+
+import torch
+
+from .config import get_config
+
+# Dynamic quantization only has int8 kernels for these. Conv layers would
+# need static quantization, with calibration data and quant/dequant stubs
+# around them, which the models' code doesn't have.
+QUANTIZABLE_LAYERS = {torch.nn.Linear}
+DEFAULT_WEIGHTS_DIR = '~/.cache/segm_lib/quantized'
+
+def is_enabled(model_name: str) -> bool:
+	"""Whether config.yaml asks for the model to run quantized."""
+	return get_config().get(model_name, {}).get('quantize', False)
+
+def has_cached_weights(model_name: str) -> bool:
+	"""Whether quantized weights for the model, with its current settings
+	on config.yaml, were already saved. If so, the model doesn't need to
+	load its fp32 weights before quantize_model()."""
+	return _weights_file(model_name).exists()
+
+def quantize_model(model: torch.nn.Module, model_name: str) -> torch.nn.Module:
+	"""Applies dynamic int8 quantization to the Linear layers of the
+	model, in place. Weights are quantized once and cached on disk; if
+	they already are, they're loaded onto the model, replacing whatever
+	weights it had.
+
+	Args:
+		model (torch.nn.Module): model, on CPU.
+		model_name (str): name of the model on config.yaml.
+
+	Returns:
+		torch.nn.Module: the quantized model. The same as the input if it
+			has no layers that can be quantized dynamically.
+	"""
+	if not any(isinstance(m, tuple(QUANTIZABLE_LAYERS)) for m in model.modules()):
+		warnings.warn(f'{model_name} has no layers that support dynamic quantization, it will run in fp32')
+		return model
+
+	weights_file = _weights_file(model_name)
+	model = torch.ao.quantization.quantize_dynamic(model, QUANTIZABLE_LAYERS, dtype=torch.qint8, inplace=True)
+	if weights_file.exists():
+		model.load_state_dict(torch.load(weights_file, map_location='cpu'))
+	else:
+		weights_file.parent.mkdir(parents=True, exist_ok=True)
+		torch.save(model.state_dict(), weights_file)
+
+	return model
+
+def is_quantized(model: torch.nn.Module) -> bool:
+	"""Whether quantize_model() actually changed any layer of the model."""
+	return any(isinstance(m, torch.ao.nn.quantized.dynamic.Linear) for m in model.modules())
+
+def _weights_file(model_name: str) -> Path:
+	# O nome depende da config do modelo (sem o que não muda os pesos) e
+	# da versão do torch, que muda o formato dos pesos quantizados
+	config = get_config()
+	settings = {k: v for k, v in config.get(model_name, {}).items() if k not in ['quantize', 'score_threshold', 'input_scale', 'max_side']}
+	settings['torch'] = torch.__version__
+	settings_hash = hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+	weights_dir = Path(config.get('quantized_weights_dir', DEFAULT_WEIGHTS_DIR)).expanduser()
+	return weights_dir / f'{model_name}-{settings_hash[:16]}.pt'
@@ -1,37 +1,71 @@
+import time
 from pathlib import Path
 
+import numpy as np
 import torch
 from adet.config import get_cfg
+from detectron2.config import CfgNode
 from detectron2.engine.defaults import DefaultPredictor
-from detectron2.structures import Boxes, Instances
+from detectron2.structures import Instances
 
+from segm_lib.core.structures import CroppedMask
+from segm_lib.core.structures.cropped_mask import mask_boxes
+
+from . import detectron_utils, quantization
 from .abstract_predictor import Predictor
+from .input_size import InputSize
 from .prediction import Prediction
-from .config import config
+from .config import config, get_score_threshold
 
 
 class Solo(Predictor):
-	def __init__(self):
-		cfg = get_cfg()
-		cfg.merge_from_file(str(Path(config['solo']['dir'], config['solo']['config_file'])))
-		cfg.MODEL.WEIGHTS = str(Path(config['solo']['dir'], config['solo']['weights_file']))
-		cfg.MODEL.SOLOV2.SCORE_THR = 0.5
-		cfg.MODEL.DEVICE = 'cpu'
-		cfg.SOLVER.IMS_PER_BATCH = 1 # helps reduce ram usage
+	def __init__(self, quantize: bool = None, input_size: InputSize = None):
+		self.score_threshold = get_score_threshold('solo')
+		quantize = quantization.is_enabled('solo') if quantize is None else quantize
+		input_size = InputSize.from_config('solo') if input_size is None else input_size
+
+		cfg = build_cfg(self.score_threshold, input_size)
+		if quantize and quantization.has_cached_weights('solo'):
+			# Os pesos quantizados substituem tudo, não precisa carregar os originais
+			cfg.MODEL.WEIGHTS = ''
 
 		self._model = DefaultPredictor(cfg)
+		if quantize:
+			self._model.model = quantization.quantize_model(self._model.model, 'solo')
+		self.quantized = quantization.is_quantized(self._model.model)
 
 	def predict(self, img) -> list[Prediction]:
 		instances = self._model(img)['instances']
+		instances = self._filter_low_scores(instances)
+
+		start_time = time.time()
+		formatted_predictions = self._to_custom_format(instances)
+		self.last_postprocess_time = time.time() - start_time
+
+		return formatted_predictions
+
+	def predict_batch(self, imgs) -> list[list[Prediction]]:
+		instances_per_img = self._run(imgs)
+
+		start_time = time.time()
+		formatted_predictions = []
+		for instances in instances_per_img:
+			instances = self._filter_low_scores(instances)
+			formatted_predictions.append(self._to_custom_format(instances))
+		self.last_postprocess_time = time.time() - start_time
+
+		return formatted_predictions
+
+	def _run(self, imgs: list[np.ndarray]) -> list[Instances]:
+		return detectron_utils.run_batch(self._model, imgs)
+
+	def _filter_low_scores(self, instances: Instances) -> Instances:
 		# Por algum motivo além da minha compreensão, o SOLO testa o score
 		# de classificação ANTES de ter os scores "definitivos". Isso faz
 		# com que ele retorne resultados com score abaixo do que foi solicitado.
 		# Pra consertar isso:
-		inds = (instances.scores > 0.5)
-		instances = instances[inds]
-
-		formatted_predictions = self._to_custom_format(instances)
-		return formatted_predictions
+		inds = (instances.scores > self.score_threshold)
+		return instances[inds]
 	
 	def _to_custom_format(self, instances: Instances):
 		# Formato da saída do modelo:
@@ -50,34 +84,43 @@ class Solo(Predictor):
 		# See:
 		#   https://github.com/aim-uofa/AdelaiDet/issues/469
 		#   https://github.com/aim-uofa/AdelaiDet/blob/4a3a1f7372c35b48ebf5f6adc59f135a0fa28d60/adet/modeling/solov2/solov2.py#L496
-		pred_boxes = torch.zeros(instances.pred_masks.size(0), 4)
-		for i in range(instances.pred_masks.size(0)):
-			mask = instances.pred_masks[i].squeeze()
-			ys, xs = torch.where(mask)
-			pred_boxes[i] = torch.tensor([xs.min(), ys.min(), xs.max(), ys.max()]).int()
-		instances.pred_boxes = Boxes(pred_boxes)
-
-		formatted_predictions = []
-		for i in range(len(instances)):
-			class_id = instances.pred_classes[i].item()
-			classname = self._id_to_name(class_id)
-
-			confidence = instances.scores[i].item()
-			
-			mask = instances.pred_masks[i]
-
-			x1, y1, x2, y2 = instances.pred_boxes.tensor[i].tolist()
-			w = x2 - x1
-			h = y2 - y1
-			bbox = [x1, y1, w, h]
+		#
+		# Aqui, em vez de um torch.where por máscara, as caixas saem das
+		# projeções das máscaras nas linhas e colunas, todas de uma vez.
+		pred_boxes = mask_boxes(instances.pred_masks)
 
-			formatted_predictions.append(Prediction(classname, confidence, mask, bbox))
+		# Cada campo é convertido de uma vez só, em vez de um
+		# .item()/.tolist() por objeto
+		classnames = [self._id_to_name(class_id) for class_id in instances.pred_classes.tolist()]
+		confidences = instances.scores.tolist()
+		bboxes = torch.cat([pred_boxes[:, :2], pred_boxes[:, 2:] - pred_boxes[:, :2]], dim=1).tolist()
+		# Só a região de cada objeto é mantida, as máscaras do tamanho
+		# da imagem são liberadas junto com as instances
+		masks = [
+			CroppedMask.from_full(mask, [x1, y1, x2 + 1, y2 + 1])
+			for mask, (x1, y1, x2, y2) in zip(instances.pred_masks, pred_boxes.int().tolist())
+		]
 
-		return formatted_predictions
+		return [Prediction(*fields) for fields in zip(classnames, confidences, masks, bboxes)]
 	
 	def _id_to_name(self, class_id):
 		# Cada modelo tem sua próprio mapeamento de ID pra nome, dependendo de
 		# onde ele foi treinado. No meu caso, os três modelos seguem a mesma
 		# numeração, a do COCO, mas achei importante deixar cada modelo com o
 		# sua própria função de conversão
-		return super().cocoid_to_classname(class_id)
\ No newline at end of file
+		return super().cocoid_to_classname(class_id)
+
+def build_cfg(score_threshold: float, input_size: InputSize) -> CfgNode:
+	"""Config of the model on CPU, with the weights from config.yaml."""
+	cfg = get_cfg()
+	cfg.merge_from_file(str(Path(config['solo']['dir'], config['solo']['config_file'])))
+	cfg.MODEL.WEIGHTS = str(Path(config['solo']['dir'], config['solo']['weights_file']))
+	cfg.MODEL.SOLOV2.SCORE_THR = score_threshold
+	cfg.MODEL.DEVICE = 'cpu'
+	# O detector_postprocess leva as caixas e máscaras de volta pro
+	# tamanho original, seja qual for o tamanho da entrada
+	cfg.INPUT.MIN_SIZE_TEST = input_size.scaled(cfg.INPUT.MIN_SIZE_TEST)
+	cfg.INPUT.MAX_SIZE_TEST = input_size.scaled(cfg.INPUT.MAX_SIZE_TEST)
+	cfg.SOLVER.IMS_PER_BATCH = 1 # helps reduce ram usage
+
+	return cfg
\ No newline at end of file
@@ -0,0 +1,90 @@
+import numpy as np
+import torch
+from detectron2.data import transforms as T
+from detectron2.engine.defaults import DefaultPredictor
+from detectron2.modeling import build_model
+from detectron2.structures import Instances
+
+from . import detectron_utils
+from .config import get_score_threshold
+from .input_size import InputSize
+from .onnx_runtime import OnnxGraph
+from .prediction import Prediction
+from .solo import Solo, build_cfg
+
+
+class SoloOnnx(Solo):
+	"""SOLOv2 running on onnxruntime instead of detectron2 (see
+	onnx_runtime.OnnxGraph). Only the network goes in the graph: the
+	matrix NMS and the masks on the image size are still computed by
+	SOLOv2's own inference(), in Python."""
+
+	def __init__(self, input_size: InputSize = None):
+		self.score_threshold = get_score_threshold('solo')
+		input_size = InputSize.from_config('solo') if input_size is None else input_size
+
+		self._cfg = build_cfg(self.score_threshold, input_size)
+		# O mesmo resize que o DefaultPredictor faz
+		self._aug = T.ResizeShortestEdge(
+			[self._cfg.INPUT.MIN_SIZE_TEST, self._cfg.INPUT.MIN_SIZE_TEST], self._cfg.INPUT.MAX_SIZE_TEST
+		)
+		# Sem carregar os pesos, só pra normalizar as imagens e pro
+		# pós-processamento, que são métodos do próprio modelo
+		self._model = build_model(self._cfg)
+		self._model.eval()
+
+		n_levels = len(self._model.instance_in_features)
+		self._output_names = (
+			[f'cate_{i}' for i in range(n_levels)] + [f'kernel_{i}' for i in range(n_levels)] + ['mask']
+		)
+		self._graph = OnnxGraph(
+			'solo-onnx',
+			{'score_threshold': self.score_threshold},
+			input_names=['images'],
+			output_names=self._output_names,
+			dynamic_axes={
+				'images': {0: 'batch_size', 2: 'height', 3: 'width'},
+				'mask': {0: 'batch_size', 2: 'mask_height', 3: 'mask_width'},
+				# As grades de cada nível têm tamanho fixo (SOLOV2.NUM_GRIDS)
+				**{name: {0: 'batch_size'} for name in self._output_names[:-1]},
+			},
+		)
+
+	def predict(self, img) -> list[Prediction]:
+		return self.predict_batch([img])[0]
+
+	def _run(self, imgs: list[np.ndarray]) -> list[Instances]:
+		# É o forward() do SOLOv2, com o meio dele no onnxruntime:
+		#   https://github.com/aim-uofa/AdelaiDet/blob/master/adet/modeling/solov2/solov2.py
+		inputs = [detectron_utils.preprocess(img, self._aug, self._cfg.INPUT.FORMAT) for img in imgs]
+		n_levels = len(self._model.instance_in_features)
+
+		with torch.no_grad():
+			images = self._model.preprocess_image(inputs)
+			outputs = self._graph.run([images.tensor], self._build_network)
+
+			cate_pred, kernel_pred, mask_pred = outputs[:n_levels], outputs[n_levels:2 * n_levels], outputs[-1]
+			results = self._model.inference(cate_pred, kernel_pred, mask_pred, images.image_sizes, inputs)
+
+		return [result['instances'] for result in results]
+
+	def _build_network(self) -> torch.nn.Module:
+		return _SoloNetwork(DefaultPredictor(self._cfg).model)
+
+class _SoloNetwork(torch.nn.Module):
+	# What gets exported: from the normalized, padded images to the
+	# category (after point NMS), kernel and mask predictions
+	def __init__(self, model: torch.nn.Module):
+		super().__init__()
+		self.model = model
+
+	def forward(self, images: torch.Tensor):
+		model = self.model
+		features = model.backbone(images)
+
+		ins_features = model.split_feats([features[f] for f in model.instance_in_features])
+		cate_pred, kernel_pred = model.ins_head(ins_features)
+		mask_pred = model.mask_head([features[f] for f in model.mask_in_features])
+
+		cate_pred = [model.point_nms(cate_p.sigmoid(), kernel=2).permute(0, 2, 3, 1) for cate_p in cate_pred]
+		return (*cate_pred, *kernel_pred, mask_pred)
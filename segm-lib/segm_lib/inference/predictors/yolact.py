@@ -1,11 +1,15 @@
 import sys
+import time
 from pathlib import Path
 
 import torch
 
+from segm_lib.core.structures import CroppedMask
+from . import quantization
 from .abstract_predictor import Predictor
+from .input_size import InputSize
 from .prediction import Prediction
-from .config import config
+from .config import config, get_score_threshold
 
 sys.path.insert(0, config['yolact']['dir'])
 from data import cfg, set_cfg
@@ -17,30 +21,83 @@ from yolact import Yolact as YolactLib
 class Yolact(Predictor):
 	# Based on:
 	# https://github.com/dbolya/yolact/issues/256#issuecomment-567371328
+	#
+	# O cfg do YOLACT é global, e o FastBaseTransform e as priors leem o
+	# max_size dele na hora de rodar, não na criação. Então cada instância
+	# guarda o seu e aplica antes de cada forward: várias escalas podem
+	# estar carregadas no mesmo processo, mas não rodando ao mesmo tempo
+	# em threads diferentes.
+
+	def __init__(self, quantize: bool = None, input_size: InputSize = None):
+		self.score_threshold = get_score_threshold('yolact')
+		quantize = quantization.is_enabled('yolact') if quantize is None else quantize
+		input_size = InputSize.from_config('yolact') if input_size is None else input_size
 
-	def __init__(self):
 		set_cfg(config['yolact']['config_name'])
 		cfg.mask_proto_debug = False
+		# O FastBaseTransform redimensiona pra cfg.max_size, e o postprocess
+		# leva as caixas e máscaras de volta pro tamanho original
+		cfg.max_size = input_size.scaled(cfg.max_size)
+		self._max_size = cfg.max_size
 
 		model = YolactLib()
-		model.load_weights(str(Path(config['yolact']['dir'], config['yolact']['weights_file'])))
+		if not (quantize and quantization.has_cached_weights('yolact')):
+			model.load_weights(str(Path(config['yolact']['dir'], config['yolact']['weights_file'])))
 		model.eval()
+		if quantize:
+			model = quantization.quantize_model(model, 'yolact')
 
 		self._model = model
+		self.quantized = quantization.is_quantized(model)
 		
 	def predict(self, img) -> list[Prediction]:
+		self._apply_input_size()
 		with torch.no_grad():
-			frame = torch.from_numpy(img).float()
+			# Copia já convertendo pra float, sem precisar que a imagem
+			# seja gravável (no modo image-major ela é compartilhada)
+			frame = torch.tensor(img, dtype=torch.float)
 			batch = FastBaseTransform()(frame.unsqueeze(0))
-			preds = self._model(batch)
+			preds = self._forward(batch)
 			# Essas predições ainda não são finais, falta converter
 			# as máscaras pro formato certo.
 		h, w, _ = img.shape
-		classes, scores, boxes, masks = postprocess(preds, w, h, score_threshold = 0.5)
-	
+		classes, scores, boxes, masks = postprocess(preds, w, h, score_threshold = self.score_threshold)
+
+		start_time = time.time()
 		formatted_predictions = self._to_custom_format(classes, scores, boxes, masks)
+		self.last_postprocess_time = time.time() - start_time
+
+		return formatted_predictions
+
+	def predict_batch(self, imgs) -> list[list[Prediction]]:
+		self._apply_input_size()
+		with torch.no_grad():
+			# O FastBaseTransform redimensiona tudo pra cfg.max_size, então
+			# imagens de tamanhos diferentes podem ir no mesmo batch.
+			frames = [torch.tensor(img, dtype=torch.float).unsqueeze(0) for img in imgs]
+			batch = torch.cat([FastBaseTransform()(frame) for frame in frames])
+			preds = self._forward(batch)
+
+		formatted_predictions = []
+		self.last_postprocess_time = 0.0
+		for i, img in enumerate(imgs):
+			h, w, _ = img.shape
+			classes, scores, boxes, masks = postprocess(preds, w, h, batch_idx = i, score_threshold = self.score_threshold)
+
+			start_time = time.time()
+			formatted_predictions.append(self._to_custom_format(classes, scores, boxes, masks))
+			self.last_postprocess_time += time.time() - start_time
+
 		return formatted_predictions
 
+	def _apply_input_size(self):
+		cfg.max_size = self._max_size
+
+	def _forward(self, batch: torch.Tensor) -> list[dict]:
+		# Network and NMS (Detect), from the transformed batch to the
+		# detections of each image, still relative to the input size
+		return self._model(batch)
+
 	def _to_custom_format(self, classes, scores, boxes, masks):
 		# Formato da saída do modelo:
 		#   https://github.com/dbolya/yolact/blob/master/layers/output_utils.py
@@ -48,23 +105,20 @@ class Yolact(Predictor):
 		# Formato esperado:
 		#   see inference_lib.predictors.base_pred
 
-		formatted_predictions = []
-		for i in range(len(masks)):
-			class_id = classes[i].item()
-			classname = self._id_to_name(class_id)
+		# Sem detecções, o postprocess retorna tensores vazios de 1 dimensão
+		if len(masks) == 0:
+			return []
 
-			confidence = scores[i].item()
+		# Cada campo é convertido de uma vez só, em vez de um
+		# .item()/.tolist() por objeto
+		classnames = [self._id_to_name(class_id) for class_id in classes.tolist()]
+		confidences = scores.tolist()
+		# Cortadas na extensão da própria máscara, e não na caixa, porque
+		# a interpolação das máscaras pode vazar um pouco pra fora dela
+		masks = CroppedMask.from_full_masks(masks.to(torch.bool))
+		bboxes = torch.cat([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]], dim=1).tolist()
 
-			mask = masks[i].to(torch.bool)
-
-			x1, y1, x2, y2 = boxes[i].tolist()
-			w = x2 - x1
-			h = y2 - y1
-			bbox = [x1, y1, w, h]
-
-			formatted_predictions.append(Prediction(classname, confidence, mask, bbox))
-
-		return formatted_predictions
+		return [Prediction(*fields) for fields in zip(classnames, confidences, masks, bboxes)]
 	
 	def _id_to_name(self, class_id):
 		# Cada modelo tem sua próprio mapeamento de ID pra nome, dependendo de
@@ -0,0 +1,70 @@
+import torch
+
+from .config import config, get_score_threshold
+from .input_size import InputSize
+from .onnx_runtime import OnnxGraph
+from .yolact import Yolact, YolactLib, cfg, set_cfg
+
+# Imported after .yolact, which puts the YOLACT dir on sys.path
+from layers import Detect
+
+# Outputs of the network that go into Detect
+OUTPUT_NAMES = ['loc', 'conf', 'mask', 'priors', 'proto']
+
+
+class YolactOnnx(Yolact):
+	"""YOLACT running on onnxruntime instead of PyTorch (see
+	onnx_runtime.OnnxGraph). Only the network goes in the graph: the
+	transform, NMS (Detect) and postprocess are the same as Yolact's."""
+
+	def __init__(self, input_size: InputSize = None):
+		self.score_threshold = get_score_threshold('yolact')
+		input_size = InputSize.from_config('yolact') if input_size is None else input_size
+		self._input_size = input_size
+
+		set_cfg(config['yolact']['config_name'])
+		cfg.mask_proto_debug = False
+		cfg.max_size = input_size.scaled(cfg.max_size)
+		# Aplicado antes de cada forward, ver Yolact
+		self._max_size = cfg.max_size
+
+		# O mesmo Detect que o modelo cria por dentro
+		self._detect = Detect(
+			cfg.num_classes,
+			bkg_label=0,
+			top_k=cfg.nms_top_k,
+			conf_thresh=cfg.nms_conf_thresh,
+			nms_thresh=cfg.nms_thresh,
+		)
+		# Toda imagem é redimensionada pra cfg.max_size, então só o
+		# tamanho do batch muda. As priors não dependem do batch, mas
+		# dependem do tamanho, então ele faz parte da chave do grafo.
+		self._graph = OnnxGraph(
+			'yolact-onnx',
+			{'score_threshold': self.score_threshold, 'max_size': cfg.max_size},
+			input_names=['batch'],
+			output_names=OUTPUT_NAMES,
+			dynamic_axes={name: {0: 'batch_size'} for name in ['batch', 'loc', 'conf', 'mask', 'proto']},
+		)
+
+	def _forward(self, batch: torch.Tensor) -> list[dict]:
+		outputs = self._graph.run([batch], self._build_network)
+		# O Detect só usa o modelo no YOLACT++ (maskiou_net)
+		return self._detect(dict(zip(OUTPUT_NAMES, outputs)), None)
+
+	def _build_network(self) -> torch.nn.Module:
+		# Same weights as Yolact's
+		network = _YolactNetwork(Yolact(quantize=False, input_size=self._input_size)._model)
+		# Criar o Yolact refaz o cfg global, no meio do forward desta
+		self._apply_input_size()
+		return network
+
+class _YolactNetwork(torch.nn.Module):
+	# What gets exported: the model up to the point it would call Detect
+	def __init__(self, model: YolactLib):
+		super().__init__()
+		self.model = model
+		self.model.detect = lambda pred_outs, net: tuple(pred_outs[name] for name in OUTPUT_NAMES)
+
+	def forward(self, batch: torch.Tensor):
+		return self.model(batch)
@@ -0,0 +1,216 @@
+import datetime
+import itertools
+import time
+from pathlib import Path
+
+from tqdm import tqdm
+
+from .img_source import ImgFiles, ImgSource, read_img
+from .latency import size_bucket
+from .predictors import Predictor
+from .sharding import ShardConfig, in_shard, sort_largest_first
+from .stats_manager import StatsManager
+from segm_lib.core.managers import SingleModelPredManager
+from segm_lib.core.structures.prediction import Prediction
+
+# Predictor class of each model loaded by load_models()
+MODEL_MAP: dict[str, type[Predictor]] = {}
+# Quantos batches são lidos adiantado pra agrupar as imagens por proporção
+BUCKETING_WINDOW_IN_BATCHES = 8
+
+def load_models(requested_models):
+	"""Imports the predictor of each model into MODEL_MAP.
+
+	Raises:
+		ValueError: if an invalid model name was given.
+		ImportError: if one of the models is not installed properly.
+	"""
+	for model_name in requested_models:
+		try:
+			import_model(model_name)
+		except ImportError as e:
+			raise ImportError(f'"{model_name}" is implemented on the library, but not installed properly.') from e
+		except ValueError:
+			raise ValueError(f'"{model_name}" is not implemented/setted up correcly. How do you expect to run that.')
+
+def import_model(model_name):
+	# Imports are conditional because you don't need
+	# to install all the models
+	match model_name:
+		case 'maskrcnn':
+			from .predictors.maskrcnn import Maskrcnn as model
+		case 'yolact':
+			from .predictors.yolact import Yolact as model
+		case 'solo':
+			from .predictors.solo import Solo as model
+		case 'maskrcnn-onnx':
+			from .predictors.maskrcnn_onnx import MaskrcnnOnnx as model
+		case 'yolact-onnx':
+			from .predictors.yolact_onnx import YolactOnnx as model
+		case 'solo-onnx':
+			from .predictors.solo_onnx import SoloOnnx as model
+		case other:
+			raise ValueError()
+
+	MODEL_MAP[model_name] = model
+
+def get_img_files(
+		img_file_or_dir: Path,
+		shard: ShardConfig = None,
+		extensions: list[str] = None,
+		recursive: bool = False
+		) -> ImgFiles:
+	"""The images to segment, see ImgSource. With a shard, only the ones
+	on it, largest first.
+
+	Raises:
+		FileNotFoundError: if no images were found.
+	"""
+	img_files = ImgSource(img_file_or_dir, extensions, recursive)
+	if img_files.is_empty():
+		raise FileNotFoundError(f'No images found on "{str(img_file_or_dir)}"')
+
+	if shard is not None:
+		img_files = [f for f in img_files if in_shard(f, shard.index, shard.n_shards)]
+		# Maiores primeiro, pras imagens lentas não ficarem todas no fim,
+		# com um worker só ainda ocupado. Ordenar precisa da lista toda,
+		# mas é só 1/N das imagens.
+		img_files = sort_largest_first(img_files)
+
+	return img_files
+
+def run_on_all_imgs(
+		model_name: str,
+		img_files: ImgFiles,
+		model_pred_manager: SingleModelPredManager,
+		stats_manager: StatsManager,
+		batch_size: int,
+		predictor: Predictor = None
+		) -> datetime.timedelta:
+	"""Runs a model on all images, in batches of similar aspect ratio, and
+	saves the predictions and stats.
+
+	Args:
+		predictor (Predictor, optional): By default, a new one from MODEL_MAP.
+
+	Returns:
+		datetime.timedelta: time spent reading and running the images.
+	"""
+	predictor = MODEL_MAP[model_name]() if predictor is None else predictor
+
+	total_time = datetime.timedelta(seconds=0)
+	with tqdm(total=len(img_files)) as progress_bar:
+		for batch in batches_by_aspect_ratio(img_files, batch_size):
+			total_time += run_batch(model_name, predictor, batch, model_pred_manager, stats_manager)
+			progress_bar.update(len(batch))
+
+	return total_time
+
+def run_batch(
+		model_name: str,
+		predictor: Predictor,
+		batch: list[tuple],
+		model_pred_manager: SingleModelPredManager,
+		stats_manager: StatsManager
+		) -> datetime.timedelta:
+	"""Runs a batch of (img_file, img, imread_time) and saves the
+	predictions and stats.
+
+	Returns:
+		datetime.timedelta: time spent reading and running the images.
+	"""
+	batch_files = [img_file for img_file, _, _ in batch]
+	batch_imgs = [img for _, img, _ in batch]
+	imread_times = [t for _, _, t in batch]
+
+	predictions_per_img, batch_time, postprocess_time = forward(predictor, batch_imgs)
+	stats_manager.add_batch_time(model_name, len(batch_imgs), datetime.timedelta(seconds=batch_time))
+
+	for img_file, img, predictions, imread_time in zip(batch_files, batch_imgs, predictions_per_img, imread_times):
+		timings = per_img_timings(imread_time, batch_time, postprocess_time, len(batch_imgs))
+		timings |= save_predictions(predictions, img_file.stem, model_pred_manager)
+		stats_manager.add_image_timings(model_name, timings, size_bucket(*img.shape[:2]))
+
+	return datetime.timedelta(seconds=(sum(imread_times) + batch_time))
+
+def batches_by_aspect_ratio(img_files: ImgFiles, batch_size: int):
+	"""Reads the images and yields them in batches of
+	(img_file, img, imread_time), grouped by aspect ratio.
+
+	Raises:
+		FileNotFoundError: if an image can't be read.
+	"""
+	# Os modelos redimensionam as imagens pra um tamanho fixo (mantendo a
+	# proporção) e completam o resto com padding. Juntar imagens com
+	# proporções parecidas no mesmo batch reduz esse padding. Pra não ter
+	# que carregar todas as imagens pra ordenar, eu ordeno só dentro de
+	# uma janela de alguns batches.
+	window_size = batch_size * BUCKETING_WINDOW_IN_BATCHES
+	img_files_iter = iter(img_files)
+
+	while True:
+		window = []
+		for img_file in itertools.islice(img_files_iter, window_size):
+			start_time = time.time()
+			img = read_img(img_file)
+			imread_time = time.time() - start_time
+
+			window.append((img_file, img, imread_time))
+		if len(window) == 0:
+			return
+
+		window.sort(key=lambda item: item[1].shape[1] / item[1].shape[0])
+
+		for batch_start in range(0, len(window), batch_size):
+			yield window[batch_start:batch_start + batch_size]
+
+def forward(predictor: Predictor, imgs: list) -> tuple[list[list], float, float]:
+	"""Runs the predictor on the images, as a batch if there's more than one.
+
+	Returns:
+		tuple[list[list], float, float]: the predictions of each image, the
+			seconds of the whole batch, and how much of that was spent on
+			postprocessing.
+	"""
+	start_time = time.time()
+	if len(imgs) == 1:
+		predictions_per_img = [predictor.predict(imgs[0])]
+	else:
+		predictions_per_img = predictor.predict_batch(imgs)
+	batch_time = time.time() - start_time
+
+	return predictions_per_img, batch_time, predictor.last_postprocess_time
+
+def per_img_timings(imread_time: float, batch_time: float, postprocess_time: float, n_imgs: int) -> dict[str, float]:
+	"""Seconds spent on each stage for one image of a batch."""
+	# Em um batch não dá pra saber quanto cada imagem levou,
+	# então divide igualmente
+	return {
+		'imread': imread_time,
+		'forward': (batch_time - postprocess_time) / n_imgs,
+		'postprocess': postprocess_time / n_imgs,
+	}
+
+def save_predictions(predictions: list, img_name: str, model_pred_manager: SingleModelPredManager) -> dict[str, float]:
+	"""Converts the predictions with compact_predictions() and saves them.
+
+	Returns:
+		dict[str, float]: seconds spent converting and saving.
+	"""
+	start_time = time.time()
+	compact_preds = compact_predictions(predictions)
+	rle_time = time.time() - start_time
+
+	start_time = time.time()
+	model_pred_manager.save(compact_preds, img_name)
+	save_time = time.time() - start_time
+
+	return {'bin_mask_to_rle': rle_time, 'save': save_time}
+
+def compact_predictions(predictions: list) -> list[Prediction]:
+	"""From the predictors' format to segm_lib's, with the masks in RLE."""
+	# Import aqui pro modo cliente (servidor de inferência) não precisar do torch
+	from segm_lib.core import mask_conversions
+
+	rles = mask_conversions.cropped_masks_to_rles([pred.mask for pred in predictions])
+	return [Prediction(pred.classname, pred.confidence, rle, pred.bbox) for pred, rle in zip(predictions, rles)]
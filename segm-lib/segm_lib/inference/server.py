@@ -0,0 +1,264 @@
+import json
+import queue
+import threading
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+import numpy as np
+
+from .img_source import read_img
+from .latency import LatencyHistogram
+from .predictors import DEFAULT_MODELS
+from .runner import MODEL_MAP, compact_predictions, forward, load_models, per_img_timings
+
+
+@dataclass
+class ServerConfig:
+	"""Settings for the inference server.
+
+	Attributes:
+		host: address to listen on. Only local clients are expected, since
+			images are sent as paths on this machine.
+		port: port to listen on.
+		max_batch_size: max number of requests to the same model that go
+			through it in a single forward pass.
+		max_wait_ms: how long the first request of a batch waits for
+			others to arrive before the batch runs anyway.
+	"""
+	host: str = '127.0.0.1'
+	port: int = 8765
+	max_batch_size: int = 4
+	max_wait_ms: float = 10.0
+
+
+class InferenceServer(ThreadingHTTPServer):
+	"""HTTP server that keeps the predictors loaded between runs.
+
+	Endpoints:
+		POST /predict, with JSON body {"model": str, "img_file": str}:
+			returns {"predictions": [segm_lib Prediction, serialized],
+			"timings": {stage: seconds}, "img_size": [height, width]}.
+		GET /health: returns {"models": [model names]}.
+		GET /metrics: returns, for each model, the current and max queue
+			depth, how many batches of each size ran, and latency
+			percentiles for each stage, in ms.
+	"""
+	daemon_threads = True
+
+	def __init__(self, models: list[str] = None, config: ServerConfig = None):
+		"""
+		Args:
+			models (list[str], optional): models to serve. By default, DEFAULT_MODELS.
+			config (ServerConfig, optional): Defaults to ServerConfig().
+
+		Raises:
+			ValueError: if an invalid model name was given.
+			ImportError: if one of the requested models is not installed properly.
+		"""
+		self.config = ServerConfig() if config is None else config
+		models = DEFAULT_MODELS if models is None else models
+
+		load_models(models)
+		self.workers = {model_name: _ModelWorker(model_name, self.config) for model_name in models}
+		self.start_time = time.time()
+
+		super().__init__((self.config.host, self.config.port), _RequestHandler)
+
+	@property
+	def url(self) -> str:
+		host, port = self.server_address[:2]
+		return f'http://{host}:{port}'
+
+	def metrics(self) -> dict:
+		return {
+			'uptime_s': time.time() - self.start_time,
+			'models': {model_name: worker.metrics() for model_name, worker in self.workers.items()},
+		}
+
+class _Request:
+	def __init__(self, img: np.ndarray, imread_time: float):
+		self.img = img
+		self.imread_time = imread_time
+		self.arrival_time = time.time()
+		self.future = Future()
+
+class _ModelWorker:
+	"""Keeps one predictor warm, and runs the requests for it in batches,
+	on its own thread."""
+
+	def __init__(self, model_name: str, config: ServerConfig):
+		self.model_name = model_name
+		self.config = config
+		self.predictor = MODEL_MAP[model_name]()
+		self.requests = queue.Queue()
+
+		self._lock = threading.Lock()
+		self._max_queue_depth = 0
+		self._n_batches_of_size = defaultdict(int)
+		self._n_errors = 0
+		self._latencies = defaultdict(LatencyHistogram)
+
+		threading.Thread(target=self._run, daemon=True).start()
+
+	def submit(self, img: np.ndarray, imread_time: float) -> Future:
+		request = _Request(img, imread_time)
+		self.requests.put(request)
+		with self._lock:
+			self._max_queue_depth = max(self._max_queue_depth, self.requests.qsize())
+		return request.future
+
+	def metrics(self) -> dict:
+		with self._lock:
+			latencies = {}
+			for stage_name, histogram in self._latencies.items():
+				summary = histogram.summary()
+				latencies[stage_name] = {k: v if k == 'count' else v * 1000 for k, v in summary.items()}
+
+			return {
+				'queue_depth': self.requests.qsize(),
+				'max_queue_depth': self._max_queue_depth,
+				'batches_by_size': {str(size): n for size, n in sorted(self._n_batches_of_size.items())},
+				'n_errors': self._n_errors,
+				'latency_ms': latencies,
+			}
+
+	def _run(self):
+		while True:
+			batch = self._next_batch()
+			try:
+				self.run_batch(batch)
+			except Exception as e:
+				with self._lock:
+					self._n_errors += len(batch)
+				for request in batch:
+					if not request.future.done():
+						request.future.set_exception(e)
+
+	def _next_batch(self) -> list[_Request]:
+		# Espera a primeira requisição pelo tempo que for, e aí junta as
+		# que chegarem até encher o batch ou dar o tempo máximo
+		batch = [self.requests.get()]
+		deadline = time.time() + self.config.max_wait_ms / 1000
+		while len(batch) < self.config.max_batch_size:
+			timeout = deadline - time.time()
+			if timeout <= 0:
+				break
+			try:
+				batch.append(self.requests.get(timeout=timeout))
+			except queue.Empty:
+				break
+
+		return batch
+
+	def run_batch(self, batch: list[_Request]):
+		start_time = time.time()
+		queue_wait_times = [start_time - request.arrival_time for request in batch]
+
+		imgs = [request.img for request in batch]
+		predictions_per_img, batch_time, postprocess_time = forward(self.predictor, imgs)
+
+		for request, predictions, queue_wait_time in zip(batch, predictions_per_img, queue_wait_times):
+			timings = per_img_timings(request.imread_time, batch_time, postprocess_time, len(batch))
+			timings['queue_wait'] = queue_wait_time
+
+			rle_start_time = time.time()
+			compact_preds = compact_predictions(predictions)
+			timings['bin_mask_to_rle'] = time.time() - rle_start_time
+
+			request.future.set_result({
+				'predictions': [pred.serializable() for pred in compact_preds],
+				'timings': timings,
+				'img_size': list(request.img.shape[:2]),
+			})
+			self._record(timings, time.time() - request.arrival_time + request.imread_time)
+
+		with self._lock:
+			self._n_batches_of_size[len(batch)] += 1
+
+	def _record(self, timings: dict[str, float], total_time: float):
+		with self._lock:
+			for stage_name, seconds in timings.items():
+				self._latencies[stage_name].add(seconds)
+			self._latencies['total'].add(total_time)
+
+class _RequestHandler(BaseHTTPRequestHandler):
+	server: InferenceServer
+
+	def do_GET(self):
+		match urlparse(self.path).path:
+			case '/health':
+				self._send_json(200, {'models': list(self.server.workers)})
+			case '/metrics':
+				self._send_json(200, self.server.metrics())
+			case other:
+				self._send_json(404, {'error': f'Unknown endpoint "{other}"'})
+
+	def do_POST(self):
+		if urlparse(self.path).path != '/predict':
+			self._send_json(404, {'error': f'Unknown endpoint "{self.path}"'})
+			return
+
+		try:
+			body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+			model_name = body['model']
+			img_file = Path(body['img_file'])
+		except (ValueError, KeyError, TypeError):
+			self._send_json(400, {'error': 'Expected a JSON body with "model" and "img_file"'})
+			return
+
+		worker = self.server.workers.get(model_name)
+		if worker is None:
+			self._send_json(400, {'error': f'Model "{model_name}" is not being served'})
+			return
+
+		# A imagem é lida aqui, na thread da conexão, pra várias
+		# serem lidas ao mesmo tempo enquanto o modelo roda
+		start_time = time.time()
+		try:
+			img = read_img(img_file)
+		except FileNotFoundError as e:
+			self._send_json(400, {'error': str(e)})
+			return
+		imread_time = time.time() - start_time
+
+		try:
+			result = worker.submit(img, imread_time).result()
+		except Exception:
+			self._send_json(500, {'error': traceback.format_exc()})
+			return
+
+		self._send_json(200, result)
+
+	def log_message(self, format, *args):
+		# Uma linha por requisição polui demais, as métricas já dizem tudo
+		pass
+
+	def _send_json(self, status: int, content: dict):
+		body = json.dumps(content).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+def serve(models: list[str] = None, config: ServerConfig = None):
+	"""Loads the models and serves requests until interrupted.
+
+	Args:
+		models (list[str], optional): models to serve. By default, DEFAULT_MODELS.
+		config (ServerConfig, optional): Defaults to ServerConfig().
+	"""
+	server = InferenceServer(models, config)
+	print(f'Serving {list(server.workers)} on {server.url}')
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
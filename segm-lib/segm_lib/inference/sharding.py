@@ -0,0 +1,78 @@
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+
+from .stats_manager import StatsManager
+
+SHARD_STATS_PATTERN = 'stats_shard-*-of-*.raw.json'
+
+
+@dataclass
+class ShardConfig:
+	"""Selects which part of the image set this run is responsible for.
+
+	Attributes:
+		index: which shard to run, in [0, n_shards).
+		n_shards: in how many shards the image set is split.
+		n_local_workers: processes used to run the shard on this machine.
+	"""
+	index: int = 0
+	n_shards: int = 1
+	n_local_workers: int = 1
+
+	@property
+	def name(self) -> str:
+		return f'shard-{self.index}-of-{self.n_shards}'
+
+def parse_shard(shard: str) -> tuple[int, int]:
+	"""Parses a shard in the "i/N" format.
+
+	Raises:
+		ValueError: if the format is invalid or i is not in [0, N).
+	"""
+	try:
+		index, n_shards = (int(x) for x in shard.split('/'))
+	except ValueError:
+		raise ValueError(f'Invalid shard "{shard}", expected "i/N"')
+
+	if n_shards < 1 or not (0 <= index < n_shards):
+		raise ValueError(f'Invalid shard "{shard}", i must be in [0, N)')
+
+	return index, n_shards
+
+def in_shard(img_file: Path, index: int, n_shards: int) -> bool:
+	"""Whether the image belongs to the given shard.
+
+	Only the file name is used, so the assignment is the same on every
+	machine no matter where the dataset is mounted, and doesn't change
+	when other images are added or removed.
+	"""
+	# hash() is randomized for each process, so it can't be used here
+	digest = hashlib.sha1(img_file.name.encode('utf-8')).digest()
+	return int.from_bytes(digest[:8], 'big') % n_shards == index
+
+def sort_largest_first(img_files: list[Path]) -> list[Path]:
+	# File size is a good enough proxy for resolution, and it's much
+	# cheaper than decoding the image to find out
+	return sorted(img_files, key=lambda f: f.stat().st_size, reverse=True)
+
+def merge_shard_stats(out_dir: Path):
+	"""Combines the stats of all shards saved on out_dir into a single
+	stats.txt.
+
+	Args:
+		out_dir (Path): directory where the shards were saved.
+
+	Raises:
+		FileNotFoundError: if no shard stats were found on out_dir.
+	"""
+	shard_files = sorted(out_dir.glob(SHARD_STATS_PATTERN))
+	if len(shard_files) == 0:
+		raise FileNotFoundError(f'No shard stats found on "{str(out_dir)}"')
+
+	merged = StatsManager()
+	for shard_file in shard_files:
+		merged.merge(StatsManager.load_raw(shard_file))
+
+	merged.save(out_dir)
+	print(f'Merged stats from {len(shard_files)} shards.')
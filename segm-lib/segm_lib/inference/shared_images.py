@@ -0,0 +1,49 @@
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+
+@dataclass
+class SharedImage:
+	"""Handle to a decoded image in shared memory. Small and picklable, so
+	it's what gets sent to the worker processes instead of the pixels.
+
+	Attributes:
+		shm_name: name of the shared memory block.
+		shape: shape of the image, e.g. (H, W, 3).
+		dtype: numpy dtype of the image, e.g. "uint8".
+	"""
+	shm_name: str
+	shape: tuple[int, ...]
+	dtype: str
+
+def share(img: np.ndarray) -> tuple[SharedMemory, SharedImage]:
+	"""Copies an image to a new shared memory block.
+
+	The caller owns the block: it must close() and unlink() it once
+	every process is done with the image.
+
+	Returns:
+		SharedMemory: the block.
+		SharedImage: handle to send to other processes.
+	"""
+	# Um bloco de tamanho zero não pode ser criado
+	shm = SharedMemory(create=True, size=max(img.nbytes, 1))
+	np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)[...] = img
+	return shm, SharedImage(shm.name, img.shape, img.dtype.str)
+
+def attach(handle: SharedImage) -> tuple[SharedMemory, np.ndarray]:
+	"""Opens an image shared by another process, without copying it.
+
+	The array is read-only, since every model reads the same pixels. It's
+	only valid while the block is open: close() it after the last use.
+
+	Returns:
+		SharedMemory: the block, to be closed.
+		np.ndarray: the image.
+	"""
+	shm = SharedMemory(name=handle.shm_name)
+	img = np.ndarray(handle.shape, dtype=np.dtype(handle.dtype), buffer=shm.buf)
+	img.flags.writeable = False
+	return shm, img
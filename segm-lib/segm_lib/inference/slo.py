@@ -0,0 +1,260 @@
+import datetime
+import json
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from tqdm import tqdm
+
+from .img_source import read_img
+from .latency import DeadlineStats, bucket_megapixels, size_bucket
+from .predictors import Predictor
+from .predictors.input_size import InputSize
+from .runner import MODEL_MAP, compact_predictions, forward, get_img_files, load_models, per_img_timings, save_predictions
+from .stats_manager import StatsManager, load_size_history
+from segm_lib.core.managers import MultiModelPredManager
+
+# From the preferred one to the fastest. "<model>@<scale>" is the model
+# running at that input scale (see InputSize).
+DEFAULT_VARIANTS = ['maskrcnn', 'maskrcnn@0.5', 'yolact']
+# Name of the directory with the final predictions
+SLO_NAME = 'slo'
+
+
+@dataclass
+class SloConfig:
+	"""Settings for running every image within a time budget.
+
+	Attributes:
+		deadline_ms: budget of each image, from when it starts being read to
+			when its predictions are saved.
+		variants: models to choose from, from the preferred one to the
+			fastest. "<model>@<scale>" runs the model at a smaller input
+			scale, e.g. "maskrcnn@0.5".
+		history_files: stats .json files (see StatsManager.save()) to learn
+			the initial latency estimates from. The stats.json of the output
+			directory, from previous runs, is always used if it exists.
+		smoothing: weight of each new measurement on the rolling estimates.
+		margin: the estimates are multiplied by this before being compared
+			with the time left, to absorb some of the variance.
+		warmup: whether each variant runs once on the first image before the
+			clock starts. Otherwise the slow first run of each model counts
+			against its image and its estimate.
+	"""
+	deadline_ms: float = 1000.0
+	variants: list[str] = field(default_factory=lambda: list(DEFAULT_VARIANTS))
+	history_files: list[Path] = field(default_factory=list)
+	smoothing: float = 0.2
+	margin: float = 1.1
+	warmup: bool = True
+
+class LatencyEstimator:
+	"""Rolling estimate of how long each variant takes on an image of each
+	size bucket (see latency.size_bucket()), not counting the image read.
+
+	Starts from the mean of the StatsManager history and follows an
+	exponential moving average of the measured times after that.
+	"""
+
+	def __init__(self, smoothing: float):
+		self.smoothing = smoothing
+		# variant -> size bucket -> seconds
+		self._estimates = {}
+
+	def seed(self, stats_file: Path):
+		"""Takes the mean time per size bucket of the runs saved on a stats
+		.json. Buckets that already have an estimate are kept."""
+		for variant, histograms in load_size_history(stats_file).items():
+			for bucket, histogram in histograms.items():
+				if histogram.n > 0:
+					self._estimates.setdefault(variant, {}).setdefault(bucket, histogram.total / histogram.n)
+
+	def estimate(self, variant: str, bucket: str) -> float | None:
+		"""Seconds the variant is expected to take on an image of that size.
+		Falls back to the closest size measured for the variant, or None if
+		it was never measured."""
+		estimates = self._estimates.get(variant)
+		if not estimates:
+			return None
+		if bucket in estimates:
+			return estimates[bucket]
+
+		megapixels = bucket_megapixels(bucket)
+		closest = min(estimates, key=lambda b: abs(bucket_megapixels(b) - megapixels))
+		# Medido só em imagens maiores: reduz pela área, pra ser otimista.
+		# Senão um modelo lento numa imagem grande nunca seria testado nas
+		# pequenas. Errando pra menos, ele roda uma vez e é corrigido.
+		closest_megapixels = bucket_megapixels(closest)
+		if closest_megapixels > megapixels:
+			return estimates[closest] * megapixels / closest_megapixels
+		return estimates[closest]
+
+	def update(self, variant: str, bucket: str, seconds: float):
+		estimates = self._estimates.setdefault(variant, {})
+		if bucket not in estimates:
+			estimates[bucket] = seconds
+		else:
+			estimates[bucket] += self.smoothing * (seconds - estimates[bucket])
+
+def choose_variant(
+		estimator: LatencyEstimator,
+		variants: list[str],
+		bucket: str,
+		time_left: float,
+		margin: float
+		) -> tuple[str, float | None]:
+	"""The first variant expected to finish within the time left. Variants
+	never measured are assumed to fit, so they get measured. If none fits,
+	the fastest one, to miss the deadline by as little as possible.
+
+	Returns:
+		str: the variant.
+		float | None: its estimate, in seconds.
+	"""
+	estimates = {variant: estimator.estimate(variant, bucket) for variant in variants}
+	for variant in variants:
+		estimate = estimates[variant]
+		if estimate is None or estimate * margin <= time_left:
+			return variant, estimate
+
+	fastest = min(variants, key=lambda v: estimates[v])
+	return fastest, estimates[fastest]
+
+def run_with_deadlines(
+		img_file_or_dir: Path,
+		out_dir: Path,
+		config: SloConfig = None,
+		extensions: list[str] = None,
+		recursive: bool = False,
+		) -> DeadlineStats:
+	"""Runs each image within a time budget: before running an image, picks
+	the first of the variants (see SloConfig) expected to finish before its
+	deadline, from latency estimates per variant and image size that are
+	learned from the StatsManager history and updated after every image.
+	Images that wouldn't make it with the preferred model go to a faster
+	one (or a downscaled one), instead of holding up the ones after them.
+
+	The images run one at a time, since the choice is made per image.
+
+	Saved on out_dir:
+		slo/: the predictions of each image, from whichever variant ran.
+		stats.txt, stats.json: see StatsManager.save(), per variant, with
+			the deadline hits and misses. The next run learns from them.
+		deadlines.json: for each image, its size bucket, the variant that
+			ran, the estimate and the measured latency (ms), and whether it
+			met the deadline.
+
+	Args:
+		img_file_or_dir (Path): images to segment, see run_inference().
+		out_dir (Path): directory to save the outputs.
+		config (SloConfig, optional): the budget and the variants. Defaults
+			to SloConfig().
+		extensions (list[str], optional): see run_inference().
+		recursive (bool, optional): see run_inference().
+
+	Returns:
+		DeadlineStats: how many images met the deadline, and on which
+			variant each one ran.
+
+	Raises:
+		ValueError: if an invalid model name or scale was given.
+		ImportError: if one of the requested models is not installed properly.
+		FileNotFoundError: if no images were found on the provided path.
+	"""
+	config = SloConfig() if config is None else config
+	variants = config.variants
+	if len(variants) == 0:
+		raise ValueError('At least one variant is needed')
+
+	load_models(list(dict.fromkeys(_parse_variant(v)[0] for v in variants)))
+	img_files = get_img_files(img_file_or_dir, extensions=extensions, recursive=recursive)
+	out_dir.mkdir(parents=True, exist_ok=True)
+
+	estimator = LatencyEstimator(config.smoothing)
+	history_files = list(config.history_files)
+	if (out_dir / 'stats.json').exists():
+		history_files.append(out_dir / 'stats.json')
+	for history_file in history_files:
+		estimator.seed(history_file)
+
+	predictors = {variant: _new_variant_predictor(variant) for variant in variants}
+	if config.warmup:
+		first_img = read_img(next(iter(img_files)))
+		for predictor in predictors.values():
+			# A conversão pra RLE também, que importa o torch na primeira vez
+			compact_predictions(predictor.predict(first_img))
+
+	print(f'Running {len(img_files)} images with a deadline of {config.deadline_ms:g} ms each, on {" -> ".join(variants)}...')
+	model_pred_manager = MultiModelPredManager(out_dir).get_manager(SLO_NAME)
+	# O warmup já foi feito acima, se era pra fazer
+	stats_manager = StatsManager(n_warmup_imgs=0) if config.warmup else StatsManager()
+	deadline_stats = DeadlineStats()
+	records = {}
+	deadline = config.deadline_ms / 1000
+	time_for_variant = {variant: 0.0 for variant in variants}
+
+	start_time = time.time()
+	for img_file in tqdm(img_files):
+		img_start_time = time.time()
+		img = read_img(img_file)
+		imread_time = time.time() - img_start_time
+		bucket = size_bucket(*img.shape[:2])
+
+		variant, estimate = choose_variant(estimator, variants, bucket, deadline - imread_time, config.margin)
+		predictions_per_img, batch_time, postprocess_time = forward(predictors[variant], [img])
+		timings = per_img_timings(imread_time, batch_time, postprocess_time, 1)
+		timings |= save_predictions(predictions_per_img[0], img_file.stem, model_pred_manager)
+		latency = time.time() - img_start_time
+
+		estimator.update(variant, bucket, latency - imread_time)
+		stats_manager.add_batch_time(variant, 1, datetime.timedelta(seconds=batch_time))
+		stats_manager.add_image_timings(variant, timings, bucket)
+		time_for_variant[variant] += latency
+
+		hit = latency <= deadline
+		deadline_stats.add(variant, hit, fallback=variant != variants[0])
+		records[img_file.stem] = {
+			'size_bucket': bucket,
+			'variant': variant,
+			'estimate_ms': None if estimate is None else estimate * 1000,
+			'latency_ms': latency * 1000,
+			'hit': hit,
+		}
+
+	stats_manager.set_n_images(len(img_files))
+	stats_manager.set_wall_clock_time(datetime.timedelta(seconds=(time.time() - start_time)))
+	for variant, seconds in time_for_variant.items():
+		stats_manager.set_time_for_model(variant, datetime.timedelta(seconds=seconds))
+	stats_manager.set_deadline_stats(deadline_stats)
+	stats_manager.save(out_dir)
+
+	with (out_dir / 'deadlines.json').open('w') as f:
+		json.dump({'config': _config_to_dict(config), 'images': records}, f, indent=4)
+
+	n_total = deadline_stats.hits + deadline_stats.misses
+	print(f'\n{deadline_stats.hits}/{n_total} images met the deadline, {deadline_stats.fallbacks} ran on a fallback variant')
+
+	return deadline_stats
+
+def _parse_variant(variant: str) -> tuple[str, float | None]:
+	# "maskrcnn@0.5" -> ("maskrcnn", 0.5)
+	model_name, _, scale = variant.partition('@')
+	if scale == '':
+		return model_name, None
+	try:
+		return model_name, float(scale)
+	except ValueError:
+		raise ValueError(f'Invalid scale on variant "{variant}"')
+
+def _new_variant_predictor(variant: str) -> Predictor:
+	model_name, scale = _parse_variant(variant)
+	if scale is None:
+		return MODEL_MAP[model_name]()
+	# Mantém o max_side do config.yaml, só muda a escala
+	input_size = InputSize.from_config(model_name.removesuffix('-onnx'))
+	return MODEL_MAP[model_name](input_size=InputSize(scale, input_size.max_side))
+
+def _config_to_dict(config: SloConfig) -> dict:
+	config_dict = asdict(config)
+	config_dict['history_files'] = [str(f) for f in config.history_files]
+	return config_dict
@@ -1,36 +1,417 @@
-from datetime import timedelta
+import json
+from collections import defaultdict
+from dataclasses import asdict
+from datetime import datetime, timedelta
 from pathlib import Path
 
+from .cache import CacheStats
+from .latency import NON_MODEL_STAGES, STAGES, DeadlineStats, LatencyHistogram, StageTimes
+
+# The first images of each model are much slower (lazy initialization,
+# memory allocation, caches...), so they're left out of the percentiles
+N_WARMUP_IMGS = 2
+
 
 class StatsManager:
-	def __init__(self):
+	def __init__(self, n_warmup_imgs: int = N_WARMUP_IMGS):
+		self.n_warmup_imgs = n_warmup_imgs
 		self.n_images = 0
 		self.time_for_model = {}
+		self.batch_times_for_model = defaultdict(list)
+		self.stage_times_for_model = {}
+		self.wall_clock_time = None
+		self.cache_stats_for_model = {}
+		self.latencies_for_model = defaultdict(lambda: defaultdict(LatencyHistogram))
+		self.n_warmup_excluded_for_model = defaultdict(lambda: 0)
+		self.peak_rss_mb_for_model = {}
+		# model -> size bucket -> histogram of the model's time per image
+		self.latencies_by_size_for_model = defaultdict(lambda: defaultdict(LatencyHistogram))
+		self.deadline_stats = None
 
 	def set_n_images(self, n: int):
 		self.n_images = n
-	
+
 	def set_time_for_model(self, model_name: str, time: timedelta):
 		self.time_for_model[model_name] = time
 
-	def save(self, out_dir: Path):
+	def set_wall_clock_time(self, time: timedelta):
+		self.wall_clock_time = time
+
+	def add_batch_time(self, model_name: str, batch_size: int, time: timedelta):
+		"""Registers the time of one forward pass.
+
+		Args:
+			model_name (str): model that ran the batch.
+			batch_size (int): number of images in the batch.
+			time (timedelta): time spent on the forward pass.
+		"""
+		self.batch_times_for_model[model_name].append((batch_size, time))
+
+	def set_stage_times(self, model_name: str, stage_times: dict[str, StageTimes]):
+		"""Registers how long each stage of the pipelined mode was busy
+		and how long it was stalled.
+
+		Args:
+			model_name (str): model the stages refer to.
+			stage_times (dict[str, StageTimes]): times for each stage.
+		"""
+		self.stage_times_for_model[model_name] = stage_times
+
+	def set_cache_stats(self, model_name: str, cache_stats: CacheStats):
+		self.cache_stats_for_model[model_name] = cache_stats
+
+	def add_image_timings(self, model_name: str, timings: dict[str, float], size_bucket: str = None):
+		"""Registers how long each stage took for one image. The first
+		n_warmup_imgs images of each model are counted, but not timed.
+
+		Args:
+			model_name (str): model that segmented the image.
+			timings (dict[str, float]): seconds spent on each stage (see
+				latency.STAGES). For images that were part of a batch, the
+				batch time divided by the number of images.
+			size_bucket (str, optional): size of the image (see
+				latency.size_bucket()). If given, the time of the stages that
+				depend on the model is also kept per size, for the latency
+				estimates of the SLO mode.
+		"""
+		if self.n_warmup_excluded_for_model[model_name] < self.n_warmup_imgs:
+			self.n_warmup_excluded_for_model[model_name] += 1
+			return
+
+		histograms = self.latencies_for_model[model_name]
+		for stage_name, seconds in timings.items():
+			histograms[stage_name].add(seconds)
+		histograms['total'].add(sum(timings.values()))
+
+		if size_bucket is not None:
+			model_time = sum(seconds for stage_name, seconds in timings.items() if stage_name not in NON_MODEL_STAGES)
+			self.latencies_by_size_for_model[model_name][size_bucket].add(model_time)
+
+	def set_peak_rss(self, model_name: str, peak_rss_mb: float):
+		self.peak_rss_mb_for_model[model_name] = peak_rss_mb
+
+	def set_deadline_stats(self, deadline_stats: DeadlineStats):
+		self.deadline_stats = deadline_stats
+
+	def merge(self, other: 'StatsManager'):
+		"""Adds the stats from another StatsManager (e.g. one filled by a
+		worker process or by another shard) to this one. Times for the
+		same model are added up, and the wall-clock time is the longest
+		of the two, since they ran at the same time."""
+		self.n_images += other.n_images
+
+		for model_name, time in other.time_for_model.items():
+			self.time_for_model[model_name] = self.time_for_model.get(model_name, timedelta(seconds=0)) + time
+
+		for model_name, batch_times in other.batch_times_for_model.items():
+			self.batch_times_for_model[model_name].extend(batch_times)
+
+		for model_name, stage_times in other.stage_times_for_model.items():
+			if model_name not in self.stage_times_for_model:
+				self.stage_times_for_model[model_name] = {}
+			for stage_name, times in stage_times.items():
+				current = self.stage_times_for_model[model_name].get(stage_name, StageTimes())
+				self.stage_times_for_model[model_name][stage_name] = StageTimes(
+					busy=current.busy + times.busy,
+					stalled=current.stalled + times.stalled,
+				)
+
+		for model_name, cache_stats in other.cache_stats_for_model.items():
+			current = self.cache_stats_for_model.get(model_name, CacheStats())
+			self.cache_stats_for_model[model_name] = CacheStats(
+				resumed=current.resumed + cache_stats.resumed,
+				duplicates=current.duplicates + cache_stats.duplicates,
+				misses=current.misses + cache_stats.misses,
+			)
+
+		for model_name, histograms in other.latencies_for_model.items():
+			for stage_name, histogram in histograms.items():
+				self.latencies_for_model[model_name][stage_name].merge(histogram)
+		for model_name, n_excluded in other.n_warmup_excluded_for_model.items():
+			self.n_warmup_excluded_for_model[model_name] += n_excluded
+		for model_name, peak_rss_mb in other.peak_rss_mb_for_model.items():
+			self.peak_rss_mb_for_model[model_name] = max(self.peak_rss_mb_for_model.get(model_name, 0.0), peak_rss_mb)
+		for model_name, histograms in other.latencies_by_size_for_model.items():
+			for bucket, histogram in histograms.items():
+				self.latencies_by_size_for_model[model_name][bucket].merge(histogram)
+		if other.deadline_stats is not None:
+			if self.deadline_stats is None:
+				self.deadline_stats = DeadlineStats()
+			self.deadline_stats.merge(other.deadline_stats)
+
+		if other.wall_clock_time is not None:
+			if self.wall_clock_time is None or other.wall_clock_time > self.wall_clock_time:
+				self.wall_clock_time = other.wall_clock_time
+
+	def save(self, out_dir: Path, name: str = 'stats'):
+		"""Saves a human-readable summary of this run to <name>.txt, and a
+		machine-readable version to <name>.json. The .txt is overwritten,
+		but the .json keeps the results of every run saved to it, along
+		with latency percentiles over all of them."""
 		out_str = self._to_out_str()
 
-		# As it is, it will simply overwrite the previous file.
-		# If you wanna combine the stats of multiple runs, you'd have
-		# to implement that yourself.
-		out_file = out_dir / 'stats.txt'
+		out_file = out_dir / f'{name}.txt'
 		with out_file.open('w') as f:
 			f.write(out_str)
 
+		self._save_json(out_dir / f'{name}.json')
+
+	def save_raw(self, out_file: Path):
+		"""Saves the stats in a format that can be loaded back with
+		load_raw(), to be merged later."""
+		with out_file.open('w') as f:
+			json.dump(self._to_raw(), f, indent=4)
+
+	@classmethod
+	def load_raw(cls, raw_file: Path) -> 'StatsManager':
+		with raw_file.open('r') as f:
+			raw = json.load(f)
+
+		return cls._from_raw(raw)
+
+	# The default pickling doesn't work because of the defaultdicts,
+	# and StatsManagers are sent back from worker processes
+	def __getstate__(self) -> dict:
+		return self._to_raw()
+
+	def __setstate__(self, raw: dict):
+		self.__dict__.update(self._from_raw(raw).__dict__)
+
+	def _to_raw(self) -> dict:
+		return {
+			'n_warmup_imgs': self.n_warmup_imgs,
+			'n_images': self.n_images,
+			'time_for_model': {m: t.total_seconds() for m, t in self.time_for_model.items()},
+			'batch_times_for_model': {
+				m: [[n, t.total_seconds()] for n, t in batch_times]
+				for m, batch_times in self.batch_times_for_model.items()
+			},
+			'stage_times_for_model': {
+				m: {
+					stage_name: {'busy': times.busy.total_seconds(), 'stalled': times.stalled.total_seconds()}
+					for stage_name, times in stage_times.items()
+				}
+				for m, stage_times in self.stage_times_for_model.items()
+			},
+			'wall_clock_time': None if self.wall_clock_time is None else self.wall_clock_time.total_seconds(),
+			'cache_stats_for_model': {m: asdict(cache_stats) for m, cache_stats in self.cache_stats_for_model.items()},
+			'latencies_for_model': self._histograms_to_dict(),
+			'n_warmup_excluded_for_model': dict(self.n_warmup_excluded_for_model),
+			'peak_rss_mb_for_model': self.peak_rss_mb_for_model,
+			'latencies_by_size_for_model': _nested_histograms_to_dict(self.latencies_by_size_for_model),
+			'deadline_stats': None if self.deadline_stats is None else asdict(self.deadline_stats),
+		}
+
+	@classmethod
+	def _from_raw(cls, raw: dict) -> 'StatsManager':
+		stats_manager = cls(raw.get('n_warmup_imgs', N_WARMUP_IMGS))
+		stats_manager.n_images = raw['n_images']
+		for model_name, seconds in raw['time_for_model'].items():
+			stats_manager.time_for_model[model_name] = timedelta(seconds=seconds)
+		for model_name, batch_times in raw['batch_times_for_model'].items():
+			stats_manager.batch_times_for_model[model_name] = [(n, timedelta(seconds=t)) for n, t in batch_times]
+		for model_name, stage_times in raw['stage_times_for_model'].items():
+			stats_manager.stage_times_for_model[model_name] = {
+				stage_name: StageTimes(busy=timedelta(seconds=times['busy']), stalled=timedelta(seconds=times['stalled']))
+				for stage_name, times in stage_times.items()
+			}
+		if raw['wall_clock_time'] is not None:
+			stats_manager.wall_clock_time = timedelta(seconds=raw['wall_clock_time'])
+		for model_name, cache_stats in raw.get('cache_stats_for_model', {}).items():
+			stats_manager.cache_stats_for_model[model_name] = CacheStats(**cache_stats)
+		for model_name, histograms in raw.get('latencies_for_model', {}).items():
+			for stage_name, histogram in histograms.items():
+				stats_manager.latencies_for_model[model_name][stage_name] = LatencyHistogram.from_dict(histogram)
+		stats_manager.n_warmup_excluded_for_model.update(raw.get('n_warmup_excluded_for_model', {}))
+		stats_manager.peak_rss_mb_for_model.update(raw.get('peak_rss_mb_for_model', {}))
+		for model_name, histograms in raw.get('latencies_by_size_for_model', {}).items():
+			for bucket, histogram in histograms.items():
+				stats_manager.latencies_by_size_for_model[model_name][bucket] = LatencyHistogram.from_dict(histogram)
+		if raw.get('deadline_stats') is not None:
+			stats_manager.deadline_stats = DeadlineStats(**raw['deadline_stats'])
+
+		return stats_manager
+
+	def _save_json(self, out_file: Path):
+		if out_file.exists():
+			with out_file.open('r') as f:
+				previous = json.load(f)
+		else:
+			previous = {'runs': [], 'histograms': {}}
+
+		all_histograms = defaultdict(lambda: defaultdict(LatencyHistogram))
+		for model_name, histograms in previous['histograms'].items():
+			for stage_name, histogram in histograms.items():
+				all_histograms[model_name][stage_name] = LatencyHistogram.from_dict(histogram)
+		for model_name, histograms in self.latencies_for_model.items():
+			for stage_name, histogram in histograms.items():
+				all_histograms[model_name][stage_name].merge(histogram)
+
+		# Same for the times per size, which the SLO mode learns from
+		all_size_histograms = defaultdict(lambda: defaultdict(LatencyHistogram))
+		for model_name, histograms in previous.get('size_histograms', {}).items():
+			for bucket, histogram in histograms.items():
+				all_size_histograms[model_name][bucket] = LatencyHistogram.from_dict(histogram)
+		for model_name, histograms in self.latencies_by_size_for_model.items():
+			for bucket, histogram in histograms.items():
+				all_size_histograms[model_name][bucket].merge(histogram)
+
+		runs = previous['runs'] + [self._run_summary()]
+		out = {
+			'runs': runs,
+			'all_runs': {
+				model_name: {stage_name: h.summary() for stage_name, h in histograms.items()}
+				for model_name, histograms in all_histograms.items()
+			},
+			'histograms': _nested_histograms_to_dict(all_histograms),
+			'size_histograms': _nested_histograms_to_dict(all_size_histograms),
+		}
+
+		with out_file.open('w') as f:
+			json.dump(out, f, indent=4)
+
+	def _run_summary(self) -> dict:
+		models = {}
+		for model_name in self.time_for_model.keys() | self.latencies_for_model.keys():
+			histograms = self.latencies_for_model.get(model_name, {})
+			n_imgs = self._n_imgs_processed(model_name)
+			total_time = self.time_for_model.get(model_name, timedelta(seconds=0)).total_seconds()
+
+			models[model_name] = {
+				'n_images': n_imgs,
+				'n_warmup_excluded': self.n_warmup_excluded_for_model.get(model_name, 0),
+				'total_time': total_time,
+				'imgs_per_second': n_imgs / total_time if total_time > 0 else 0.0,
+				'peak_rss_mb': self.peak_rss_mb_for_model.get(model_name),
+				'latency': {stage_name: h.summary() for stage_name, h in histograms.items()},
+			}
+
+		summary = {
+			'date': datetime.now().isoformat(timespec='seconds'),
+			'n_images': self.n_images,
+			'wall_clock_time': None if self.wall_clock_time is None else self.wall_clock_time.total_seconds(),
+			'models': models,
+		}
+		if self.deadline_stats is not None:
+			summary['deadlines'] = asdict(self.deadline_stats)
+
+		return summary
+
+	def _n_imgs_processed(self, model_name: str) -> int:
+		histograms = self.latencies_for_model.get(model_name, {})
+		n_timed = histograms['total'].n if 'total' in histograms else 0
+		return n_timed + self.n_warmup_excluded_for_model.get(model_name, 0)
+
+	def _histograms_to_dict(self) -> dict:
+		return _nested_histograms_to_dict(self.latencies_for_model)
+
 	def _to_out_str(self):
 		out_str = (
 			f"{self.n_images} imagens\n"
 			f"{'Modelo'.ljust(10)} {'Tempo total (s)'.ljust(20)} Tempo médio por imagem (s)\n"
 		)
 		for model_name, total_time in self.time_for_model.items():
-			average_time = total_time / self.n_images
+			average_time = total_time / self.n_images if self.n_images > 0 else timedelta(seconds=0)
 
 			out_str += f"{model_name.ljust(10)} {str(total_time).ljust(20)} {str(average_time)}\n"
 
-		return out_str
\ No newline at end of file
+		if self.wall_clock_time is not None:
+			# Quando os modelos rodam em paralelo, isso é menor que a soma
+			# dos tempos de cada modelo
+			total_model_time = sum(self.time_for_model.values(), start=timedelta(seconds=0))
+			out_str += (
+				f"\nTempo de parede total (s): {str(self.wall_clock_time)}\n"
+				f"Soma dos tempos dos modelos (s): {str(total_model_time)}\n"
+			)
+
+		if len(self.batch_times_for_model) > 0:
+			out_str += (
+				f"\n{'Modelo'.ljust(10)} {'Batches'.ljust(10)} {'Imagens por batch'.ljust(20)} "
+				f"{'Tempo médio por batch (s)'.ljust(30)} Imagens/s (forward)\n"
+			)
+		for model_name, batch_times in self.batch_times_for_model.items():
+			n_batches = len(batch_times)
+			n_imgs = sum(batch_size for batch_size, _ in batch_times)
+			forward_time = sum((t for _, t in batch_times), start=timedelta(seconds=0))
+
+			imgs_per_batch = n_imgs / n_batches
+			average_batch_time = forward_time / n_batches
+			imgs_per_second = n_imgs / forward_time.total_seconds() if forward_time.total_seconds() > 0 else 0.0
+
+			out_str += (
+				f"{model_name.ljust(10)} {str(n_batches).ljust(10)} {f'{imgs_per_batch:.2f}'.ljust(20)} "
+				f"{str(average_batch_time).ljust(30)} {imgs_per_second:.2f}\n"
+			)
+
+		if len(self.stage_times_for_model) > 0:
+			out_str += f"\n{'Modelo'.ljust(10)} {'Estágio'.ljust(10)} {'Ocupado (s)'.ljust(20)} Parado (s)\n"
+		for model_name, stage_times in self.stage_times_for_model.items():
+			for stage_name, times in stage_times.items():
+				out_str += f"{model_name.ljust(10)} {stage_name.ljust(10)} {str(times.busy).ljust(20)} {str(times.stalled)}\n"
+
+		if len(self.cache_stats_for_model) > 0:
+			out_str += f"\n{'Modelo'.ljust(10)} {'Já feitas'.ljust(10)} {'Duplicadas'.ljust(12)} {'Rodadas'.ljust(10)} Taxa de acerto\n"
+		for model_name, cache_stats in self.cache_stats_for_model.items():
+			n_hits = cache_stats.resumed + cache_stats.duplicates
+			n_total = n_hits + cache_stats.misses
+			hit_rate = n_hits / n_total if n_total > 0 else 0.0
+
+			out_str += (
+				f"{model_name.ljust(10)} {str(cache_stats.resumed).ljust(10)} {str(cache_stats.duplicates).ljust(12)} "
+				f"{str(cache_stats.misses).ljust(10)} {hit_rate:.1%}\n"
+			)
+
+		if len(self.latencies_for_model) > 0:
+			out_str += (
+				f"\nLatência por imagem (ms), sem as {self.n_warmup_imgs} primeiras de cada modelo\n"
+				f"{'Modelo'.ljust(10)} {'Estágio'.ljust(16)} {'p50'.ljust(10)} {'p90'.ljust(10)} p99\n"
+			)
+		for model_name, histograms in self.latencies_for_model.items():
+			for stage_name in STAGES + ['total']:
+				if stage_name not in histograms:
+					continue
+				summary = histograms[stage_name].summary()
+				p50, p90, p99 = (f"{summary[p] * 1000:.1f}" for p in ['p50', 'p90', 'p99'])
+				out_str += f"{model_name.ljust(10)} {stage_name.ljust(16)} {p50.ljust(10)} {p90.ljust(10)} {p99}\n"
+
+		if len(self.peak_rss_mb_for_model) > 0:
+			out_str += f"\n{'Modelo'.ljust(10)} {'Imagens/s'.ljust(10)} Pico de memória (MB)\n"
+		for model_name, peak_rss_mb in self.peak_rss_mb_for_model.items():
+			total_time = self.time_for_model.get(model_name, timedelta(seconds=0)).total_seconds()
+			imgs_per_second = self._n_imgs_processed(model_name) / total_time if total_time > 0 else 0.0
+			out_str += f"{model_name.ljust(10)} {f'{imgs_per_second:.2f}'.ljust(10)} {peak_rss_mb:.0f}\n"
+
+		if self.deadline_stats is not None:
+			deadline_stats = self.deadline_stats
+			n_total = deadline_stats.hits + deadline_stats.misses
+			hit_rate = deadline_stats.hits / n_total if n_total > 0 else 0.0
+			out_str += (
+				f"\nPrazo: {deadline_stats.hits} imagens dentro, {deadline_stats.misses} fora ({hit_rate:.1%} dentro), "
+				f"{deadline_stats.fallbacks} sem o modelo preferido\n"
+			)
+			for variant, n in deadline_stats.runs_per_variant.items():
+				out_str += f"  {variant}: {n} imagens\n"
+
+		return out_str
+
+def load_size_history(stats_file: Path) -> dict[str, dict[str, LatencyHistogram]]:
+	"""Reads the times per size bucket of every run saved to a stats .json
+	(see StatsManager.save()).
+
+	Returns:
+		dict[str, dict[str, LatencyHistogram]]: model -> size bucket -> histogram
+			of the model's time per image. Empty if the runs didn't record it.
+	"""
+	with stats_file.open('r') as f:
+		saved = json.load(f)
+
+	return {
+		model_name: {bucket: LatencyHistogram.from_dict(h) for bucket, h in histograms.items()}
+		for model_name, histograms in saved.get('size_histograms', {}).items()
+	}
+
+def _nested_histograms_to_dict(histograms_per_model: dict[str, dict[str, LatencyHistogram]]) -> dict:
+	return {
+		model_name: {key: h.to_dict() for key, h in histograms.items()}
+		for model_name, histograms in histograms_per_model.items()
+	}
\ No newline at end of file
@@ -0,0 +1,254 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from .predictors import Predictor
+from .predictors.prediction import Prediction
+
+# [x1, y1, x2, y2] region of the image, x2 and y2 exclusive
+Window = tuple[int, int, int, int]
+
+
+@dataclass
+class TileConfig:
+	"""Settings for running the models on overlapping tiles of each image,
+	instead of on the whole image at once.
+
+	Attributes:
+		tile_size: side of each tile, in pixels. Images that fit in a single
+			tile run whole.
+		overlap: pixels shared by neighbouring tiles. Objects smaller than
+			this are seen whole by at least one tile.
+		iou_threshold: objects of the same class found on two tiles are
+			merged into one if the IoU of their masks, on the region both
+			tiles see, is above this.
+		n_workers: threads segmenting tiles of the same image at the same
+			time, sharing the model. 1 runs them one after the other.
+		batch_size: number of tiles per forward pass.
+	"""
+	tile_size: int = 1024
+	overlap: int = 128
+	iou_threshold: float = 0.5
+	n_workers: int = 1
+	batch_size: int = 1
+
+class TiledPredictor(Predictor):
+	"""Runs another predictor on overlapping tiles of the image and stitches
+	the results back into predictions of the whole image.
+
+	The model only ever sees tiles, so it runs at the tile resolution (small
+	objects aren't shrunk away with the rest of the image) and its memory
+	depends on the tile size, not on the image size. The masks are kept
+	cropped to each object (see CroppedMask) while they are stitched.
+	"""
+
+	def __init__(self, predictor: Predictor, config: TileConfig):
+		"""
+		Args:
+			predictor (Predictor): model to run on each tile.
+			config (TileConfig): size of the tiles and how they are merged.
+
+		Raises:
+			ValueError: if the overlap is not smaller than the tile size.
+		"""
+		if not 0 <= config.overlap < config.tile_size:
+			raise ValueError(f'overlap must be in [0, tile_size), got {config.overlap} for tile_size {config.tile_size}')
+
+		self.predictor = predictor
+		self.config = config
+		self.score_threshold = predictor.score_threshold
+		self.quantized = predictor.quantized
+
+		self._executor = ThreadPoolExecutor(max_workers=config.n_workers) if config.n_workers > 1 else None
+
+	def predict(self, img: np.ndarray) -> list[Prediction]:
+		h, w = img.shape[:2]
+		windows = tile_windows(h, w, self.config.tile_size, self.config.overlap)
+		if len(windows) == 1:
+			predictions = self.predictor.predict(img)
+			self.last_postprocess_time = self.predictor.last_postprocess_time
+			return predictions
+
+		batches = [windows[i:i + self.config.batch_size] for i in range(0, len(windows), self.config.batch_size)]
+		run_batch = lambda batch_windows: self._run_batch(img, batch_windows)
+		if self._executor is None:
+			results = list(map(run_batch, batches))
+		else:
+			results = list(self._executor.map(run_batch, batches))
+
+		start_time = time.time()
+		predictions_per_tile = []
+		for batch_windows, (batch_predictions, _) in zip(batches, results):
+			for window, predictions in zip(batch_windows, batch_predictions):
+				predictions_per_tile.append((window, [_to_img_coords(p, window, (h, w)) for p in predictions]))
+		predictions = merge_tiles(predictions_per_tile, self.config.iou_threshold)
+
+		postprocess_time = sum(t for _, t in results)
+		self.last_postprocess_time = postprocess_time + (time.time() - start_time)
+
+		return predictions
+
+	def _run_batch(self, img: np.ndarray, windows: list[Window]) -> tuple[list[list[Prediction]], float]:
+		# Cópia só dos tiles desse batch, e não da imagem toda
+		tiles = [np.ascontiguousarray(img[y1:y2, x1:x2]) for x1, y1, x2, y2 in windows]
+		if len(tiles) == 1:
+			predictions_per_tile = [self.predictor.predict(tiles[0])]
+		else:
+			predictions_per_tile = self.predictor.predict_batch(tiles)
+		# Com várias threads, outra pode ter sobrescrito o tempo entre a
+		# chamada e aqui. É só pras estatísticas, então tanto faz.
+		return predictions_per_tile, self.predictor.last_postprocess_time
+
+def tile_windows(h: int, w: int, tile_size: int, overlap: int) -> list[Window]:
+	"""Splits an image in tiles of tile_size x tile_size (or the whole side,
+	if it's smaller), each sharing overlap pixels with the next one. The
+	last tile of each row and column is aligned to the edge of the image,
+	so it may overlap more than that.
+
+	Returns:
+		list[Window]: [x1, y1, x2, y2] of each tile, row by row.
+	"""
+	stride = tile_size - overlap
+	return [
+		(x1, y1, min(x1 + tile_size, w), min(y1 + tile_size, h))
+		for y1 in _tile_starts(h, tile_size, stride)
+		for x1 in _tile_starts(w, tile_size, stride)
+	]
+
+def merge_tiles(predictions_per_tile: list[tuple[Window, list[Prediction]]], iou_threshold: float) -> list[Prediction]:
+	"""Merges the objects found on more than one tile.
+
+	Two predictions of the same class, from different tiles, are the same
+	object if their masks have an IoU above iou_threshold on the region
+	both tiles see. The IoU is computed only there because an object cut by
+	the edge of a tile is only partially on it: the part on the overlap is
+	what both tiles agree on. The matches are transitive, so an object
+	spanning tiles that don't overlap (e.g. the first and the third row)
+	is joined through the tiles between them. Merged predictions get the
+	union of the masks and boxes, and the highest confidence.
+
+	Args:
+		predictions_per_tile (list[tuple[Window, list[Prediction]]]): the
+			window of each tile and its predictions, already on the
+			coordinates of the whole image.
+		iou_threshold (float): see TileConfig.
+
+	Returns:
+		list[Prediction]: the objects on the image, by decreasing confidence.
+	"""
+	candidates = [(pred, window) for window, predictions in predictions_per_tile for pred in predictions]
+
+	# Union-find: cada fragmento aponta pra outro do mesmo objeto, até a raiz
+	parents = list(range(len(candidates)))
+	for i, (pred_a, window_a) in enumerate(candidates):
+		for j in range(i + 1, len(candidates)):
+			pred_b, window_b = candidates[j]
+			if pred_a.classname != pred_b.classname or window_a == window_b:
+				continue
+			if _intersection(window_a, window_b) is None or not _boxes_intersect(pred_a.bbox, pred_b.bbox):
+				continue
+
+			root_a, root_b = _find_root(parents, i), _find_root(parents, j)
+			# Já juntos por outro caminho, não precisa da IoU
+			if root_a != root_b and _shared_iou(pred_a, pred_b, window_a, window_b) > iou_threshold:
+				parents[root_b] = root_a
+
+	fragments_per_object = {}
+	for i, (pred, _) in enumerate(candidates):
+		fragments_per_object.setdefault(_find_root(parents, i), []).append(pred)
+
+	merged = []
+	for fragments in fragments_per_object.values():
+		# The most confident fragment absorbs the others
+		fragments.sort(key=lambda p: p.confidence, reverse=True)
+		kept = fragments[0]
+		for pred in fragments[1:]:
+			kept.mask = _union(kept.mask, pred.mask)
+			kept.bbox = _union_bbox(kept.bbox, pred.bbox)
+		merged.append(kept)
+
+	merged.sort(key=lambda p: p.confidence, reverse=True)
+	return merged
+
+def _tile_starts(length: int, tile_size: int, stride: int) -> list[int]:
+	if length <= tile_size:
+		return [0]
+	starts = list(range(0, length - tile_size, stride))
+	starts.append(length - tile_size)
+	return starts
+
+def _find_root(parents: list[int], i: int) -> int:
+	while parents[i] != i:
+		# Encurta o caminho pras próximas buscas
+		parents[i] = parents[parents[i]]
+		i = parents[i]
+	return i
+
+def _to_img_coords(pred: Prediction, window: Window, img_size: tuple[int, int]) -> Prediction:
+	from segm_lib.core.structures import CroppedMask
+
+	x1, y1 = window[:2]
+	mask = CroppedMask(pred.mask.mask, pred.mask.x + x1, pred.mask.y + y1, img_size)
+	bbox = [pred.bbox[0] + x1, pred.bbox[1] + y1, pred.bbox[2], pred.bbox[3]]
+	return Prediction(pred.classname, pred.confidence, mask, bbox)
+
+def _shared_iou(a: Prediction, b: Prediction, window_a: Window, window_b: Window) -> float:
+	shared = _intersection(window_a, window_b)
+	if shared is None:
+		return 0.0
+	# Só a parte da região em comum que tem alguma das máscaras
+	region = _intersection(shared, _bounding(_mask_window(a.mask), _mask_window(b.mask)))
+	if region is None:
+		return 0.0
+
+	mask_a, mask_b = _crop_to(a.mask, region), _crop_to(b.mask, region)
+	union = (mask_a | mask_b).sum().item()
+	if union == 0:
+		return 0.0
+	return (mask_a & mask_b).sum().item() / union
+
+def _union(a, b):
+	from segm_lib.core.structures import CroppedMask
+
+	region = _bounding(_mask_window(a), _mask_window(b))
+	return CroppedMask(_crop_to(a, region) | _crop_to(b, region), region[0], region[1], a.img_size)
+
+def _crop_to(cropped_mask, window: Window):
+	# The mask on the window, with zeros where it has no data
+	import torch
+
+	x1, y1, x2, y2 = window
+	out = torch.zeros((y2 - y1, x2 - x1), dtype=torch.bool)
+	inside = _intersection(window, _mask_window(cropped_mask))
+	if inside is None:
+		return out
+
+	ix1, iy1, ix2, iy2 = inside
+	mx, my = cropped_mask.x, cropped_mask.y
+	out[iy1 - y1:iy2 - y1, ix1 - x1:ix2 - x1] = cropped_mask.mask[iy1 - my:iy2 - my, ix1 - mx:ix2 - mx]
+	return out
+
+def _mask_window(cropped_mask) -> Window:
+	h, w = cropped_mask.mask.shape
+	return (cropped_mask.x, cropped_mask.y, cropped_mask.x + w, cropped_mask.y + h)
+
+def _intersection(a: Window, b: Window) -> Window | None:
+	x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+	x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+	if x2 <= x1 or y2 <= y1:
+		return None
+	return (x1, y1, x2, y2)
+
+def _bounding(a: Window, b: Window) -> Window:
+	return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+def _boxes_intersect(a: list, b: list) -> bool:
+	# [x, y, w, h]; touching counts, since the boxes are floats
+	return a[0] <= b[0] + b[2] and b[0] <= a[0] + a[2] and a[1] <= b[1] + b[3] and b[1] <= a[1] + a[3]
+
+def _union_bbox(a: list, b: list) -> list:
+	x1, y1 = min(a[0], b[0]), min(a[1], b[1])
+	x2, y2 = max(a[0] + a[2], b[0] + b[2]), max(a[1] + a[3], b[1] + b[3])
+	return [x1, y1, x2 - x1, y2 - y1]
@@ -0,0 +1,24 @@
+import importlib
+
+
+def lazy_exports(package: str, exports: dict[str, str]):
+	"""Makes the names a package exports load only when first accessed,
+	so importing a package (or any of its submodules) doesn't pull in
+	torch, detectron2 and friends before they're needed. Use as:
+
+		__getattr__ = lazy_exports(__name__, {'name': '.module', ...})
+
+	Args:
+		package (str): name of the package, usually __name__.
+		exports (dict[str, str]): module each name comes from, relative
+			to the package.
+
+	Returns:
+		a module-level __getattr__ (see PEP 562).
+	"""
+	def __getattr__(name: str):
+		if name not in exports:
+			raise AttributeError(f'module {package!r} has no attribute {name!r}')
+		return getattr(importlib.import_module(exports[name], package), name)
+
+	return __getattr__
@@ -1,5 +1,6 @@
 import json
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 from segm_lib.core.managers import COCOAnnManager
@@ -9,12 +10,17 @@ EXPECTED_FILENAMES = {
 	'val': 'instances_val2017.json'
 }
 
-def class_dist(coco_ann_dir: Path, out_file: Path):
+def class_dist(coco_ann_dir: Path, out_file: Path, n_workers: int = None):
 	"""Computes the class distribution for the COCO dataset.
 
+	The files are read in streaming mode (see COCOAnnManager), each on its
+	own process, so the memory doesn't grow with their size.
+
 	Args:
 		coco_ann_dir (Path): dir where the annotation files are.
 		out_file (Path): file to save the results.
+		n_workers (int, optional): files processed at the same time.
+			Defaults to one per file.
 
 	Raises:
 		FileNotFoundError: if none of the expected files were found on coco_ann_dir.
@@ -24,16 +30,17 @@ def class_dist(coco_ann_dir: Path, out_file: Path):
 		raise FileNotFoundError(f'None of the expected files {EXPECTED_FILENAMES} '
 		                        f'were found on dir "{str(coco_ann_dir)}"')
 
-	total_class_dist = defaultdict(lambda: 0)
-	for ann_file in coco_ann_files:
-		# Só pra saber se é normal a demora, tipo o instances_train2017
-		print(f'  Processing {ann_file.name}...', end='', flush=True)
+	# Só pra saber se é normal a demora, tipo o instances_train2017
+	print(f'  Processing {", ".join(f.name for f in coco_ann_files)}...', end='', flush=True)
 
-		file_dist = COCOAnnManager(ann_file).class_distribution()
-		for classname in file_dist:
-			total_class_dist[classname] += file_dist[classname]
+	total_class_dist = defaultdict(lambda: 0)
+	n_workers = len(coco_ann_files) if n_workers is None else n_workers
+	with ProcessPoolExecutor(max_workers=n_workers) as executor:
+		for file_dist in executor.map(_file_class_dist, coco_ann_files):
+			for classname in file_dist:
+				total_class_dist[classname] += file_dist[classname]
 
-		print('done')
+	print('done')
 
 	dist_sorted_by_count = dict(sorted(total_class_dist.items(), key=lambda c: c[1], reverse=True))
 
@@ -75,4 +82,8 @@ def class_map(coco_ann_dir: Path, out_file: Path):
 
 		map_file = out_dir / f"{out_file_basename}_{map_name}{out_file_extension}"
 		with map_file.open('w') as f:
-			json.dump(map_sorted_by_id, f, indent=4)
\ No newline at end of file
+			json.dump(map_sorted_by_id, f, indent=4)
+
+def _file_class_dist(ann_file: Path) -> dict[str, int]:
+	# Runs on the workers
+	return COCOAnnManager(ann_file, streaming=True).class_distribution()
\ No newline at end of file
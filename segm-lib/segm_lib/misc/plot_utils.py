@@ -1,5 +1,6 @@
 from pathlib import Path
 
+import cv2
 from tqdm import tqdm
 
 from segm_lib.core.managers import AnnManager
@@ -30,11 +31,8 @@ def plot_annotations(ann_dir: Path, img_dir: Path, out_dir: Path, libs: list[str
 	out_dir.mkdir(parents=True, exist_ok=True)
 	print(f'Plotting annotations with libraries {requested_libs}...')
 
-	for lib_name in requested_libs:
-		print(f'\n{lib_name} lib...')
-		lib_instance = LIBRARY_MAP[lib_name]()
-
-		_plot_everything(ann_manager, img_dir, lib_instance, out_dir, 'groundtruth', lib_name)
+	plot_libs = {lib_name: LIBRARY_MAP[lib_name]() for lib_name in requested_libs}
+	_plot_everything({'groundtruth': ann_manager}, img_dir, plot_libs, out_dir)
 
 
 def plot_predictions(pred_dir: Path, img_dir: Path, out_dir: Path, libs: list[str] = None):
@@ -64,15 +62,9 @@ def plot_predictions(pred_dir: Path, img_dir: Path, out_dir: Path, libs: list[st
 	out_dir.mkdir(parents=True, exist_ok=True)
 	print(f'Plotting with libraries {requested_libs}...')
 
-	for lib_name in requested_libs:
-		print(f'\n{lib_name} lib...')
-		lib_instance = LIBRARY_MAP[lib_name]()
-
-		for model_name in model_names:
-			model_pred_manager = pred_manager.get_manager(model_name)
-			print(f'\n  {model_name}...')
-
-			_plot_everything(model_pred_manager, img_dir, lib_instance, out_dir, model_name, lib_name)
+	plot_libs = {lib_name: LIBRARY_MAP[lib_name]() for lib_name in requested_libs}
+	model_pred_managers = {model_name: pred_manager.get_manager(model_name) for model_name in model_names}
+	_plot_everything(model_pred_managers, img_dir, plot_libs, out_dir)
 
 def _load_libs(requested_libs):
 	for lib_name in requested_libs:
@@ -97,25 +89,33 @@ def _import_plot_lib(lib_name):
 	LIBRARY_MAP[lib_name] = class_ref
 
 def _plot_everything(
-		ann_or_pred_manager: AnnManager|SingleModelPredManager,
+		managers: dict[str, AnnManager|SingleModelPredManager],
 		img_dir: Path,
-		plot_lib: PlotLib,
+		plot_libs: dict[str, PlotLib],
 		out_dir: Path,
-		out_basename: str,
-		lib_name: str,
 		):
+	# Uma imagem por vez: cada imagem é lida uma vez só e usada por todas
+	# as libs e todos os modelos (managers é out_basename -> manager)
 	img_files = img_dir.glob('*.jpg')
 	n_images = sum(1 for _ in img_dir.glob('*.jpg'))
 
 	for img_file in tqdm(img_files, total=n_images):
-		anns_or_preds = ann_or_pred_manager.load(img_file.stem)
-		if len(anns_or_preds) == 0:
-			continue
-
-		plot_img_file = out_dir / img_file.stem / lib_name / f'{out_basename}.jpg'
-		plot_img_file.parent.mkdir(parents=True, exist_ok=True)
-		plot_lib.plot(anns_or_preds, img_file, plot_img_file)
-
-		masks_dir = out_dir / img_file.stem / lib_name / f'{out_basename}_masks'
-		masks_dir.mkdir(parents=True, exist_ok=True)
-		plot_lib.plot_individual_masks(anns_or_preds, img_file, masks_dir)
\ No newline at end of file
+		img = None
+		for out_basename, ann_or_pred_manager in managers.items():
+			anns_or_preds = ann_or_pred_manager.load(img_file.stem)
+			if len(anns_or_preds) == 0:
+				continue
+
+			# Só lê se tiver alguma coisa pra plotar
+			if img is None:
+				img = cv2.imread(str(img_file))
+				img.flags.writeable = False
+
+			for lib_name, plot_lib in plot_libs.items():
+				plot_img_file = out_dir / img_file.stem / lib_name / f'{out_basename}.jpg'
+				plot_img_file.parent.mkdir(parents=True, exist_ok=True)
+				plot_lib.plot(anns_or_preds, img_file, plot_img_file, img=img)
+
+				masks_dir = out_dir / img_file.stem / lib_name / f'{out_basename}_masks'
+				masks_dir.mkdir(parents=True, exist_ok=True)
+				plot_lib.plot_individual_masks(anns_or_preds, img_file, masks_dir, img=img)
\ No newline at end of file
@@ -13,11 +13,11 @@ class BinPlotLib(PlotLib):
 	def __init__(self):
 		pass
 
-	def plot(self, anns_or_preds: list[Annotation|Prediction], img_file: Path, out_file: Path):
+	def plot(self, anns_or_preds: list[Annotation|Prediction], img_file: Path, out_file: Path, img: np.ndarray = None):
 		# A bin image with all the anns/preds is not really useful to me
 		return
 
-	def plot_individual_masks(self, anns_or_preds: list[Annotation|Prediction], img_file: Path, out_dir: Path):
+	def plot_individual_masks(self, anns_or_preds: list[Annotation|Prediction], img_file: Path, out_dir: Path, img: np.ndarray = None):
 		out_dir.mkdir(parents=True, exist_ok=True)
 
 		count_per_class = defaultdict(lambda: 0)
@@ -2,13 +2,14 @@ from collections import defaultdict
 from pathlib import Path
 
 import cv2
+import numpy as np
 import torch
 from detectron2.data.catalog import Metadata
-from detectron2.structures import Boxes, Instances
-from detectron2.utils.visualizer import Visualizer, ColorMode
+from detectron2.structures import Boxes
+from detectron2.utils.visualizer import ColorMode, GenericMask, Visualizer, _create_text_labels
 
 from segm_lib.core import mask_conversions
-from segm_lib.core.structures import Annotation, Prediction
+from segm_lib.core.structures import Annotation, CroppedMask, Prediction
 from .plot_lib import PlotLib
 
 
@@ -17,7 +18,7 @@ class DetectronPlotLib(PlotLib):
 		pass
 
 	def plot(self, anns_or_preds: list[Annotation|Prediction], img_file: Path, out_file: Path,
-			colors: dict[str: [int, int, int]] = None
+			colors: dict[str: [int, int, int]] = None, img: np.ndarray = None
 			):
 		"""Plots the annotations or predictions on the image.
 
@@ -28,14 +29,15 @@ class DetectronPlotLib(PlotLib):
 				be created. If it does, it will be overriten.
 			colors (dict, optional): list of colors in RGB to use for each class. If not
 				specified, random colors will be used.
+			img (np.ndarray, optional): the image already decoded (BGR), so
+				it's not read from img_file again. It's not modified.
 		"""
 		classnames, scores, masks, boxes = [], [], [], []
 		for ann_or_pred in anns_or_preds:
 			classnames.append(ann_or_pred.classname)
 			scores.append(ann_or_pred.confidence if hasattr(ann_or_pred, 'confidence') else 1.0)
 
-			bin_mask = mask_conversions.rle_to_bin_mask(ann_or_pred.mask)
-			masks.append(bin_mask)
+			masks.append(mask_conversions.rle_to_cropped_mask(ann_or_pred.mask))
 
 			# pra essa API do Detectron precisa estar em [x1,y1,x2,y2]
 			x1, y1, w, h = ann_or_pred.bbox
@@ -55,25 +57,50 @@ class DetectronPlotLib(PlotLib):
 				colors_for_api.append(colors[classname])
 			metadata.set(thing_colors = colors_for_api)
 
-		img = cv2.imread(str(img_file))
+		if img is None:
+			img = cv2.imread(str(img_file))
 		h, w, _ = img.shape
-		instances = Instances((h, w))
-		instances.pred_classes = torch.tensor(class_ids, dtype=torch.int)
-		instances.scores = torch.tensor(scores, dtype=torch.float)
-		instances.pred_masks = torch.stack(masks) if len(masks) >= 1 else torch.tensor([])
-		instances.pred_boxes = Boxes(torch.tensor(boxes, dtype=torch.float))
-
 		if colors is None:			
 			v = Visualizer(img, metadata)
 		else:
 			v = Visualizer(img, metadata, instance_mode=ColorMode.SEGMENTATION)
-		vis_out = v.draw_instance_predictions(instances)
+
+		# Mesma coisa que o draw_instance_predictions() faz, mas sem
+		# precisar das máscaras do tamanho da imagem
+		labels = _create_text_labels(class_ids, scores, class_list)
+		if colors is None:
+			assigned_colors = None
+			alpha = 0.5
+		else:
+			assigned_colors = [v._jitter([x / 255 for x in metadata.thing_colors[c]]) for c in class_ids]
+			alpha = 0.8
+		vis_out = v.overlay_instances(
+			masks=[self._to_generic_mask(mask, h, w) for mask in masks],
+			boxes=Boxes(torch.tensor(boxes, dtype=torch.float).reshape(-1, 4)),
+			labels=labels,
+			assigned_colors=assigned_colors,
+			alpha=alpha,
+		)
 		out_img = vis_out.get_image()
 
 		out_file.parent.mkdir(parents=True, exist_ok=True)
 		cv2.imwrite(str(out_file), out_img)
 
-	def plot_individual_masks(self, anns_or_preds: list[Annotation|Prediction], img_file: Path, out_dir: Path):
+	def _to_generic_mask(self, cropped_mask: CroppedMask, h: int, w: int) -> GenericMask:
+		# O Visualizer desenha os contornos da máscara, que só dependem da
+		# região dela. Então eles são calculados ali e depois deslocados.
+		if cropped_mask.mask.numel() == 0:
+			return GenericMask([], h, w)
+
+		region_mask = GenericMask(cropped_mask.mask.numpy(), *cropped_mask.mask.shape)
+		offset = np.array([cropped_mask.x, cropped_mask.y], dtype=float)
+		polygons = [(p.reshape(-1, 2) + offset).reshape(-1) for p in region_mask.polygons]
+		return GenericMask(polygons, h, w)
+
+	def plot_individual_masks(self, anns_or_preds: list[Annotation|Prediction], img_file: Path, out_dir: Path, img: np.ndarray = None):
+		# Lida uma vez só, e não uma vez por objeto
+		if img is None:
+			img = cv2.imread(str(img_file))
 		count_per_class = defaultdict(lambda: 0)
 
 		for ann_or_pred in anns_or_preds:
@@ -82,4 +109,4 @@ class DetectronPlotLib(PlotLib):
 			out_file_name = f"{classname}_{count_per_class[classname]}.jpg"
 
 			plotted_mask_file = out_dir / f'{out_file_name}.jpg'
-			self.plot([ann_or_pred], img_file, plotted_mask_file)
\ No newline at end of file
+			self.plot([ann_or_pred], img_file, plotted_mask_file, img=img)
\ No newline at end of file
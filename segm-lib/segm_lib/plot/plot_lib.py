@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 from pathlib import Path
 
+import numpy as np
+
 from segm_lib.core.structures import Annotation, Prediction
 
 
@@ -9,7 +11,7 @@ class PlotLib(ABC):
 		pass
 
 	@abstractmethod
-	def plot(self, anns_or_preds: list[Annotation|Prediction], img_file: Path, out_file: Path):
+	def plot(self, anns_or_preds: list[Annotation|Prediction], img_file: Path, out_file: Path, img: np.ndarray = None):
 		"""Plots the annotations or predictions on the image.
 
 		Args:
@@ -18,10 +20,12 @@ class PlotLib(ABC):
 				in case of a plot on the image.
 			out_file (Path): path to the output image. If it doesn't exist, it will
 				be created. If it does, it will be overriten.
+			img (np.ndarray, optional): the image already decoded (BGR), so
+				it's not read from img_file again. It's not modified.
 		"""
 
 	@abstractmethod
-	def plot_individual_masks(self, anns_or_preds: list[Annotation|Prediction], img_file: Path, out_dir: Path):
+	def plot_individual_masks(self, anns_or_preds: list[Annotation|Prediction], img_file: Path, out_dir: Path, img: np.ndarray = None):
 		"""Plots each annotation or prediction separately.
 
 		Args:
@@ -29,4 +33,5 @@ class PlotLib(ABC):
 			img_file (Path): path to the image the annotations will be plotted on,
 				in case of a plot on the image.
 			out_dir (Path): directory where the images will be saved.
+			img (np.ndarray, optional): same as in plot().
 		"""
\ No newline at end of file
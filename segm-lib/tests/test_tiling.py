@@ -0,0 +1,73 @@
+import random
+
+import numpy as np
+import torch
+
+from segm_lib.core.structures import CroppedMask
+from segm_lib.inference.predictors import Predictor
+from segm_lib.inference.predictors.prediction import Prediction
+from segm_lib.inference.tiling import TileConfig, TiledPredictor, merge_tiles, tile_windows
+
+
+class RectanglePredictor(Predictor):
+	"""Finds the non-zero pixels of the tile as a single object, with a
+	random confidence, like a model that is more or less sure on each tile."""
+
+	def __init__(self, seed: int):
+		self._random = random.Random(seed)
+
+	def predict(self, img: np.ndarray) -> list[Prediction]:
+		bin_mask = torch.from_numpy(img[..., 0] > 0)
+		if not bin_mask.any():
+			return []
+
+		ys, xs = torch.nonzero(bin_mask, as_tuple=True)
+		x1, y1, x2, y2 = xs.min().item(), ys.min().item(), xs.max().item() + 1, ys.max().item() + 1
+		mask = CroppedMask.from_full(bin_mask, [x1, y1, x2, y2])
+		return [Prediction('person', self._random.random(), mask, [x1, y1, x2 - x1, y2 - y1])]
+
+def test_objects_larger_than_the_stride_are_merged_into_one():
+	tile_size, overlap = 117, 22
+	rng = random.Random(0)
+	for seed in range(100):
+		h, w = rng.randint(tile_size + 1, 3 * tile_size), rng.randint(tile_size + 1, 3 * tile_size)
+		# Maior que o passo entre os tiles, então aparece em tiles que não se sobrepõem
+		obj_h, obj_w = rng.randint(tile_size - overlap + 1, h), rng.randint(tile_size - overlap + 1, w)
+		x, y = rng.randint(0, w - obj_w), rng.randint(0, h - obj_h)
+		img = np.zeros((h, w, 3), dtype=np.uint8)
+		img[y:y + obj_h, x:x + obj_w] = 255
+
+		predictor = TiledPredictor(RectanglePredictor(seed), TileConfig(tile_size=tile_size, overlap=overlap))
+		predictions = predictor.predict(img)
+
+		assert len(predictions) == 1, f'seed {seed}: {[p.bbox for p in predictions]}'
+		assert predictions[0].bbox == [x, y, obj_w, obj_h]
+		assert torch.equal(predictions[0].mask.to_full(), torch.from_numpy(img[..., 0] > 0))
+
+def test_tiles_that_share_no_area_are_joined_through_the_ones_between():
+	h, w = 237, 100
+	windows = tile_windows(h, w, tile_size=117, overlap=22)
+	assert len(windows) == 3
+	# A primeira e a última linha não se sobrepõem
+	assert windows[0][3] <= windows[2][1]
+
+	full = torch.zeros((h, w), dtype=torch.bool)
+	full[30:230, 10:90] = True
+	# O tile do meio, que liga os outros dois, é o menos confiante
+	confidences = [0.9, 0.5, 0.8]
+	predictions_per_tile = []
+	for window, confidence in zip(windows, confidences):
+		x1, y1, x2, y2 = window
+		tile_mask = torch.zeros((h, w), dtype=torch.bool)
+		tile_mask[y1:y2, x1:x2] = full[y1:y2, x1:x2]
+		ys, xs = torch.nonzero(tile_mask, as_tuple=True)
+		box = [xs.min().item(), ys.min().item(), xs.max().item() + 1, ys.max().item() + 1]
+		mask = CroppedMask.from_full(tile_mask, box)
+		predictions_per_tile.append((window, [Prediction('person', confidence, mask, [box[0], box[1], box[2] - box[0], box[3] - box[1]])]))
+
+	merged = merge_tiles(predictions_per_tile, iou_threshold=0.5)
+
+	assert len(merged) == 1
+	assert merged[0].confidence == 0.9
+	assert merged[0].bbox == [10, 30, 80, 200]
+	assert torch.equal(merged[0].mask.to_full(), full)